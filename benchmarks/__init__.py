@@ -0,0 +1,5 @@
+'''
+    Benchmarks of ptop, run offline against fake clusters
+
+    $ python -m benchmarks -h
+'''
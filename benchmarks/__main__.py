@@ -0,0 +1,86 @@
+'''
+    Run the benchmarks of ptop against fake clusters
+
+    $ python -m benchmarks                           # 10, 100, 1k and 10k workers
+    $ python -m benchmarks -w 1000 --churn 0.01 -o results.json
+
+    The results are written as JSON, one entry per benchmark and cluster size,
+    durations are in seconds. A summary is printed on stderr.
+'''
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+from ptop import __version__
+
+from .components import run_workers, run_charts
+from .screen import run_frames
+from .startup import run_startup
+
+
+DEFAULT_SIZES = (10,100,1000,10000)
+
+
+def _entries(results,workers,churn):
+    return [dict([('benchmark',name),('workers',workers),('churn',churn)] + sorted(timings.items()))
+            for name,timings in sorted(results.items())]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',description='Benchmarks of ptop on fake clusters')
+    parser.add_argument('-w','--workers',dest='workers',action='append',type=int,
+                        help='Number of workers of the cluster, repeat for several sizes, default {0}'
+                             .format(' '.join(str(size) for size in DEFAULT_SIZES)))
+    parser.add_argument('--churn',dest='churn',type=float,default=0.0,
+                        help='Fraction of the workers replaced at every update, default 0')
+    parser.add_argument('--repeat',dest='repeat',type=int,default=50,
+                        help='Runs of every benchmark, default 50')
+    parser.add_argument('--frames',dest='frames',type=int,default=100,
+                        help='Frames of the GUI measured per size, 0 skips the GUI, default 100')
+    parser.add_argument('--startup',dest='startup',type=int,default=5,
+                        help='Runs of the startup benchmarks, 0 skips them, default 5')
+    parser.add_argument('--screens',dest='screens',action='store_true',
+                        help='Print the last screen of the GUI on stderr, needs pyte')
+    parser.add_argument('-o','--output',dest='output',metavar='FILE',
+                        help='File the JSON results are written to, default stdout')
+    results = parser.parse_args()
+    sizes = results.workers or DEFAULT_SIZES
+
+    entries = _entries(run_charts(results.repeat),None,None)
+    if results.startup:
+        entries.extend(_entries(run_startup(results.startup),None,None))
+    for size in sizes:
+        entries.extend(_entries(run_workers(size,results.churn,results.repeat),size,results.churn))
+        if results.frames:
+            frames = run_frames(size,results.churn,results.frames,keep_screen=results.screens)
+            for entry in _entries(frames['metrics'],size,results.churn):
+                entry['terminal_bytes'] = frames['terminal_bytes']
+                entries.append(entry)
+            if 'screen' in frames:
+                sys.stderr.write('\n'.join(frames['screen'])+'\n')
+
+    for entry in entries:
+        sys.stderr.write('{workers: >6} {benchmark: <16} median {median: >10.3f} ms   p99 {p99: >10.3f} ms\n'.format(
+                            workers = entry['workers'] if entry['workers'] is not None else '-',
+                            benchmark = entry['benchmark'],
+                            median = (entry['median'] or 0)*1000,
+                            p99 = (entry['p99'] or 0)*1000))
+
+    report = {'ptop': __version__,
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'time': time.time(),
+              'results': entries}
+    if results.output:
+        with open(results.output,'w') as output:
+            json.dump(report,output,indent=1)
+    else:
+        json.dump(report,sys.stdout,indent=1)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
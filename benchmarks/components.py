@@ -0,0 +1,159 @@
+'''
+    Timings of the steps an update of ptop goes through, each one measured on
+    its own: collecting the worker info into a snapshot, aggregating it, sorting
+    and formatting the worker table and drawing the charts
+'''
+
+import random
+import threading
+from time import perf_counter
+
+from ptop.core import WorkerSnapshot
+from ptop.interfaces.braille import BrailleChart, StackedBrailleChart
+from ptop.interfaces.table import WorkerTable
+from ptop.plugins.dask_sensor import DaskSensor
+from ptop.statistics import Statistics
+
+from .fake_client import FakeClient
+
+
+# rows of the worker table visible on a 50 lines terminal
+VISIBLE_ROWS = 20
+# size in cells of a chart on a 104*28 terminal
+CHART_WIDTH = 48
+CHART_HEIGHT = 8
+
+
+def measure(run,setup=None,repeat=50):
+    '''
+        :param run: function timed
+        :param setup: function called before every run, not timed
+        :param repeat: number of runs
+        :rtype: dict of count, min, median, p99 and max in seconds
+    '''
+    durations = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = perf_counter()
+        run()
+        durations.append(perf_counter()-start)
+    return summarize(durations)
+
+
+def summarize(durations):
+    durations = sorted(durations)
+    count = len(durations)
+    return {'count': count,
+            'min': durations[0],
+            'median': durations[count//2],
+            'p99': durations[min(int(count*0.99),count-1)],
+            'max': durations[-1]}
+
+
+def fake_sensor(client,interval=1.0):
+    '''
+        :rtype: DaskSensor polling the fake client
+    '''
+    # an asynchronous sensor does not connect on creation
+    sensor = DaskSensor(dask_address='fake',asynchronous=True,name='fake',sensorType=None,interval=interval)
+    sensor.client = client
+    return sensor
+
+
+def worker_row_format():
+    '''
+        :rtype: the row format of the GUI, without a terminal
+    '''
+    from ptop.interfaces.GUI import PtopGUI
+    sensor = fake_sensor(FakeClient(0))
+    statistics = Statistics([sensor],threading.Event(),{sensor: 1000})
+    gui = PtopGUI(statistics,statistics.stop_event,'elegant',{sensor: 1000})
+    gui.X_SCALING_FACTOR = 1.0
+    return gui.format_worker_row
+
+
+def run_workers(n_workers,churn=0.0,repeat=50,seed=0):
+    '''
+        Benchmarks depending on the number of workers
+
+        :rtype: dict of benchmark name -> timings
+    '''
+    client = FakeClient(n_workers,churn,seed=seed)
+    sensor = fake_sensor(client)
+    sensor.update()
+    table = WorkerTable(worker_row_format())
+    results = {}
+
+    def advance():
+        client.advance()
+
+    def advance_and_update():
+        client.advance()
+        sensor.update()
+
+    def advance_and_sort():
+        advance_and_update()
+        table.set_workers(sensor.workers,'memory',reverse=True)
+
+    results['sensor_update'] = measure(sensor.update,advance,repeat)
+
+    previous = {}
+    def collect():
+        previous['workers'] = sensor.workers
+        sensor.workers = WorkerSnapshot.from_worker_info(client.scheduler_info()['workers'],
+                                                         sensor._worker_index,sensor.workers)
+    results['collect'] = measure(collect,advance,repeat)
+
+    def update_keeping_previous():
+        previous['workers'] = sensor.workers
+        advance_and_update()
+
+    def aggregate():
+        sensor.num_workers()
+        sensor.num_threads()
+        sensor.available_memory()
+        sensor.used_memory()
+        sensor.cpu_usage()
+        sensor._measure_activity(previous['workers'],sensor.workers)
+    results['aggregate'] = measure(aggregate,update_keeping_previous,repeat)
+
+    results['sort'] = measure(lambda: table.set_workers(sensor.workers,'memory',reverse=True),
+                              advance_and_update,repeat)
+
+    results['format_visible'] = measure(lambda: [table[i] for i in range(min(VISIBLE_ROWS,len(table)))],
+                                        advance_and_sort,repeat)
+
+    # formatting every row, what filtering the table costs
+    results['format_all'] = measure(lambda: list(table),advance_and_sort,max(1,repeat//10))
+    return results
+
+
+def run_charts(repeat=50,seed=0):
+    '''
+        Benchmarks of the charts, which do not depend on the number of workers
+
+        :rtype: dict of benchmark name -> timings
+    '''
+    values = random.Random(seed)
+    chart = BrailleChart(CHART_WIDTH,CHART_HEIGHT)
+    chart.extend(values.random() for _ in range(chart.capacity))
+
+    def sample():
+        chart.push(values.random())
+        chart.frame()
+
+    def redraw():
+        chart.clear()
+        chart.extend(values.random() for _ in range(chart.capacity))
+        chart.frame()
+
+    stacked = StackedBrailleChart(CHART_WIDTH,CHART_HEIGHT)
+
+    def stacked_sample():
+        stacked.push((values.random()/3,values.random()/3,values.random()/3))
+        stacked.frame()
+
+    return {'chart_sample': measure(sample,None,repeat),
+            'chart_redraw': measure(redraw,None,repeat),
+            'chart_stacked_sample': measure(stacked_sample,None,repeat)}
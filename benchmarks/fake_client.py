@@ -0,0 +1,113 @@
+'''
+    Stand-in for dask.distributed.Client
+
+    Serves synthetic scheduler_info() payloads of any number of workers without
+    a scheduler, the payload of a worker has the fields of a real one so the
+    cost of walking it is representative.
+'''
+
+import random
+
+
+class FakeScheduler(object):
+    def __init__(self,client):
+        self._client = client
+
+    async def identity(self):
+        return self._client.scheduler_info()
+
+
+class FakeClient(object):
+    def __init__(self,n_workers,churn=0.0,nthreads=4,memory_limit=8*1024**3,seed=0):
+        '''
+            :param n_workers: number of workers of the cluster
+            :param churn: fraction of the workers replaced by new ones at every advance()
+            :param nthreads: threads of a worker
+            :param memory_limit: memory limit of a worker in bytes
+            :param seed: seed of the random metrics, runs with the same seed are identical
+        '''
+        self.n_workers = n_workers
+        self.churn = churn
+        self.nthreads = nthreads
+        self.memory_limit = memory_limit
+        self.id = 'fake-client'
+        self.scheduler = FakeScheduler(self)
+        self._random = random.Random(seed)
+        self._next_port = 40000
+        self.workers = {}
+        for _ in range(n_workers):
+            self._add_worker()
+
+    def _add_worker(self):
+        port = self._next_port
+        self._next_port += 1
+        address = 'tcp://10.{0}.{1}.{2}:{3}'.format(port//65536 % 256,port//256 % 256,port % 256,port)
+        self.workers[address] = {
+            'type': 'Worker',
+            'id': 'worker-{0}'.format(port),
+            'host': address[6:].rsplit(':',1)[0],
+            'resources': {},
+            'local_directory': '/tmp/dask-worker-space/worker-{0}'.format(port),
+            'name': address,
+            'nthreads': self.nthreads,
+            'memory_limit': self.memory_limit,
+            'last_seen': 0.0,
+            'services': {'dashboard': port+1},
+            'status': 'running',
+            'nanny': None,
+            'metrics': {
+                'executing': 0,
+                'in_memory': 0,
+                'ready': 0,
+                'in_flight': 0,
+                'bandwidth': {'total': 100000000,'workers': {},'types': {}},
+                'spilled_bytes': {'memory': 0,'disk': 0},
+                'cpu': 0.0,
+                'memory': 0,
+                'managed_bytes': 0,
+                'time': 0.0,
+                'host_net_io': {'read_bps': 0.0,'write_bps': 0.0},
+                'host_disk_io': {'read_bps': 0.0,'write_bps': 0.0},
+                'num_fds': 30,
+                'task_counts': {},
+            },
+        }
+        self._set_metrics(self.workers[address]['metrics'])
+
+    def _set_metrics(self,metrics):
+        rand = self._random.random
+        metrics['cpu'] = round(rand()*100*self.nthreads,1)
+        metrics['memory'] = int(rand()*self.memory_limit)
+        metrics['managed_bytes'] = int(rand()*metrics['memory'])
+        # a tenth of the workers hold spilled data
+        metrics['spilled_bytes']['disk'] = int(rand()*self.memory_limit) if rand() < 0.1 else 0
+        metrics['executing'] = int(rand()*self.nthreads)
+        metrics['in_memory'] = int(rand()*1000)
+        metrics['host_net_io']['read_bps'] = rand()*1e8
+        metrics['host_net_io']['write_bps'] = rand()*1e8
+        metrics['time'] += 1.0
+
+    def advance(self):
+        '''
+            Move the cluster one update forward, the metrics of every worker change
+            and churn*n_workers workers are replaced
+        '''
+        replaced = int(round(self.churn*self.n_workers))
+        if replaced:
+            for address in self._random.sample(sorted(self.workers),replaced):
+                del self.workers[address]
+            for _ in range(replaced):
+                self._add_worker()
+        for worker in self.workers.values():
+            self._set_metrics(worker['metrics'])
+
+    def scheduler_info(self):
+        return {'type': 'Scheduler',
+                'id': 'Scheduler-fake',
+                'address': 'tcp://10.0.0.1:8786',
+                'services': {'dashboard': 8787},
+                'started': 0.0,
+                'workers': self.workers}
+
+    def close(self):
+        pass
@@ -0,0 +1,129 @@
+'''
+    Frames of the GUI drawn off screen
+
+    The GUI runs in a child process whose terminal is a pseudo terminal, the
+    parent reads everything curses writes and, when pyte is installed, plays it
+    on an emulated screen. The child times its frames with the instruments of
+    ptop and sends their percentiles back through a pipe.
+'''
+
+import fcntl
+import json
+import os
+import pty
+import select
+import struct
+import termios
+import threading
+import traceback
+
+from ptop.utils.instrumentation import instruments
+
+# frames drawn before the measure starts, the first ones lay the form out
+WARMUP_FRAMES = 5
+FRAME_METRICS = ('gui_update','gui_charts','gui_table','gui_display')
+
+
+class _Done(Exception):
+    pass
+
+
+def _run_gui(n_workers,churn,frames,seed):
+    from ptop.interfaces.GUI import PtopGUI
+    from ptop.statistics import Statistics
+    from .components import fake_sensor
+    from .fake_client import FakeClient
+
+    client = FakeClient(n_workers,churn,seed=seed)
+    sensor = fake_sensor(client,interval=0.1)
+    statistics = Statistics([sensor],threading.Event(),{sensor: 100})
+
+    class BenchGUI(PtopGUI):
+        drawn = 0
+
+        def while_waiting(self):
+            # a new sample for every frame, as if the sensor was always ahead of the GUI
+            client.advance()
+            sensor.update()
+            statistics.record(sensor)
+            PtopGUI.while_waiting(self)
+            self.drawn += 1
+            if self.drawn == WARMUP_FRAMES:
+                instruments.enable()
+            if self.drawn == WARMUP_FRAMES+frames:
+                raise _Done()
+
+    try:
+        BenchGUI(statistics,statistics.stop_event,'elegant',{sensor: 100}).run()
+    except _Done:
+        pass
+    return instruments.summary(FRAME_METRICS)
+
+
+def run_frames(n_workers,churn=0.0,frames=100,seed=0,columns=160,lines=50,keep_screen=False):
+    '''
+        Draw frames of the GUI showing n_workers workers on an off screen terminal
+
+        :param frames: number of frames measured
+        :param columns: width of the terminal
+        :param lines: height of the terminal
+        :param keep_screen: return the last screen, needs pyte
+        :rtype: dict of metric -> timings, bytes written to the terminal per frame
+                under terminal_bytes and the screen under screen if asked for
+    '''
+    try:
+        import pyte
+    except ImportError:
+        pyte = None
+    results,writer = os.pipe()
+    pid,terminal = pty.fork()
+    if pid == 0:
+        os.close(results)
+        status = 0
+        try:
+            fcntl.ioctl(0,termios.TIOCSWINSZ,struct.pack('HHHH',lines,columns,0,0))
+            os.environ.update(TERM='xterm',LINES=str(lines),COLUMNS=str(columns))
+            message = {'metrics': _run_gui(n_workers,churn,frames,seed)}
+        except BaseException:
+            message = {'error': traceback.format_exc()}
+            status = 1
+        os.write(writer,json.dumps(message).encode())
+        os.close(writer)
+        os._exit(status)
+
+    os.close(writer)
+    screen = stream = None
+    if pyte is not None:
+        screen = pyte.Screen(columns,lines)
+        stream = pyte.ByteStream(screen)
+    written = 0
+    received = []
+    sources = [terminal,results]
+    while sources:
+        for source in select.select(sources,[],[])[0]:
+            try:
+                data = os.read(source,1 << 16)
+            except OSError:
+                # the terminal is gone with the child
+                data = b''
+            if not data:
+                sources.remove(source)
+            elif source == terminal:
+                written += len(data)
+                if stream is not None:
+                    stream.feed(data)
+            else:
+                received.append(data)
+    os.close(terminal)
+    os.close(results)
+    os.waitpid(pid,0)
+
+    message = json.loads(b''.join(received).decode() or '{"error": "the GUI exited without results"}')
+    if 'error' in message:
+        raise RuntimeError('Drawing the GUI failed\n'+message['error'])
+    metrics = dict((name,{'count': stats['count'],'median': stats['p50'],'p99': stats['p99'],'max': stats['max']})
+                   for name,stats in message['metrics'].items())
+    output = {'metrics': metrics,'terminal_bytes': written/float(WARMUP_FRAMES+frames)}
+    if keep_screen and screen is not None:
+        output['screen'] = list(screen.display)
+    return output
@@ -0,0 +1,80 @@
+'''
+    Startup time of the ptop command, measured on fresh interpreters
+
+        startup_interpreter  python doing nothing, the floor of the others
+        startup_version      ptop --version
+        startup_first_frame  until the interface is drawn, against a scheduler
+                             which accepts the connection and never answers
+'''
+
+import os
+import pty
+import select
+import signal
+import socket
+import subprocess
+import sys
+from time import perf_counter
+
+from .components import summarize
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PTOP = 'from ptop.main import main; main()'
+
+
+def _environment():
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join([ROOT] + [path for path in [environment.get('PYTHONPATH')] if path])
+    return environment
+
+
+def _command(arguments):
+    start = perf_counter()
+    subprocess.check_call([sys.executable] + arguments,stdout=subprocess.DEVNULL,env=_environment())
+    return perf_counter()-start
+
+
+def _first_frame(address,timeout=30.0,columns=120,lines=40):
+    start = perf_counter()
+    pid,terminal = pty.fork()
+    if pid == 0:
+        import fcntl, struct, termios
+        fcntl.ioctl(0,termios.TIOCSWINSZ,struct.pack('HHHH',lines,columns,0,0))
+        environment = _environment()
+        environment.update(TERM='xterm',LINES=str(lines),COLUMNS=str(columns))
+        os.execve(sys.executable,[sys.executable,'-c',PTOP,'-a',address],environment)
+    output = b''
+    try:
+        while perf_counter()-start < timeout:
+            if select.select([terminal],[],[],0.1)[0]:
+                try:
+                    output += os.read(terminal,1 << 16)
+                except OSError:
+                    break
+                # the last widget of the form, the skeleton is complete
+                if b'^Q:Quit' in output:
+                    return perf_counter()-start
+        raise RuntimeError('ptop did not draw its interface within {0} s'.format(timeout))
+    finally:
+        os.kill(pid,signal.SIGKILL)
+        os.waitpid(pid,0)
+        os.close(terminal)
+
+
+def run_startup(repeat=5):
+    '''
+        :rtype: dict of benchmark name -> timings
+    '''
+    # a scheduler which never answers, the interface may not wait for it
+    silent = socket.socket()
+    silent.bind(('127.0.0.1',0))
+    silent.listen(16)
+    address = 'tcp://127.0.0.1:{0}'.format(silent.getsockname()[1])
+    try:
+        return {'startup_interpreter': summarize([_command(['-c','pass']) for _ in range(repeat)]),
+                'startup_version': summarize([_command(['-c',PTOP,'--version']) for _ in range(repeat)]),
+                'startup_first_frame': summarize([_first_frame(address) for _ in range(repeat)])}
+    finally:
+        silent.close()
+
@@ -1,15 +1,131 @@
-from dask.distributed import Client
-import dask.array as da
-from time import sleep
+'''
+    Load generator for trying ptop against a real scheduler
 
-def sqrt(x):
-    return x**0.5
+    Starts a LocalCluster, or connects to a running scheduler, and keeps it busy
+    with one of the load profiles until interrupted or for --duration seconds:
+
+        steady     batches of short tasks at a constant pace
+        bursty     storms of tiny tasks separated by idle periods
+        spill      more data held than the memory limits, the workers spill to disk
+        churn      steady load while workers join and leave the cluster
+        straggler  steady load with long tasks pinned to a single worker
+
+    --scale multiplies the number of tasks and the amount of data of every
+    profile, runs with the same --seed submit the same work.
+
+    $ python everlasting_dask_cluster.py --profile spill --workers 4
+    $ ptop -a <printed address>
+'''
+
+import argparse
+import os
+import random
+import sys
+from time import sleep, time
+
+from dask.distributed import Client, LocalCluster, wait
+
+
+PROFILES = ('steady','bursty','spill','churn','straggler')
+
+
+def inc(x,delay=0.0):
+    if delay:
+        sleep(delay)
+    return x+1
+
+def blob(i,nbytes):
+    # random bytes, compression does not make them smaller in memory or spilled
+    return os.urandom(nbytes)
+
+def size(data):
+    return len(data)
+
+
+def steady(client,cluster,scale,rng):
+    futures = client.map(inc,range(int(200*scale)),delay=0.01,pure=False)
+    client.gather(futures)
+    sleep(1)
+
+def bursty(client,cluster,scale,rng):
+    futures = client.map(inc,range(int(20000*scale)),pure=False)
+    wait(futures)
+    del futures
+    sleep(rng.uniform(5,10))
+
+def spill(client,cluster,scale,rng):
+    workers = client.scheduler_info()['workers'].values()
+    limit = sum(worker['memory_limit'] or 0 for worker in workers) or 2*1024**3
+    chunk = 16*1024**2
+    # a half more than the workers can hold, kept long enough to be spilled
+    held = client.map(blob,range(int(1.5*limit*scale/chunk)),nbytes=chunk,pure=False)
+    wait(held)
+    client.gather(client.map(size,held,pure=False))
+    sleep(rng.uniform(5,10))
+    del held
+    sleep(2)
+
+def churn(client,cluster,scale,rng):
+    if cluster is None:
+        raise SystemExit('the churn profile needs the local cluster, it cannot run with --address')
+    if not hasattr(churn,'workers'):
+        churn.workers = len(cluster.workers)
+    cluster.scale(rng.randint(max(1,churn.workers//2),2*churn.workers))
+    for _ in range(rng.randint(2,5)):
+        steady(client,cluster,scale,rng)
+
+def straggler(client,cluster,scale,rng):
+    workers = sorted(client.scheduler_info()['workers'])
+    slow = client.map(inc,range(int(4*scale) or 1),delay=3.0,workers=[workers[0]],allow_other_workers=False,pure=False)
+    fast = client.map(inc,range(int(200*scale)),delay=0.01,pure=False)
+    client.gather(fast+slow)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Keep a dask cluster busy with a load profile')
+    parser.add_argument('-p','--profile',choices=PROFILES,default='steady',
+                        help='Load profile, default steady')
+    parser.add_argument('-s','--scale',type=float,default=1.0,
+                        help='Factor of the number of tasks and of the data of the profile, default 1')
+    parser.add_argument('-w','--workers',type=int,default=2,
+                        help='Workers of the local cluster, default 2')
+    parser.add_argument('--threads',type=int,default=1,
+                        help='Threads of a worker, default 1')
+    parser.add_argument('--memory-limit',default='512mb',
+                        help='Memory limit of a worker, default 512mb')
+    parser.add_argument('--dashboard-address',default=':8787',
+                        help='Address of the dashboard, default :8787')
+    parser.add_argument('-a','--address',
+                        help='Load a running scheduler instead of starting a local cluster')
+    parser.add_argument('-d','--duration',type=float,
+                        help='Seconds the load runs for, default until interrupted')
+    parser.add_argument('--seed',type=int,default=0,
+                        help='Seed of the random choices of the profile, default 0')
+    args = parser.parse_args()
+
+    cluster = None
+    if args.address:
+        client = Client(args.address)
+    else:
+        cluster = LocalCluster(n_workers=args.workers,threads_per_worker=args.threads,
+                               memory_limit=args.memory_limit,
+                               dashboard_address=args.dashboard_address)
+        client = Client(cluster)
+    print(client.scheduler.address)
+    sys.stdout.flush()
+
+    profile = globals()[args.profile]
+    rng = random.Random(args.seed)
+    start = time()
+    try:
+        while args.duration is None or time()-start < args.duration:
+            profile(client,cluster,args.scale,rng)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
+        if cluster is not None:
+            cluster.close()
 
 if __name__ == '__main__':
-    client = Client(n_workers=2, nthreads=1, memory_limit='512mb', dashboard_address=8787) 
-    print(client.scheduler_info())
-    sleep(3)
-    while True:
-        x = client.scatter(da.random.random((1000,1000), chunks=(50,50)))
-        _ =client.submit(sqrt, x).result().compute() 
-        sleep(3)
+    main()
@@ -1,15 +1,50 @@
-import npyscreen
-
-
+# theme -> name of the npyscreen theme class, resolved by the GUI so that
+# npyscreen is not imported when running headless
 SUPPORTED_THEMES = {
-    'elegant'      : npyscreen.Themes.ElegantTheme,
-    'colorful'     : npyscreen.Themes.ColorfulTheme,
-    'simple'       : npyscreen.Themes.DefaultTheme,
-    'dark'         : npyscreen.Themes.TransparentThemeDarkText,
-    'light'        : npyscreen.Themes.TransparentThemeLightText,
-    'blackonwhite' : npyscreen.Themes.BlackOnWhiteTheme
+    'elegant'      : 'ElegantTheme',
+    'colorful'     : 'ColorfulTheme',
+    'simple'       : 'DefaultTheme',
+    'dark'         : 'TransparentThemeDarkText',
+    'light'        : 'TransparentThemeLightText',
+    'blackonwhite' : 'BlackOnWhiteTheme'
 }
 
+# cluster wide metrics, name -> path inside the sensor currentValue
+CLUSTER_METRICS = (
+    ('cpu_usage',           ('CPU','cpu_usage')),
+    ('used_memory',         ('Memory','used_memory')),
+    ('total_memory',        ('Memory','total_memory')),
+    ('used_memory_percent', ('Memory','used_memory_percent')),
+    ('managed_memory',      ('Memory','managed_memory')),
+    ('unmanaged_memory',    ('Memory','unmanaged_memory')),
+    ('spilled_memory',      ('Memory','spilled_memory')),
+    ('managed_memory_percent',   ('Memory','managed_memory_percent')),
+    ('unmanaged_memory_percent', ('Memory','unmanaged_memory_percent')),
+    ('spilled_memory_percent',   ('Memory','spilled_memory_percent')),
+    ('spill_rate',          ('Memory','spill_rate')),
+    ('unspill_rate',        ('Memory','unspill_rate')),
+    ('net_read_rate',       ('Bandwidth','net_read_rate')),
+    ('net_write_rate',      ('Bandwidth','net_write_rate')),
+    ('disk_read_rate',      ('Bandwidth','disk_read_rate')),
+    ('disk_write_rate',     ('Bandwidth','disk_write_rate')),
+    ('transfer_in_rate',    ('Bandwidth','transfer_in_rate')),
+    ('transfer_out_rate',   ('Bandwidth','transfer_out_rate')),
+    ('n_workers',           ('Cluster','n_workers')),
+    ('n_paused',            ('Cluster','n_paused')),
+    ('total_threads',       ('Cluster','total_threads')),
+    ('tasks_executing',     ('Cluster','tasks_executing')),
+    ('tasks_ready',         ('Cluster','tasks_ready')),
+    ('load_cv',             ('Imbalance','load_cv')),
+    ('load_max_median',     ('Imbalance','load_max_median')),
+    ('processing_cv',       ('Imbalance','processing_cv')),
+    ('processing_max_median', ('Imbalance','processing_max_median')),
+    ('n_stragglers',        ('Imbalance','n_stragglers')),
+)
+
+# worker columns the scheduler can rank the workers by when aggregating
+AGGREGATE_KEYS = ('memory','cpu','nthreads','memory_limit','read','write','managed','unmanaged','spilled','load',
+                  'processing')
+
 PRIVELAGED_USERS = [
     'root',
     'administrator'
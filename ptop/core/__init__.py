@@ -1,2 +1,2 @@
 from .plugin import Plugin
-
+from .snapshot import WorkerIndex, WorkerRecord, WorkerSnapshot
@@ -8,7 +8,7 @@ class Plugin(object):
     ''' 
         Base Plugin class
     '''
-    def __init__(self,name,sensorType,interval):
+    def __init__(self,name,sensorType,interval,min_interval=None,max_interval=None):
         '''creates an instance of the class
 
         Initialize the instance of a Plugin class.
@@ -16,12 +16,16 @@ class Plugin(object):
         :param name: Name of the plugin
         :param sensorType: How to render the plugin on the screen
         :param interval: The interval after which to update the stats
+        :param min_interval: Shortest interval the collector may tighten to, interval if None
+        :param max_interval: Longest interval the collector may back off to, interval if None
         :type sensorType: Chart or Table
         :rtype: Instance of Plugin class
         '''
         self.name = name
         self.type = sensorType
         self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
         self.currentValue = {}
 
     def update(self):
@@ -31,6 +35,15 @@ class Plugin(object):
         '''
         # to be overrided by the child class
 
+    def activity(self):
+        '''how fast the values changed during the last update, 0 when nothing
+        changed. The collector polls faster while it is high and backs off while
+        it is low.
+
+        :rtype: float, None when the plugin has no opinion
+        '''
+        return None
+
     @property
     def text_info(self):
         '''return the text part of the currentValue
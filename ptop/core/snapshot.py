@@ -0,0 +1,278 @@
+'''
+    ptop.core.snapshot
+
+    Columnar snapshot of the workers of a cluster. Every stat is a numpy column,
+    rows are the workers and every worker keeps a stable index across snapshots.
+    A WorkerRecord is a slotted view on a single row.
+'''
+
+import numpy as np
+
+
+MB = 1024**2
+
+
+def _spilled(metrics):
+    '''
+        (size in memory, size on disk) of the data spilled by a worker, older
+        schedulers call it spilled_nbytes
+    '''
+    spilled = metrics.get('spilled_bytes') or metrics.get('spilled_nbytes')
+    if not spilled:
+        return 0,0
+    return spilled.get('memory',0),spilled.get('disk',0)
+
+
+def _managed(metrics):
+    '''
+        bytes of data held in memory by a worker, managed_bytes counts the spilled data as well
+    '''
+    return max(metrics.get('managed_bytes',0)-_spilled(metrics)[0],0)
+
+
+def _net_io(metrics,direction):
+    '''
+        bytes per second received (read) or sent (write) by the host of a worker,
+        older workers send them as read_bytes and write_bytes
+    '''
+    net_io = metrics.get('host_net_io')
+    if net_io is None:
+        return metrics.get(direction+'_bytes',0)
+    return net_io.get(direction+'_bps',0)
+
+
+def _task_count(metrics,state):
+    counts = metrics.get('task_counts')
+    if counts is None:
+        return metrics.get(state,0)
+    return counts.get(state,0)
+
+
+# column -> function extracting it from an entry of scheduler_info()['workers']
+COLUMNS = (
+    ('nthreads',     lambda info: info['nthreads']),
+    ('memory',       lambda info: info['metrics']['memory']),
+    ('memory_limit', lambda info: info['memory_limit'] or 0),
+    ('cpu',          lambda info: info['metrics']['cpu']),
+    ('read',         lambda info: _net_io(info['metrics'],'read')),
+    ('write',        lambda info: _net_io(info['metrics'],'write')),
+    # memory held by the worker, the rest of the process memory is unmanaged
+    ('managed',      lambda info: _managed(info['metrics'])),
+    ('spilled',      lambda info: _spilled(info['metrics'])[1]),
+    ('paused',       lambda info: info.get('status') == 'paused'),
+    # tasks running and waiting for a thread on the worker, older workers send them as metrics
+    ('executing',    lambda info: _task_count(info['metrics'],'executing')),
+    ('ready',        lambda info: _task_count(info['metrics'],'ready')),
+    # time of the heartbeat the metrics come from, 0 if the scheduler does not send it
+    ('heartbeat',    lambda info: info['metrics'].get('time',0)),
+    ('disk_read',    lambda info: info['metrics'].get('host_disk_io',{}).get('read_bps',0)),
+    ('disk_write',   lambda info: info['metrics'].get('host_disk_io',{}).get('write_bps',0)),
+    # number of transfers since the worker started
+    ('transfers_in', lambda info: info['metrics'].get('transfer',{}).get('incoming_count_total',0)),
+    ('transfers_out',lambda info: info['metrics'].get('transfer',{}).get('outgoing_count_total',0)),
+    # seconds of work and number of tasks the scheduler assigned to the worker, 0 if it does not say
+    ('occupancy',    lambda info: info.get('occupancy',0)),
+    ('processing',   lambda info: info.get('processing',0)),
+)
+
+# column -> function computing it from the extracted columns
+DERIVED_COLUMNS = (
+    ('unmanaged',    lambda columns: np.maximum(columns['memory']-columns['managed'],0)),
+    # seconds of work assigned per thread
+    ('load',         lambda columns: columns['occupancy']/np.maximum(columns['nthreads'],1)),
+)
+
+# column -> (column it is the rate of, sign), per second between two snapshots, see WorkerSnapshot.measure_rates
+RATE_COLUMNS = (
+    ('spill_rate',   ('spilled',1)),
+    ('unspill_rate', ('spilled',-1)),
+)
+
+# column -> (column it is computed from, kind), smoothed by ptop.statistics.rates.RateEngine
+#   rate     the column is already per second
+#   counter  the column only grows, its change per second is smoothed
+SMOOTHED_COLUMNS = (
+    ('net_read_rate',     ('read','rate')),
+    ('net_write_rate',    ('write','rate')),
+    ('disk_read_rate',    ('disk_read','rate')),
+    ('disk_write_rate',   ('disk_write','rate')),
+    ('transfer_in_rate',  ('transfers_in','counter')),
+    ('transfer_out_rate', ('transfers_out','counter')),
+)
+
+# columns filled by ptop.statistics.imbalance.ImbalanceTracker, the smoothed robust z-score of the load of a worker
+IMBALANCE_COLUMNS = ('straggler_score',)
+
+# every column of a snapshot
+COLUMN_NAMES = (tuple(name for name,_ in COLUMNS) + tuple(name for name,_ in DERIVED_COLUMNS) +
+                tuple(name for name,_ in RATE_COLUMNS) + tuple(name for name,_ in SMOOTHED_COLUMNS) +
+                IMBALANCE_COLUMNS)
+
+# columns holding bytes, shown in MB
+BYTE_COLUMNS = ('memory','memory_limit','read','write','managed','unmanaged','spilled','spill_rate','unspill_rate',
+                'disk_read','disk_write','net_read_rate','net_write_rate','disk_read_rate','disk_write_rate')
+
+
+class WorkerIndex(object):
+    '''
+        Stable index of the workers, the index of a worker which left is reused
+    '''
+    def __init__(self):
+        self._indexes = {}
+        self._free = []
+
+    def __call__(self,address):
+        index = self._indexes.get(address)
+        if index is None:
+            index = self._free.pop() if self._free else len(self._indexes)
+            self._indexes[address] = index
+        return index
+
+    def retain(self,addresses):
+        '''
+            Release the index of every worker not in addresses
+        '''
+        addresses = set(addresses)
+        for address in [a for a in self._indexes if a not in addresses]:
+            self._free.append(self._indexes.pop(address))
+
+
+class WorkerRecord(object):
+    '''
+        View on one worker of a snapshot, the stats are read from the columns
+        and shown with the units of the workers table
+    '''
+    __slots__ = ('snapshot','row')
+
+    def __init__(self,snapshot,row):
+        self.snapshot = snapshot
+        self.row = row
+
+    @property
+    def address(self):
+        return self.snapshot.addresses[self.row]
+
+    def __getitem__(self,key):
+        if key == 'address':
+            return self.address
+        value = self.snapshot.columns[key][self.row]
+        if key in BYTE_COLUMNS:
+            return round(value/MB,2)
+        if key == 'nthreads':
+            return int(value)
+        return value
+
+    def get(self,key,default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+class WorkerSnapshot(object):
+    def __init__(self,addresses,columns,index,layout=0):
+        '''
+            :param addresses: address of every row
+            :param columns: dict of column name -> numpy array with a value per row
+            :param index: stable index of every row
+            :param layout: changes whenever the rows are not the same workers in the same order
+        '''
+        self.addresses = addresses
+        self.columns = columns
+        self.index = index
+        self.layout = layout
+
+    @classmethod
+    def empty(cls):
+        return cls([],dict((name,np.zeros(0)) for name in COLUMN_NAMES),np.zeros(0,dtype=np.int64))
+
+    @classmethod
+    def from_worker_info(cls,worker_info,worker_index,previous=None):
+        '''
+            Build a snapshot out of scheduler_info()['workers']
+
+            :param worker_info: dict of address -> worker info
+            :param worker_index: WorkerIndex giving the stable index of the workers
+            :param previous: previous snapshot, its layout is kept if the workers did not change
+        '''
+        addresses = list(worker_info)
+        infos = list(worker_info.values())
+        n = len(infos)
+        columns = dict((name,np.fromiter((extract(info) for info in infos),np.float64,n))
+                       for name,extract in COLUMNS)
+        for name,derive in DERIVED_COLUMNS:
+            columns[name] = derive(columns)
+        for name,_ in RATE_COLUMNS + SMOOTHED_COLUMNS:
+            columns[name] = np.zeros(n)
+        for name in IMBALANCE_COLUMNS:
+            columns[name] = np.zeros(n)
+        return cls.from_columns(addresses,columns,worker_index,previous)
+
+    @classmethod
+    def from_columns(cls,addresses,columns,worker_index,previous=None):
+        '''
+            Build a snapshot out of columns which are already extracted
+
+            :param addresses: list of the worker addresses, one per row
+            :param columns: dict of column name -> numpy array with a value per row
+            :param worker_index: WorkerIndex giving the stable index of the workers
+            :param previous: previous snapshot, its layout is kept if the workers did not change
+        '''
+        if previous is not None and previous.addresses == addresses:
+            return cls(previous.addresses,columns,previous.index,previous.layout)
+        worker_index.retain(addresses)
+        index = np.fromiter((worker_index(address) for address in addresses),np.int64,len(addresses))
+        layout = previous.layout+1 if previous is not None else 0
+        return cls(addresses,columns,index,layout)
+
+    def measure_rates(self,previous,elapsed):
+        '''
+            Fill the RATE_COLUMNS from the change of their column since a previous
+            snapshot, a worker which was not in it has a rate of 0
+
+            :param previous: WorkerSnapshot taken elapsed seconds before this one
+            :param elapsed: time in seconds between the two snapshots
+        '''
+        if elapsed <= 0:
+            return
+        if previous.addresses == self.addresses:
+            rows = np.arange(len(self.addresses))
+        else:
+            before = dict((address,row) for row,address in enumerate(previous.addresses))
+            rows = np.fromiter((before.get(address,-1) for address in self.addresses),np.int64,len(self.addresses))
+        known = rows >= 0
+        for name,(column,sign) in RATE_COLUMNS:
+            change = np.zeros(len(self.addresses))
+            change[known] = self.columns[column][known]-previous.columns[column][rows[known]]
+            self.columns[name] = np.clip(sign*change,0,None)/elapsed
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def __iter__(self):
+        for row in range(len(self.addresses)):
+            yield WorkerRecord(self,row)
+
+    def __getitem__(self,row):
+        if not -len(self.addresses) <= row < len(self.addresses):
+            raise IndexError('worker snapshot index out of range')
+        return WorkerRecord(self,row % len(self.addresses))
+
+    def column(self,name):
+        return self.columns[name]
+
+    def sum(self,name):
+        return float(self.columns[name].sum())
+
+    def mean(self,name):
+        if not len(self.addresses):
+            return 0
+        return float(self.columns[name].mean())
+
+    def argsort(self,name,reverse=False):
+        '''
+            rows sorted on a column, ties keep the order of the snapshot
+        '''
+        if reverse:
+            return np.argsort(-self.columns[name],kind='stable')
+        return np.argsort(self.columns[name],kind='stable')
@@ -4,18 +4,49 @@
 '''
 
 import npyscreen, math, drawille
-import logging, weakref, sys
+import logging, weakref, sys, time
+import numpy as np
+from npyscreen.wgmultiline import MORE_LABEL
 from ptop.utils import ThreadJob
+from ptop.utils.instrumentation import instruments, METRICS
+from .braille import BrailleChart, StackedBrailleChart
+from .render import RenderPipeline
+from .table import WorkerTable, STRAGGLER_FIELDS
 from ptop.constants import SYSTEM_USERS, SUPPORTED_THEMES
 
 
 # global flags defining actions, would like them to be object vars
-TIME_SORT = False
 MEMORY_SORT = False
 PROCESS_RELEVANCE_SORT = True
+# panel shown at the bottom of the window
+WORKERS_PANEL = 'workers'
+TASKS_PANEL = 'tasks'
+CLUSTERS_PANEL = 'clusters'
+INSTRUMENTS_PANEL = 'instruments'
+DETAIL_PANEL = 'worker'
+STRAGGLERS_PANEL = 'stragglers'
+PANEL = WORKERS_PANEL
+# text rows of the overview, the cluster, memory and spill rows then the imbalance,
+# replay and aggregate rows of the sensors which have them
+OVERVIEW_ROWS = 6
+# cluster metrics stacked on the memory chart, from the bottom
+MEMORY_LAYERS = ('managed_memory_percent','unmanaged_memory_percent','spilled_memory_percent')
+# cluster metrics stacked on the bandwidth chart, a tuple of metrics is drawn as their sum
+BANDWIDTH_LAYERS = ('net_read_rate','net_write_rate',('disk_read_rate','disk_write_rate'))
+BANDWIDTH_TITLE = "Bandwidth \u28ffin \u28d2out \u28c0disk {0:g} MB/s"
 PREVIOUS_TERMINAL_WIDTH = None
 PREVIOUS_TERMINAL_HEIGHT = None
 
+def shorten(text,width):
+    '''
+        text cut in its middle to fit in width, keys differ by their end as much as by their start
+    '''
+    if len(text) <= width:
+        return text
+    head = (width-3)//2
+    return text[:head] + '...' + text[len(text)-(width-3-head):]
+
+
 class CustomMultiLineAction(npyscreen.MultiLineAction):
     '''
         Making custom MultiLineAction by adding the handlers
@@ -24,15 +55,26 @@ class CustomMultiLineAction(npyscreen.MultiLineAction):
         super(CustomMultiLineAction,self).__init__(*args,**kwargs)
         self.add_handlers({
             "^N" : self._sort_by_memory,
-            "^T" : self._sort_by_time,
             #"^K" : self._kill_process,
             "^Q" : self._quit,
             "^R" : self._reset,
+            "^A" : self._toggle_task_view,
+            "^B" : self._toggle_straggler_view,
+            "^L" : self._toggle_cluster_view,
+            "^E" : self._toggle_instruments_view,
+            "[" : self._seek_backward,
+            "]" : self._seek_forward,
+            "{" : self._seek_backward_long,
+            "}" : self._seek_forward_long,
+            "+" : self._speed_up,
+            "-" : self._slow_down,
+            "^P" : self._toggle_pause,
             #"^H" : self._do_process_filtering_work,
-            #"^L" : self._show_detailed_process_info,
             #"^F" : self._do_process_filtering_work
         })
         self._filtering_flag = False
+        # instruments.enabled before the instruments panel was shown
+        self._instrumented = False
         self._logger = logging.getLogger(__name__)
         '''
             Non-sorted processes table entries, practically this will never be 
@@ -41,29 +83,92 @@ class CustomMultiLineAction(npyscreen.MultiLineAction):
         '''
         self._uncurtailed_process_data = None
                 
-    def _sort_by_time(self,*args,**kwargs):
-        # fuck .. that's why NPSManaged was required, i.e you can access the app instance within widgets
-        self._logger.info("Sorting the process table by time")
-        global TIME_SORT,MEMORY_SORT
-        MEMORY_SORT = False
-        TIME_SORT = True
-        PROCESS_RELEVANCE_SORT = False
-
     def _sort_by_memory(self,*args,**kwargs):
         self._logger.info("Sorting the process table by memory")
-        global TIME_SORT,MEMORY_SORT
-        TIME_SORT = False
+        global MEMORY_SORT
         MEMORY_SORT = True
         PROCESS_RELEVANCE_SORT = False
 
     def _reset(self,*args,**kwargs):
         self._logger.info("Resetting the process table")
-        global TIME_SORT, MEMORY_SORT
-        TIME_SORT = False
+        global MEMORY_SORT
         MEMORY_SORT = False
         PROCESS_RELEVANCE_SORT = True
         self._filtering_flag = False
 
+    def _show_panel(self,panel):
+        global PANEL
+        # ptop only measures itself while somebody looks at it, unless asked to
+        # with --instrument, whichever way the instruments panel is left
+        if panel == INSTRUMENTS_PANEL and PANEL != INSTRUMENTS_PANEL:
+            self._instrumented = instruments.enabled
+            instruments.enable()
+        elif panel != INSTRUMENTS_PANEL and PANEL == INSTRUMENTS_PANEL:
+            instruments.enable(self._instrumented)
+        PANEL = panel
+        self.cursor_line = 0
+        self.start_display_at = 0
+
+    def _toggle_task_view(self,*args,**kwargs):
+        self._logger.info("Switching between the workers and the task activity")
+        self._show_panel(WORKERS_PANEL if PANEL == TASKS_PANEL else TASKS_PANEL)
+
+    def _toggle_straggler_view(self,*args,**kwargs):
+        self._logger.info("Switching between the workers and the stragglers")
+        self._show_panel(WORKERS_PANEL if PANEL == STRAGGLERS_PANEL else STRAGGLERS_PANEL)
+
+    def _toggle_cluster_view(self,*args,**kwargs):
+        self._logger.info("Switching between the workers and the clusters")
+        self._show_panel(WORKERS_PANEL if PANEL == CLUSTERS_PANEL else CLUSTERS_PANEL)
+
+    def _toggle_instruments_view(self,*args,**kwargs):
+        self._logger.info("Switching between the workers and the instruments of ptop")
+        self._show_panel(WORKERS_PANEL if PANEL == INSTRUMENTS_PANEL else INSTRUMENTS_PANEL)
+
+    def actionHighlighted(self,act_on_this,key_press):
+        app = self.find_parent_app()
+        # drill down into the highlighted cluster
+        if PANEL == CLUSTERS_PANEL:
+            app.select_cluster(self.cursor_line)
+            self._show_panel(WORKERS_PANEL)
+        # drill down into the highlighted worker, and back to the same row
+        elif PANEL in (WORKERS_PANEL,STRAGGLERS_PANEL) and self.cursor_line < len(app.worker_tables[PANEL]):
+            self._worker_line = self.cursor_line
+            self._worker_panel = PANEL
+            app.show_worker(app.worker_tables[PANEL].address(self.cursor_line))
+            self._show_panel(DETAIL_PANEL)
+        elif PANEL == DETAIL_PANEL:
+            self._show_panel(getattr(self,'_worker_panel',WORKERS_PANEL))
+            self.cursor_line = getattr(self,'_worker_line',0)
+
+    def _playback(self,action,*args):
+        # only a replayed recording can be moved around, all the clusters of
+        # a recording are moved together
+        for sensor in self.find_parent_app().sensors.values():
+            if hasattr(sensor,action):
+                getattr(sensor,action)(*args)
+
+    def _seek_backward(self,*args,**kwargs):
+        self._playback('seek',-10)
+
+    def _seek_forward(self,*args,**kwargs):
+        self._playback('seek',10)
+
+    def _seek_backward_long(self,*args,**kwargs):
+        self._playback('seek',-300)
+
+    def _seek_forward_long(self,*args,**kwargs):
+        self._playback('seek',300)
+
+    def _speed_up(self,*args,**kwargs):
+        self._playback('change_speed',2)
+
+    def _slow_down(self,*args,**kwargs):
+        self._playback('change_speed',0.5)
+
+    def _toggle_pause(self,*args,**kwargs):
+        self._playback('toggle_pause')
+
     def _quit(self,*args,**kwargs):
         raise KeyboardInterrupt
 
@@ -73,6 +178,64 @@ class CustomMultiLineAction(npyscreen.MultiLineAction):
     def set_uncurtailed_process_data(self, processes_info):
         self._uncurtailed_process_data = processes_info
 
+    def get_filtered_indexes(self, force_remake_cache=False):
+        # filtering is not offered, this avoids walking over every row of the table
+        return []
+
+    def _set_line_highlighting(self, line, value_indexer):
+        super(CustomMultiLineAction,self)._set_line_highlighting(line,value_indexer)
+        # rows of the workers a rule fires on stand out
+        alerting = getattr(self.values,'alerting',None)
+        line.color = 'WARNING' if alerting is not None and alerting(value_indexer) else 'DEFAULT'
+
+    def update(self, clear=True):
+        '''
+            Trimmed down MultiLine.update, the values are a lazily formatted WorkerTable
+            so only the rows inside the scroll window are touched and nothing is copied
+        '''
+        if self.hidden:
+            if clear:
+                self.clear()
+            return False
+
+        display_length = len(self._my_widgets)
+        n_rows = len(self.values)
+        self._filtered_values_cache = []
+        if self.editing or self.always_show_cursor:
+            self.cursor_line = max(0,min(self.cursor_line,n_rows-1))
+            if self.cursor_line > self.start_display_at+(display_length-2):
+                self.start_display_at = self.cursor_line
+            if self.cursor_line < self.start_display_at:
+                self.start_display_at = max(0,self.cursor_line-(display_length-2))
+
+        if clear:
+            self.clear()
+        indexer = self.start_display_at
+        for line in self._my_widgets[:-1]:
+            self._print_line(line,indexer)
+            line.task = "PRINTLINE"
+            line.update(clear=True)
+            indexer += 1
+
+        # the last line is replaced by a marker if there are more rows below the scroll window
+        line = self._my_widgets[-1]
+        if n_rows > indexer+1:
+            line.task = MORE_LABEL
+            line.clear()
+            self.parent.curses_pad.addstr(self.rely+self.height-1,self.relx,MORE_LABEL)
+        else:
+            self._print_line(line,indexer)
+            line.task = "PRINTLINE"
+            line.update(clear=True)
+
+        if (self.editing or self.always_show_cursor) and n_rows:
+            cursor_widget = self._my_widgets[self.cursor_line-self.start_display_at]
+            self.set_is_line_cursor(cursor_widget,True)
+            cursor_widget.update(clear=True)
+
+        self._last_start_display_at = self.start_display_at
+        self._last_cursor_line = self.cursor_line
+
 
 class MultiLineWidget(npyscreen.BoxTitle):
     '''
@@ -106,7 +269,18 @@ class PtopGUI(npyscreen.NPSApp):
         for all other widgets
     '''
     def __init__(self,statistics,stop_event,arg,sensor_refresh_rates):
-        self.statistics = statistics
+        self.statistics = statistics.statistics
+        # Version of the snapshot of every sensor, a frame is only drawn when it moved
+        self.versions = statistics.versions
+        # Time series of the sensors, the charts are drawn from it
+        self.history = statistics.history
+        # Sensors by name, for telling them what is being looked at
+        self.sensors = dict((sensor.name,sensor) for sensor in statistics.plugins)
+        # Clusters in the order they were given and the one shown
+        self.clusters = [sensor.name for sensor in statistics.plugins]
+        self.cluster = self.clusters[0]
+        # Health of the sensors, kept by the collector
+        self.collector = statistics.collector
         # Command line arguments passed, currently used for selecting themes
         self.arg = arg
         # Global stop event
@@ -120,11 +294,25 @@ class PtopGUI(npyscreen.NPSApp):
 
         # Main form
         self.window = None 
+        # Sorted workers, formatted lazily
+        self.worker_table = None
+        self.worker_tables = {}
+        # Tracks the widgets which changed since the last frame
+        self.render_pipeline = None
+        # What the last frame was drawn from, see frame_state
+        self._shown = None
+
+        # Worker of the detail panel, its last detail or error and the pending fetch
+        self.detail_address = None
+        self._detail = None
+        self._detail_error = None
+        self._detail_future = None
 
         # Widgets
         self.basic_stats = None
         self.memory_chart = None
         self.cpu_chart = None
+        self.bandwidth_chart = None
         self.processes_table = None
 
         # Actions bar
@@ -140,8 +328,11 @@ class PtopGUI(npyscreen.NPSApp):
         '''
         self.CHART_HEIGHT = None
         self.CHART_WIDTH = None
-        self.cpu_array = None
-        self.memory_array = None
+        self.cpu_chart_renderer = None
+        self.memory_chart_renderer = None
+        self.bandwidth_chart_renderer = None
+        # MB/s at the full height of the bandwidth chart
+        self.bandwidth_scale = 1
 
         # logger
         self._logger = logging.getLogger(__name__)
@@ -152,31 +343,174 @@ class PtopGUI(npyscreen.NPSApp):
             :param arg: Theme to be selected corresponding to the arg
         '''
         self.themes = SUPPORTED_THEMES
-        return self.themes[self.arg]
+        return getattr(npyscreen.Themes,self.themes[self.arg])
+
+    def draw_chart(self,chart,metric,scale=1):
+        '''
+            Bring a chart up to date with the history, only the samples recorded
+            since the last frame are drawn
+
+            :param chart: The BrailleChart to draw on
+            :param metric: cluster metric of the history to draw, a tuple of metrics for a StackedBrailleChart
+            :param scale: value of the metric drawn at the full chart height
+        '''
+        dask_history = self.history[self.cluster]
+        new_samples = dask_history.samples - chart.samples
+        if new_samples > 0:
+            n = min(new_samples,chart.capacity)
+            if isinstance(metric,tuple):
+                chart.extend(np.column_stack([self.layer_series(layer,n) for layer in metric])/scale)
+            else:
+                chart.extend(dask_history.series(metric,n)/scale)
+            chart.samples = dask_history.samples
+        return chart.frame()
+
+    def layer_series(self,layer,n):
+        '''
+            latest n samples of a layer of a stacked chart, a metric or a tuple of metrics summed
+        '''
+        dask_history = self.history[self.cluster]
+        if isinstance(layer,tuple):
+            return sum(np.nan_to_num(dask_history.series(name,n)) for name in layer)
+        return dask_history.series(layer,n)
 
-    def draw_chart(self,canvas,y,chart_type):
+    def update_bandwidth_scale(self):
         '''
-            :param y: The next height to draw
-            :param canvas: The canvas on which to draw
-            :param chart_type: cpu/memory
+            Scale the bandwidth chart to the power of two MB/s above the peak of
+            the samples it shows, the chart is drawn again when the scale changes
+
+            :rtype: MB/s at the full height of the chart
+        '''
+        n = min(self.history[self.cluster].samples,self.bandwidth_chart_renderer.capacity)
+        peak = max(sum(np.nan_to_num(self.layer_series(layer,n)) for layer in BANDWIDTH_LAYERS).max(initial=0),1)
+        scale = 2**int(math.ceil(math.log(peak,2)))
+        if scale != self.bandwidth_scale:
+            self.bandwidth_scale = scale
+            self.bandwidth_chart_renderer.clear()
+        return scale
+
+    def format_worker_row(self,proc,alerts=()):
+        '''
+            :param proc: WorkerRecord of a worker
+            :param alerts: names of the rules firing on the worker
+            :rtype: row of the workers table
         '''
-        if chart_type == 'cpu':
-            chart_array = self.cpu_array
+        if alerts:
+            flag = ','.join(alerts)
+        elif proc['paused']:
+            flag = 'paused'
+        elif proc['spill_rate']:
+            flag = 'spilling'
         else:
-            chart_array = self.memory_array
-        
-        for i in range(self.CHART_WIDTH):
-            if i >= 2:
-                chart_array[i-2] = chart_array[i]
-        # width of each peak is 2 units
-        chart_array[self.CHART_WIDTH-1] = y
-        chart_array[self.CHART_WIDTH-2] = y
+            flag = ''
+        return "{address}{space}{nthreads}{space}{cpu} % {space}{memory}/{memory_limit}{space}{read}/{write}{space}{spilled}{space}{flag}\
+                ".format( address = (proc['address'][:25] + '...') if len(proc['address']) > 25 else proc['address'], # 0
+                          nthreads = proc['nthreads'], # 1
+                          cpu =  proc['cpu'],  # 3
+                          memory =   proc['memory'], # 4
+                          memory_limit =  proc['memory_limit'], # 5 
+                          read         = proc['net_read_rate'],
+                          write        = proc['net_write_rate'],
+                          spilled      = proc['spilled'],
+                          flag         = flag,
+                          space=  " "*int(5*self.X_SCALING_FACTOR)) # 6
 
-        for x in range(0,self.CHART_WIDTH):
-            for y in range(self.CHART_HEIGHT,self.CHART_HEIGHT-chart_array[x],-1):
-                canvas.set(x,y)
+    def format_straggler_row(self,proc,alerts=()):
+        '''
+            :param proc: WorkerRecord of a worker
+            :param alerts: names of the rules firing on the worker
+            :rtype: row of the stragglers table
+        '''
+        return "{address}{space}{score:>6.1f}{space}{load:>8.2f} s{space}{processing:>6.0f}{space}{ready:>6.0f}{space}{executing:>4.0f}{space}{cpu:>6.1f} %{space}{flag}\
+                ".format( address = (proc['address'][:25] + '...') if len(proc['address']) > 25 else proc['address'].ljust(28),
+                          score = proc['straggler_score'],
+                          load = proc['load'],
+                          processing = proc['processing'],
+                          ready = proc['ready'],
+                          executing = proc['executing'],
+                          cpu = proc['cpu'],
+                          flag = ','.join(alerts),
+                          space = " "*int(3*self.X_SCALING_FACTOR))
+
+    def format_imbalance(self,imbalance):
+        '''
+            :param imbalance: Imbalance section of the values of a sensor
+            :rtype: overview row of the load imbalance and the worst stragglers
+        '''
+        def ratio(value):
+            return '-' if value is None else '{0:g}'.format(value)
+        row = "Imbalance cv/max:median {space}load {load_cv}/{load_ratio}   tasks {processing_cv}/{processing_ratio}   stragglers: {n}".format(
+                    load_cv = ratio(imbalance['load_cv']),
+                    load_ratio = ratio(imbalance['load_max_median']),
+                    processing_cv = ratio(imbalance['processing_cv']),
+                    processing_ratio = ratio(imbalance['processing_max_median']),
+                    n = imbalance['n_stragglers'],
+                    space=" "*int(4*self.X_SCALING_FACTOR))
+        if imbalance['stragglers']:
+            row += " ({0})".format(', '.join("{0} z {1:g}".format(shorten(address,24),score)
+                                             for address,score in imbalance['stragglers'][:2]))
+        return row
+
+    def format_task_row(self,task):
+        '''
+            :param task: (prefix, tasks/s, mean compute time, mean transfer time, bytes/s)
+            :rtype: row of the task activity table
+        '''
+        prefix,rate,compute,transfer,nbytes = task
+        return "{prefix}{space}{rate:>8.1f}{space}{compute:>9.1f} ms{space}{transfer:>9.1f} ms{space}{nbytes:>10.2f}\
+                ".format( prefix = (prefix[:25] + '...') if len(prefix) > 25 else prefix.ljust(28),
+                          rate = rate,
+                          compute = compute*1000,
+                          transfer = transfer*1000,
+                          nbytes = nbytes/(1024**2),
+                          space = " "*int(5*self.X_SCALING_FACTOR))
+
+    def select_cluster(self,index):
+        '''
+            Show the cluster at index of the clusters list
+        '''
+        if not 0 <= index < len(self.clusters) or self.clusters[index] == self.cluster:
+            return
+        self.cluster = self.clusters[index]
+        # the charts are drawn again from the history of the new cluster
+        self.cpu_chart_renderer.clear()
+        self.memory_chart_renderer.clear()
+        self.bandwidth_chart_renderer.clear()
+
+    def cluster_state(self):
+        '''
+            :rtype: suffix of the overview title until the shown cluster first answers
+        '''
+        health = self.collector.health.get(self.cluster) if self.collector is not None else None
+        if health is None or health['updated'] is not None:
+            return ''
+        # the error itself is in the clusters panel
+        return ' - unreachable, retrying' if health['error'] else ' - connecting'
 
-        return canvas.frame(0,0,self.CHART_WIDTH,self.CHART_HEIGHT)
+    def format_cluster_row(self,name):
+        '''
+            :param name: name of the cluster
+            :rtype: row of the clusters table
+        '''
+        values = self.statistics[name]
+        health = self.collector.health.get(name,{}) if self.collector is not None else {}
+        if health.get('error'):
+            state = health['error'][:12]
+        elif health.get('updated') is None:
+            state = 'connecting'
+        else:
+            state = 'ok {0:.0f} ms'.format(health['latency']*1000)
+        return "{marker}{name}{space}{state: <12}{space}{interval: >5.1f} s{space}{workers: >6}{space}{threads: >6}{space}{cpu: >6.1f} %{space}{used}/{total}\
+                ".format( marker = '*' if name == self.cluster else ' ',
+                          name = (name[:25] + '...') if len(name) > 25 else name.ljust(28),
+                          state = state,
+                          interval = health.get('interval') or 0,
+                          workers = values['Cluster']['n_workers'],
+                          threads = values['Cluster']['total_threads'],
+                          cpu = values['CPU']['cpu_usage'],
+                          used = values['Memory']['used_memory'],
+                          total = values['Memory']['total_memory'],
+                          space = " "*int(3*self.X_SCALING_FACTOR))
 
     def while_waiting(self):
         '''
@@ -186,7 +520,8 @@ class PtopGUI(npyscreen.NPSApp):
         #     t = ThreadJob(self.update,self.stop_event,1)
         #     self.update_thread = t
         #     self.update_thread.start()
-        self._logger.info('Updating GUI due to no keyboard interrupt')
+        # called every few milliseconds, the arguments are only formatted if DEBUG is logged
+        self._logger.debug('Updating GUI due to no keyboard interrupt')
         '''
             Earlier a thread job was being used to update the GUI
             in background but while_waiting is getting called after 10ms
@@ -195,11 +530,10 @@ class PtopGUI(npyscreen.NPSApp):
             won't update
         '''
         terminal_width,terminal_height = drawille.getTerminalSize()
-        self._logger.info("Equating terminal sizes, old {0}*{1} vs {2}*{3}".format(PREVIOUS_TERMINAL_WIDTH,
-                                                                                   PREVIOUS_TERMINAL_HEIGHT,
-                                                                                   terminal_width,
-                                                                                   terminal_height
-                                                                                   ))
+        self._logger.debug("Equating terminal sizes, old %s*%s vs %s*%s",PREVIOUS_TERMINAL_WIDTH,
+                                                                         PREVIOUS_TERMINAL_HEIGHT,
+                                                                         terminal_width,
+                                                                         terminal_height)
 
         # In case the terminal size is changed, try resizing the terminal and redrawing ptop
         if terminal_width != PREVIOUS_TERMINAL_WIDTH or terminal_height != PREVIOUS_TERMINAL_HEIGHT:
@@ -216,109 +550,273 @@ class PtopGUI(npyscreen.NPSApp):
             Update the form in background, this used to be called inside the ThreadJob 
             and but now is getting called automatically in while_waiting
         '''
+        state = self.frame_state()
+        if state is not None and state == self._shown:
+            return
         try:
-            dask_memory = self.statistics['Dask']['Memory']
-            dask_cpu    = self.statistics['Dask']['CPU']
-            dask_cluster= self.statistics['Dask']['Cluster']
+            with instruments.timer('gui_update'):
+                self._update()
+            self._shown = state
+            if instruments.enabled:
+                updated = self.collector.health[self.cluster]['updated'] if self.collector is not None else None
+                if updated is not None:
+                    instruments.record('data_age',time.time()-updated)
+
+        # catch the fucking KeyError caused to c
+        # cumbersome point of reading the stats data structures
+        except KeyError:
+            self._logger.info("Some of the stats reading failed",exc_info=True)
+
+    def frame_state(self):
+        '''
+            :rtype: everything a frame is drawn from, None if the frame has to be
+                    drawn anyway
+        '''
+        if PANEL in (CLUSTERS_PANEL,INSTRUMENTS_PANEL,DETAIL_PANEL):
+            # these panels follow the collector, ptop itself or a worker, not the snapshots
+            return None
+        return (self.cluster,self.versions[self.cluster],self.cluster_state(),PANEL,MEMORY_SORT)
+
+    def _update(self):
+        # the snapshot is read once, a newer one may be published while drawing
+        values = self.statistics[self.cluster]
+        dask_memory = values['Memory']
+        dask_cluster= values['Cluster']
+
+        #### Overview information ####
+
+        workers = str(dask_cluster["n_workers"])
+        if dask_cluster.get("n_paused"):
+            workers += " ({0} paused)".format(dask_cluster["n_paused"])
+        row2 = "Workers: {workers: <6} {long_space} Total Threads: {threads: <8}".format(workers=workers,
+                                                                                      threads=dask_cluster["total_threads"],
+                                                                                      space=" "*int(4*self.X_SCALING_FACTOR),
+                                                                                      long_space=" "*int(9*self.X_SCALING_FACTOR))
+
+        row3 = "Memory (used/available)   {space}{used: <6}/{total: >6} MB".format(used = dask_memory['used_memory'],
+                                                                        total = dask_memory['total_memory'],
+                                                                                               space=" "*int(4*self.X_SCALING_FACTOR),
+                                                                                               long_space=" "*int(9*self.X_SCALING_FACTOR))
+
+
+        row4 = "Managed/unmanaged/spilled {space}{managed}/{unmanaged}/{spilled} MB   spill/unspill {spill}/{unspill} MB/s".format(
+                                managed = dask_memory.get('managed_memory',0),
+                                unmanaged = dask_memory.get('unmanaged_memory',0),
+                                spilled = dask_memory.get('spilled_memory',0),
+                                spill = dask_memory.get('spill_rate',0),
+                                unspill = dask_memory.get('unspill_rate',0),
+                                space=" "*int(4*self.X_SCALING_FACTOR))
+
+        overview = row2 + '\n' + row3 + '\n' + row4
+        imbalance = values.get('Imbalance')
+        # empty while the load of the workers is not known
+        if imbalance:
+            overview += '\n' + self.format_imbalance(imbalance)
+        replay = values.get('Replay')
+        if replay is not None and replay['start'] is not None:
+            overview += "\nReplay {space}{position} ({elapsed}/{length} s) x{speed:g}{paused}".format(
+                                position = time.strftime('%Y-%m-%d %H:%M:%S',time.localtime(replay['position'])),
+                                elapsed = int(replay['position']-replay['start']),
+                                length = int(replay['stop']-replay['start']),
+                                speed = replay['speed'],
+                                paused = ' paused' if replay['paused'] else '',
+                                space=" "*int(4*self.X_SCALING_FACTOR))
+
+        summary = values.get('Summary')
+        if summary is not None:
+            cpu = summary['percentiles']['cpu']
+            tasks = summary['task_states']
+            overview += "\nCPU % p50/p90/max {space}{p50:.0f}/{p90:.0f}/{max:.0f}   Tasks: {processing} processing, {memory} in memory, {erred} erred".format(
+                                p50 = cpu[1], p90 = cpu[2], max = cpu[4],
+                                processing = tasks.get('processing',0),
+                                memory = tasks.get('memory',0),
+                                erred = tasks.get('erred',0),
+                                space=" "*int(4*self.X_SCALING_FACTOR))
+
+        # Lazy update to GUI, widgets are only redrawn if their content changed
+        alerts = values.get('Alerts',{}).get('cluster')
+        self.render_pipeline.stage(self.basic_stats,"Overview ( {0}{1}{2} )".format(
+                                       self.cluster,self.cluster_state(),' - alert: '+', '.join(alerts) if alerts else ''),'name')
+        self.render_pipeline.stage(self.basic_stats,overview)
+
+        with instruments.timer('gui_charts'):
 
-            #### Overview information ####
+            ####  CPU Usage information ####
 
-            row2 = "Workers: {workers: <6} {long_space} Total Threads: {threads: <8}".format(workers=dask_cluster["n_workers"],
-                                                                                          threads=dask_cluster["total_threads"],
-                                                                                          space=" "*int(4*self.X_SCALING_FACTOR),
-                                                                                          long_space=" "*int(9*self.X_SCALING_FACTOR))
+            self.render_pipeline.stage(self.cpu_chart,self.draw_chart(self.cpu_chart_renderer,'cpu_usage',100))
 
-            row3 = "Memory (used/available)   {space}{used: <6}/{total: >6} MB".format(used = dask_memory['used_memory'],
-                                                                            total = dask_memory['total_memory'],
-                                                                                                   space=" "*int(4*self.X_SCALING_FACTOR),
-                                                                                                   long_space=" "*int(9*self.X_SCALING_FACTOR))
+            #### Memory Usage information ####
 
+            self.render_pipeline.stage(self.memory_chart,self.draw_chart(self.memory_chart_renderer,MEMORY_LAYERS))
 
-            self.basic_stats.value = row2 + '\n' + row3
-            # Lazy update to GUI
-            self.basic_stats.update(clear=True)
+            #### Bandwidth information ####
 
+            scale = self.update_bandwidth_scale()
+            self.render_pipeline.stage(self.bandwidth_chart,BANDWIDTH_TITLE.format(scale),'name')
+            self.render_pipeline.stage(self.bandwidth_chart,self.draw_chart(self.bandwidth_chart_renderer,BANDWIDTH_LAYERS,scale))
 
-            ####  CPU Usage information ####
+        # a sensor only follows the task stream, or the state of every worker, while its panel is shown
+        for name,sensor in self.sensors.items():
+            sensor.track_tasks = PANEL == TASKS_PANEL and name == self.cluster
+            sensor.track_workers = PANEL in (WORKERS_PANEL,STRAGGLERS_PANEL) and name == self.cluster
 
-            cpu_canvas = drawille.Canvas()
-            next_peak_height = int(math.ceil((float(dask_cpu['cpu_usage'])/100)*self.CHART_HEIGHT))
-            self.cpu_chart.value = (self.draw_chart(cpu_canvas,next_peak_height,'cpu'))
-            self.cpu_chart.update(clear=True)
+        with instruments.timer('gui_table'):
+            self.render_pipeline.stage(self.processes_table,self.PANEL_TITLES[PANEL].format(address=self.detail_address),'name')
+            if PANEL == TASKS_PANEL:
 
-            #### Memory Usage information ####
+                #### Task activity ####
+
+                rows = tuple(self.format_task_row(task) for task in values['Tasks'])
+                self.render_pipeline.stage(self.processes_table.entry_widget,rows,'values')
+
+            elif PANEL == CLUSTERS_PANEL:
+
+                #### Clusters ####
+
+                rows = tuple(self.format_cluster_row(name) for name in self.clusters)
+                self.render_pipeline.stage(self.processes_table.entry_widget,rows,'values')
+
+            elif PANEL == DETAIL_PANEL:
+
+                #### Detail of a worker ####
+
+                self.poll_worker_detail()
+                self.render_pipeline.stage(self.processes_table.entry_widget,self.format_detail_rows(),'values')
+
+            elif PANEL == INSTRUMENTS_PANEL:
+
+                #### ptop itself ####
+
+                rows = self.format_instrument_rows()
+                self.render_pipeline.stage(self.processes_table.entry_widget,rows,'values')
 
-            memory_canvas = drawille.Canvas()
-            next_peak_height = int(math.ceil((float(dask_memory['used_memory_percent']))*self.CHART_HEIGHT))
-            self.memory_chart.value = self.draw_chart(memory_canvas,next_peak_height,'memory')
-            self.memory_chart.update(clear=True)
-
-            #### Worker table ####
-
-            self._processes_data = self.statistics['Dask']['Workers']
-
-            # check sorting flags
-            if MEMORY_SORT:
-                sorted_processes_data = sorted(self._processes_data,key=lambda k:k['memory'],reverse=True)
-                self._logger.info("Memory sorting done for process table")
-            elif TIME_SORT:
-                sorted_processes_data = sorted(self._processes_data,key=lambda k:k['rawtime'],reverse=True)
-                self._logger.info("Time sorting done for process table")
-            elif PROCESS_RELEVANCE_SORT:
-                sorted_processes_data = sorted(self._processes_data,key=lambda k:k['rawtime'])
-                self._logger.info("Sorting on the basis of relevance")
             else:
-                sorted_processes_data = self._processes_data
-                self._logger.info("Resetting the sorting behavior")
-
-            # to keep things pre computed
-            # curtailed_processes_data = []
-            # for proc in sorted_processes_data:
-            #     curtailed_processes_data.append("{0: <30} {1: >5}{6}{2: <10}{6}{3}% {6}{4: >6.2f}{6}{5}\
-            #     ".format( (proc['address'][:25] + '...') if len(proc['address']) > 25 else proc['address'], # 0
-            #                proc['nthreads'], # 1
-            #                proc['user'], # 2
-            #                proc['cpu'],  # 3
-            #                proc['memory'], # 4
-            #                proc['memory_limit'], # 5 
-            #                " "*int(5*self.X_SCALING_FACTOR)) # 6
-            #     )
-                
-            # to keep things pre computed
-            curtailed_processes_data = []
-            for proc in sorted_processes_data:
-                curtailed_processes_data.append("{address}{space}{nthreads}{space}{cpu} % {space}{memory}/{memory_limit}{space}{read}/{write}\
-                ".format( address = (proc['address'][:25] + '...') if len(proc['address']) > 25 else proc['address'], # 0
-                          nthreads = proc['nthreads'], # 1
-                          cpu =  proc['cpu'],  # 3
-                          memory =   proc['memory'], # 4
-                          memory_limit =  proc['memory_limit'], # 5 
-                          read         = proc['read'],
-                          write        = proc['write'],
-                          space=  " "*int(5*self.X_SCALING_FACTOR)) # 6
-                )    
-            
-            if not self.processes_table.entry_widget.is_filtering_on():
-                self.processes_table.entry_widget.values =  curtailed_processes_data
-            # Set the processes data dictionary to uncurtailed processes data
-            self.processes_table.entry_widget.set_uncurtailed_process_data(self._processes_data)
-            self.processes_table.entry_widget.update(clear=True)
-
-            ''' This will update all the lazy updates at once, instead of .display() [fast]
-                .DISPLAY()[slow] is used to avoid glitches or gibberish text on the terminal
-            '''
-            self.window.DISPLAY()
 
-        # catch the fucking KeyError caused to c
-        # cumbersome point of reading the stats data structures
-        except KeyError:
-            self._logger.info("Some of the stats reading failed",exc_info=True)
+                #### Worker table ####
+
+                self._processes_data = values['Workers']
+                table = self.worker_tables[PANEL]
+
+                # check sorting flags, workers have no lifetime so there is no time sort and
+                # the relevance sort keeps the order of the scheduler, the stragglers come first
+                alerts = values.get('Alerts',{}).get('workers')
+                if PANEL == STRAGGLERS_PANEL:
+                    table.set_workers(self._processes_data,'straggler_score',reverse=True,alerts=alerts)
+                elif MEMORY_SORT:
+                    table.set_workers(self._processes_data,'memory',reverse=True,alerts=alerts)
+                else:
+                    table.set_workers(self._processes_data,alerts=alerts)
+
+                if not self.processes_table.entry_widget.is_filtering_on():
+                    # rows are only formatted when the widget draws them
+                    self.render_pipeline.stage(self.processes_table.entry_widget,table,'values',
+                                               signature=(PANEL,table.version))
+                # Set the processes data dictionary to uncurtailed processes data
+                self.processes_table.entry_widget.set_uncurtailed_process_data(self._processes_data)
+
+        ''' This will flush all the lazy updates at once, only the changed widgets are
+            redrawn. The full repaint .DISPLAY()[slow] which avoids glitches or gibberish
+            text on the terminal is only done after a resize
+        '''
+        with instruments.timer('gui_display'):
+            self.render_pipeline.flush()
+
+    def show_worker(self,address):
+        '''
+            Show the detail of the worker at address in the detail panel
+        '''
+        self.detail_address = address
+        self._detail = None
+        self._detail_error = None
+        self._detail_future = None
+
+    def poll_worker_detail(self):
+        '''
+            Collect the detail fetched for the worker shown and ask for a new one,
+            the fetch runs on the collector loop so the frame never waits for it
+        '''
+        sensor = self.sensors[self.cluster]
+        if self._detail_future is not None:
+            if not self._detail_future.done():
+                return
+            try:
+                detail = self._detail_future.result()
+                if detail['address'] == self.detail_address:
+                    self._detail,self._detail_error = detail,None
+            except Exception as e:
+                self._logger.info("Fetching the detail of {0} failed".format(self.detail_address),exc_info=True)
+                self._detail_error = str(e) or e.__class__.__name__
+            self._detail_future = None
+        if self.collector is not None and hasattr(sensor,'fetch_worker_detail_async'):
+            # the sensor answers from its cache until the detail is too old
+            self._detail_future = self.collector.submit(sensor.fetch_worker_detail_async(self.detail_address))
+
+    def format_detail_rows(self):
+        '''
+            :rtype: rows of the detail panel of a worker
+        '''
+        if not hasattr(self.sensors[self.cluster],'fetch_worker_detail_async'):
+            return ("The detail of a worker is only available from a live cluster",)
+        detail = self._detail
+        if detail is None:
+            return (self._detail_error or "Asking {0} ...".format(self.detail_address),)
+        mb = float(1024**2)
+        indent = " "*int(4*self.X_SCALING_FACTOR)
+        rows = ["Tasks{0}executing {executing}   ready {ready}   constrained {constrained}   long running {long_running}   in flight {in_flight}".format(indent,**detail),
+                "Memory{0}{n_stored} keys {stored:.2f} MB stored   {n_spilled} keys {spilled:.2f} MB spilled to disk".format(
+                    indent,n_stored=detail['n_stored'],stored=detail['stored_bytes']/mb,
+                    n_spilled=detail['n_spilled'],spilled=detail['spilled_bytes']/mb)]
+        if self._detail_error:
+            rows.append("Last fetch failed, {0}".format(self._detail_error))
+        rows.append("Largest keys in memory")
+        rows.extend("{0}{1: <40}{2: >12.2f} MB".format(indent,shorten(key,40),size/mb) for key,size in detail['stored'])
+        rows.append("Busy threads")
+        rows.extend("{0}{1: <40}  {2}".format(indent,shorten(key,40),where) for key,where in detail['threads'])
+        rows.append("Recent profile ( function - samples )")
+        rows.extend("{0}{1: <60}{2: >8}".format(indent,function[:60],samples) for function,samples in detail['profile'])
+        return tuple(rows)
+
+    def format_instrument_rows(self):
+        '''
+            :rtype: rows of the instruments panel, the percentiles of every metric
+                    and the share of the frame budget the frames take
+        '''
+        def ms(value):
+            return '{0:>9.2f}'.format(value*1000) if value is not None else '{0:>9}'.format('-')
+        summary = instruments.summary()
+        rows = []
+        for name,description in METRICS:
+            stats = summary[name]
+            rows.append("{description: <28}{space}{count: >8}{space}{p50}{space}{p99}{space}{max}".format(
+                            description = description,
+                            count = stats['count'],
+                            p50 = ms(stats['p50']),
+                            p99 = ms(stats['p99']),
+                            max = ms(stats['max']),
+                            space = " "*int(4*self.X_SCALING_FACTOR)))
+        frame = summary['gui_update']['p99']
+        if frame is not None:
+            budget = self.refresh_rate/1000.
+            rows.append("frame budget {0:.0f} ms, the p99 frame takes {1:.1f} % of it".format(budget*1000,100*frame/budget))
+        return tuple(rows)
+
+    WORKER_TITLE = "Workers ( address - nthreads - cpu % - memory used/total MB - read/write MB/s - spilled MB ), Enter for detail"
+    TASK_TITLE = "Task activity, last 10 s ( prefix - tasks/s - mean compute - mean transfer - output MB/s )"
+    CLUSTER_TITLE = "Clusters ( name - state - refresh - workers - threads - cpu % - memory used/total MB ), Enter to show"
+    INSTRUMENTS_TITLE = "ptop itself, last minute ( measure - count - p50 ms - p99 ms - max ms )"
+    DETAIL_TITLE = "Worker {address}, Enter to go back"
+    STRAGGLER_TITLE = "Stragglers ( address - z - load s/thread - processing - ready - executing - cpu % ), Enter for detail"
+    PANEL_TITLES = {WORKERS_PANEL: WORKER_TITLE, TASKS_PANEL: TASK_TITLE, CLUSTERS_PANEL: CLUSTER_TITLE,
+                    INSTRUMENTS_PANEL: INSTRUMENTS_TITLE, DETAIL_PANEL: DETAIL_TITLE, STRAGGLERS_PANEL: STRAGGLER_TITLE}
 
     def draw(self):
         # Setting the main window form
         self.window = WindowForm(parentApp=self,
                                  name="ptop [http://darxtrix.in/ptop]"
                                  )
+        # a new form is always fully repainted on its first frame
+        self.render_pipeline = RenderPipeline(self.window)
+        self._shown = None
         MIN_ALLOWED_TERMINAL_WIDTH = 104
         MIN_ALLOWED_TERMINAL_HEIGHT = 28
 
@@ -350,7 +848,9 @@ class PtopGUI(npyscreen.NPSApp):
         OVERVIEW_WIDGET_REL_X = LEFT_OFFSET
         OVERVIEW_WIDGET_REL_Y = TOP_OFFSET
         # equivalent to math.ceil =>  [ int(109.89) = 109 ]
-        OVERVIEW_WIDGET_HEIGHT = int(6*self.Y_SCALING_FACTOR)
+        # every row fits between the borders, the lines missing on small terminals are taken from the table
+        OVERVIEW_WIDGET_HEIGHT = max(int(6*self.Y_SCALING_FACTOR),OVERVIEW_ROWS+2)
+        OVERVIEW_EXTRA_HEIGHT = OVERVIEW_WIDGET_HEIGHT-int(6*self.Y_SCALING_FACTOR)
         OVERVIEW_WIDGET_WIDTH = int(100*self.X_SCALING_FACTOR)
         self._logger.info("Trying to draw Overview information box, x1 {0} x2 {1} y1 {2} y2 {3}".format(OVERVIEW_WIDGET_REL_X,
                                                                                                OVERVIEW_WIDGET_REL_X+OVERVIEW_WIDGET_WIDTH,
@@ -372,14 +872,14 @@ class PtopGUI(npyscreen.NPSApp):
         MEMORY_USAGE_WIDGET_REL_X = LEFT_OFFSET
         MEMORY_USAGE_WIDGET_REL_Y = OVERVIEW_WIDGET_REL_Y + OVERVIEW_WIDGET_HEIGHT
         MEMORY_USAGE_WIDGET_HEIGHT = int(10*self.Y_SCALING_FACTOR)
-        MEMORY_USAGE_WIDGET_WIDTH = int(50*self.X_SCALING_FACTOR)
+        MEMORY_USAGE_WIDGET_WIDTH = int(40*self.X_SCALING_FACTOR)
         self._logger.info("Trying to draw Memory Usage information box, x1 {0} x2 {1} y1 {2} y2 {3}".format(MEMORY_USAGE_WIDGET_REL_X,
                                                                                                    MEMORY_USAGE_WIDGET_REL_X+MEMORY_USAGE_WIDGET_WIDTH,
                                                                                                    MEMORY_USAGE_WIDGET_REL_Y,
                                                                                                    MEMORY_USAGE_WIDGET_REL_Y+MEMORY_USAGE_WIDGET_HEIGHT)
                                                                                                    )
         self.memory_chart = self.window.add(MultiLineWidget,
-                                            name="Memory Usage",
+                                            name="Memory \u28ffmanaged \u28d2unmanaged \u28c0spilled",
                                             relx=MEMORY_USAGE_WIDGET_REL_X,
                                             rely=MEMORY_USAGE_WIDGET_REL_Y,
                                             max_height=MEMORY_USAGE_WIDGET_HEIGHT,
@@ -393,7 +893,7 @@ class PtopGUI(npyscreen.NPSApp):
         CPU_USAGE_WIDGET_REL_X = MEMORY_USAGE_WIDGET_REL_X + MEMORY_USAGE_WIDGET_WIDTH
         CPU_USAGE_WIDGET_REL_Y = MEMORY_USAGE_WIDGET_REL_Y
         CPU_USAGE_WIDGET_HEIGHT = MEMORY_USAGE_WIDGET_HEIGHT
-        CPU_USAGE_WIDGET_WIDTH = MEMORY_USAGE_WIDGET_WIDTH
+        CPU_USAGE_WIDGET_WIDTH = int(25*self.X_SCALING_FACTOR)
         self._logger.info("Trying to draw CPU Usage information box, x1 {0} x2 {1} y1 {2} y2 {3}".format(CPU_USAGE_WIDGET_REL_X,
                                                                                                 CPU_USAGE_WIDGET_REL_X+CPU_USAGE_WIDGET_WIDTH,
                                                                                                 CPU_USAGE_WIDGET_REL_Y,
@@ -410,10 +910,31 @@ class PtopGUI(npyscreen.NPSApp):
         self.cpu_chart.entry_widget.editable = False
 
 
+        ######    Bandwidth widget  #########
+        BANDWIDTH_WIDGET_REL_X = CPU_USAGE_WIDGET_REL_X + CPU_USAGE_WIDGET_WIDTH
+        BANDWIDTH_WIDGET_REL_Y = MEMORY_USAGE_WIDGET_REL_Y
+        BANDWIDTH_WIDGET_HEIGHT = MEMORY_USAGE_WIDGET_HEIGHT
+        BANDWIDTH_WIDGET_WIDTH = OVERVIEW_WIDGET_WIDTH - MEMORY_USAGE_WIDGET_WIDTH - CPU_USAGE_WIDGET_WIDTH
+        self._logger.info("Trying to draw Bandwidth information box, x1 {0} x2 {1} y1 {2} y2 {3}".format(BANDWIDTH_WIDGET_REL_X,
+                                                                                                BANDWIDTH_WIDGET_REL_X+BANDWIDTH_WIDGET_WIDTH,
+                                                                                                BANDWIDTH_WIDGET_REL_Y,
+                                                                                                BANDWIDTH_WIDGET_REL_Y+BANDWIDTH_WIDGET_HEIGHT)
+                                                                                                )
+        self.bandwidth_chart = self.window.add(MultiLineWidget,
+                                               name=BANDWIDTH_TITLE.format(self.bandwidth_scale),
+                                               relx=BANDWIDTH_WIDGET_REL_X,
+                                               rely=BANDWIDTH_WIDGET_REL_Y,
+                                               max_height=BANDWIDTH_WIDGET_HEIGHT,
+                                               max_width=BANDWIDTH_WIDGET_WIDTH
+                                               )
+        self.bandwidth_chart.value = ""
+        self.bandwidth_chart.entry_widget.editable = False
+
+
         ######    Processes Info widget  #########
         PROCESSES_INFO_WIDGET_REL_X = LEFT_OFFSET
         PROCESSES_INFO_WIDGET_REL_Y = CPU_USAGE_WIDGET_REL_Y + CPU_USAGE_WIDGET_HEIGHT
-        PROCESSES_INFO_WIDGET_HEIGHT = int(8*self.Y_SCALING_FACTOR)
+        PROCESSES_INFO_WIDGET_HEIGHT = int(8*self.Y_SCALING_FACTOR)-OVERVIEW_EXTRA_HEIGHT
         PROCESSES_INFO_WIDGET_WIDTH = OVERVIEW_WIDGET_WIDTH
         self._logger.info("Trying to draw Processes information box, x1 {0} x2 {1} y1 {2} y2 {3}".format(PROCESSES_INFO_WIDGET_REL_X,
                                                                                                 PROCESSES_INFO_WIDGET_REL_X+PROCESSES_INFO_WIDGET_WIDTH,
@@ -421,13 +942,16 @@ class PtopGUI(npyscreen.NPSApp):
                                                                                                 PROCESSES_INFO_WIDGET_REL_Y+PROCESSES_INFO_WIDGET_HEIGHT)
                                                                                                 )
         self.processes_table = self.window.add(MultiLineActionWidget,
-                                               name="Workers ( address - nthreads - cpu % - memory used/total MB - read/write MB )",
+                                               name=self.PANEL_TITLES[PANEL],
                                                relx=PROCESSES_INFO_WIDGET_REL_X,
                                                rely=PROCESSES_INFO_WIDGET_REL_Y,
                                                max_height=PROCESSES_INFO_WIDGET_HEIGHT,
                                                max_width=PROCESSES_INFO_WIDGET_WIDTH-1
                                                )
-        self.processes_table.entry_widget.values = []
+        self.worker_table = WorkerTable(self.format_worker_row)
+        self.worker_tables = {WORKERS_PANEL: self.worker_table,
+                              STRAGGLERS_PANEL: WorkerTable(self.format_straggler_row,STRAGGLER_FIELDS)}
+        self.processes_table.entry_widget.values = self.worker_table
         self.processes_table.entry_widget.scroll_exit = False
         self.cpu_chart.entry_widget.editable = False
 
@@ -445,7 +969,10 @@ class PtopGUI(npyscreen.NPSApp):
                                        rely=ACTIONS_WIDGET_REL_Y
                                        )
         #self.actions.value = "^K:Kill\t\t^N:Memory Sort\t\t^T:Time Sort\t\t^R:Reset\t\tg:Top\t\t^Q:Quit\t\t^F:Filter\t\t^L:Process Info"
-        self.actions.value = "^N:Memory Sort\t\t^T:Time Sort\t\t^R:Reset\t\t^Q:Quit"
+        if 'Replay' in self.statistics[self.cluster]:
+            self.actions.value = "^N:Mem Sort\t^A:Tasks\t^L:Clusters\t^E:Self\t[ ]:Seek 10s\t{ }:Seek 5m\t+ -:Speed\t^P:Pause\t^Q:Quit"
+        else:
+            self.actions.value = "^N:Memory Sort\t^R:Reset\t^A:Tasks\t^B:Stragglers\t^L:Clusters\t^E:Self\t^Q:Quit"
         self.actions.display()
         self.actions.editable = False
 
@@ -460,13 +987,13 @@ class PtopGUI(npyscreen.NPSApp):
         '''
         self.CHART_HEIGHT = int(math.floor((CPU_USAGE_WIDGET_HEIGHT-2)*4))
         self.CHART_WIDTH = int(math.floor((CPU_USAGE_WIDGET_WIDTH-2)*2))
-        self._logger.info("Memory and CPU charts dimension, width {0} height {1}".format(self.CHART_WIDTH,
+        self._logger.info("CPU chart dimension, width {0} height {1}".format(self.CHART_WIDTH,
                                                                                          self.CHART_HEIGHT)
                                                                                          )
-
-        # fix for index error
-        self.cpu_array = [0]*self.CHART_WIDTH
-        self.memory_array = [0]*self.CHART_WIDTH
+        # the renderers are filled again from the history on the next update
+        self.cpu_chart_renderer = BrailleChart(self.CHART_WIDTH//2,self.CHART_HEIGHT//4)
+        self.memory_chart_renderer = StackedBrailleChart(MEMORY_USAGE_WIDGET_WIDTH-2,self.CHART_HEIGHT//4)
+        self.bandwidth_chart_renderer = StackedBrailleChart(BANDWIDTH_WIDGET_WIDTH-2,self.CHART_HEIGHT//4)
 
         # add subwidgets to the parent widget
         self.window.edit()
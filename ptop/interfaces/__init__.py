@@ -1 +1,9 @@
-from .GUI import PtopGUI
\ No newline at end of file
+from .batch import BatchWriter
+
+
+def __getattr__(name):
+    # the GUI pulls in curses and npyscreen, it is only imported when asked for
+    if name == 'PtopGUI':
+        from .GUI import PtopGUI
+        return PtopGUI
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__,name))
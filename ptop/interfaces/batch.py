@@ -0,0 +1,172 @@
+'''
+    Headless interface for ptop
+
+    Writes every snapshot collected by the sensors as a JSON line or a CSV row,
+    like top -b. Nothing in here may import curses or npyscreen.
+'''
+
+import csv
+import io
+import json
+import sys
+from time import time
+
+from ptop.constants import CLUSTER_METRICS
+from ptop.utils.instrumentation import instruments, COLLECTOR_METRICS
+
+
+# fields of a row, cluster metrics are read from the sensor values
+SCALAR_FIELDS = ('time','sensor') + tuple(name for name,_ in CLUSTER_METRICS)
+# percentiles in seconds of the instruments of ptop itself, shared by all the sensors
+INSTRUMENT_FIELDS = tuple(name+'_'+q for name in COLLECTOR_METRICS for q in ('p50','p99'))
+# fields holding a list of records, only available as JSON lines
+TABLE_FIELDS = ('workers','tasks','alerts','stragglers')
+# fields read from the load of every worker, which a polling sensor only reads while it tracks the workers
+LOAD_FIELDS = tuple(name for name,(section,_) in CLUSTER_METRICS if section == 'Imbalance')
+FIELDS = SCALAR_FIELDS + INSTRUMENT_FIELDS + TABLE_FIELDS
+DEFAULT_FIELDS = SCALAR_FIELDS
+FORMATS = ('jsonl','csv')
+
+TASK_FIELDS = ('prefix','rate','compute','transfer','nbytes')
+# updates of a sensor failing in a row after which its rows are no longer waited for, a single
+# timeout while connecting is not enough to give up on a cluster
+GIVE_UP_FAILURES = 5
+
+
+class BatchWriter(object):
+    def __init__(self,statistics,stop_event,output=None,fmt='jsonl',fields=None,iterations=None,
+                 flush_interval=1.0):
+        '''
+            :param statistics: Statistics whose sensors are written out
+            :param stop_event: global stop event, set once the iterations are done
+            :param output: file the rows are written to, stdout if None
+            :param fmt: jsonl or csv
+            :param fields: fields of a row, see FIELDS
+            :param iterations: number of snapshots written per sensor, None runs until stopped
+            :param flush_interval: maximum time in seconds a row stays in the write buffer
+        '''
+        fields = tuple(fields or DEFAULT_FIELDS)
+        unknown = [field for field in fields if field not in FIELDS]
+        if unknown:
+            raise ValueError("Unknown fields {0}, valid fields are {1}".format(','.join(unknown),','.join(FIELDS)))
+        if fmt not in FORMATS:
+            raise ValueError("Unknown format {0}, valid formats are {1}".format(fmt,','.join(FORMATS)))
+        if fmt == 'csv' and any(field in TABLE_FIELDS for field in fields):
+            raise ValueError("The {0} fields are only available as jsonl".format(','.join(TABLE_FIELDS)))
+        self.statistics = statistics
+        self.stop_event = stop_event
+        self.output = output
+        self.fmt = fmt
+        self.fields = fields
+        if any(field in INSTRUMENT_FIELDS for field in fields):
+            instruments.enable()
+        # the state of every worker is only read from an aggregating scheduler if it is written out or ranked,
+        # the summary of an aggregating scheduler has the imbalance already
+        for sensor in statistics.plugins:
+            sensor.track_workers = ('workers' in fields or 'stragglers' in fields or
+                                    (getattr(sensor,'aggregate_key',None) is None and
+                                     any(field in LOAD_FIELDS for field in fields)))
+        self.iterations = iterations
+        self.flush_interval = flush_interval
+        self._samples = {} # sensor name -> sample of its history last written
+        self._rows = {} # sensor name -> number of rows written
+        # sensor name -> last error of the sensors given up on, they did not write all their rows
+        self.failed = {}
+
+    def _row(self,name):
+        value = self.statistics.statistics[name]
+        history = self.statistics.history[name]
+        row = {}
+        for field in self.fields:
+            if field == 'time':
+                row[field] = float(history.timestamps(1)[0])
+            elif field == 'sensor':
+                row[field] = name
+            elif field == 'workers':
+                workers = value['Workers']
+                columns = [(column,workers.column(column).tolist()) for column in sorted(workers.columns)]
+                row[field] = [dict([('address',address)] + [(column,values[i]) for column,values in columns])
+                              for i,address in enumerate(workers.addresses)]
+            elif field == 'tasks':
+                row[field] = [dict(zip(TASK_FIELDS,task)) for task in value.get('Tasks',[])]
+            elif field == 'stragglers':
+                imbalance = value.get('Imbalance') or {'stragglers': []}
+                row[field] = [{'worker': address, 'score': score} for address,score in imbalance['stragglers']]
+            elif field == 'alerts':
+                alerts = value.get('Alerts') or {'cluster': [], 'workers': {}}
+                row[field] = ([{'rule': rule, 'worker': None} for rule in alerts['cluster']] +
+                              [{'rule': rule, 'worker': address} for address,rules in sorted(alerts['workers'].items())
+                               for rule in rules])
+            elif field in INSTRUMENT_FIELDS:
+                metric,q = field.rsplit('_',1)
+                row[field] = instruments.summary([metric])[metric][q]
+            else:
+                section,key = dict(CLUSTER_METRICS)[field]
+                row[field] = value.get(section,{}).get(key)
+        return row
+
+    def run(self):
+        '''
+            Write the snapshots as they are collected, blocking until the iterations
+            are done or the stop event is set
+
+            :rtype: True if every sensor wrote its rows, see failed otherwise
+        '''
+        if self.output is None:
+            stream = sys.stdout
+        else:
+            stream = io.open(self.output,'a',buffering=1 << 16,newline='')
+        writer = None
+        if self.fmt == 'csv':
+            writer = csv.DictWriter(stream,self.fields,lineterminator='\n')
+            # a file appended to already has its header
+            if self.output is None or stream.tell() == 0:
+                writer.writeheader()
+
+        seen = 0
+        flushed = time()
+        try:
+            while not self.stop_event.is_set():
+                seen = self.statistics.wait(seen,timeout=self.flush_interval)
+                for name in self.statistics.statistics:
+                    history = self.statistics.history[name]
+                    if history.samples <= self._samples.get(name,0):
+                        continue
+                    if self.iterations is not None and self._rows.get(name,0) >= self.iterations:
+                        continue
+                    # only the latest snapshot of a sensor is written, like on screen
+                    self._samples[name] = history.samples
+                    row = self._row(name)
+                    if writer is None:
+                        stream.write(json.dumps(row,separators=(',',':'),default=float))
+                        stream.write('\n')
+                    else:
+                        writer.writerow(row)
+                    self._rows[name] = self._rows.get(name,0) + 1
+                if time() - flushed >= self.flush_interval:
+                    stream.flush()
+                    flushed = time()
+                if self.iterations is not None and self._done():
+                    break
+        finally:
+            stream.flush()
+            if stream is not sys.stdout:
+                stream.close()
+            self.stop_event.set()
+        return not self.failed
+
+    def _done(self):
+        '''
+            True once every sensor wrote its rows or failed GIVE_UP_FAILURES times in a
+            row, a cluster failing to answer does not hold back the others
+        '''
+        health = self.statistics.collector.health
+        done = True
+        for name in self.statistics.statistics:
+            if self._rows.get(name,0) >= self.iterations:
+                continue
+            if health[name]['failures'] >= GIVE_UP_FAILURES:
+                self.failed[name] = health[name]['error']
+            else:
+                done = False
+        return done
@@ -0,0 +1,130 @@
+'''
+    Incremental braille charts
+
+    The rendered rows of the chart are kept between frames, a new sample shifts
+    them by one cell and only the newly arrived column is computed
+'''
+
+import math
+from collections import deque
+
+
+# bit of the braille dot at (row from the top, column) of a cell
+_DOTS = ((0x01,0x08),
+         (0x02,0x10),
+         (0x04,0x20),
+         (0x40,0x80))
+
+# a cell column is a mask of 4 bits, bit k set if the k-th dot from the bottom is drawn
+# FILLS[h] : mask of a cell column filled with h dots from the bottom
+FILLS = tuple((1 << h)-1 for h in range(5))
+
+# COLUMN_BITS[parity][mask] : bits of the character for a cell column
+COLUMN_BITS = tuple(tuple(sum(_DOTS[3-k][parity] for k in range(4) if mask >> k & 1) for mask in range(16))
+                    for parity in (0,1))
+
+# GLYPHS[left][right] : character of a cell whose columns have the given masks
+GLYPHS = tuple(tuple(chr(0x2800+(COLUMN_BITS[0][left]|COLUMN_BITS[1][right])) if left or right else ' '
+                     for right in range(16))
+               for left in range(16))
+
+
+class BrailleChart(object):
+    '''
+        Scrolling bar chart drawn with braille characters, every cell holds
+        2*4 dots
+    '''
+    def __init__(self,width,height,peak_width=2):
+        '''
+            :param width: width of the chart in cells
+            :param height: height of the chart in cells
+            :param peak_width: width of a sample in dots, 1 or 2
+        '''
+        self.width = width
+        self.height = height
+        self.peak_width = peak_width
+        # number of samples the chart is made of, maintained by the caller
+        self.samples = 0
+        self._rows = [deque(' '*width,maxlen=width) for _ in range(height)]
+        # dots in the left column of the last cell, per row, while its right column is pending
+        self._left = None
+
+    @property
+    def capacity(self):
+        '''
+            number of samples visible on the chart
+        '''
+        return self.width*(2//self.peak_width)
+
+    def _fills(self,value):
+        '''
+            mask of the dots drawn in every row from the top for a value between 0 and 1
+        '''
+        if value != value: # nan
+            value = 0
+        dots = min(max(int(math.ceil(value*self.height*4)),0),self.height*4)
+        return [FILLS[min(max(dots-4*(self.height-1-row),0),4)] for row in range(self.height)]
+
+    def push(self,value):
+        '''
+            Add a sample to the right of the chart
+
+            :param value: height of the sample between 0 and 1
+        '''
+        fills = self._fills(value)
+        if self.peak_width == 2:
+            for row,fill in zip(self._rows,fills):
+                row.append(GLYPHS[fill][fill])
+        elif self._left is None:
+            # a new cell with only its left column set
+            for row,fill in zip(self._rows,fills):
+                row.append(GLYPHS[fill][0])
+            self._left = fills
+        else:
+            for row,left,fill in zip(self._rows,self._left,fills):
+                row[-1] = GLYPHS[left][fill]
+            self._left = None
+
+    def extend(self,values):
+        for value in values:
+            self.push(value)
+
+    def clear(self):
+        for row in self._rows:
+            row.extend(' '*self.width)
+        self._left = None
+        self.samples = 0
+
+    def frame(self):
+        '''
+            :rtype: the chart as a multiline string
+        '''
+        return '\n'.join(''.join(row) for row in self._rows)
+
+
+class StackedBrailleChart(BrailleChart):
+    '''
+        Braille chart of several values stacked on each other, told apart by the
+        density of their dots: the first one is solid, the second has every
+        other dot drawn and the next ones every fourth
+    '''
+    DENSITY = (1,2,4)
+
+    def _fills(self,values):
+        '''
+            mask of the dots drawn in every row from the top for values whose
+            sum is between 0 and 1, the first value at the bottom
+        '''
+        total = self.height*4
+        dots = [False]*total # from the bottom
+        top = 0.
+        start = 0
+        for layer,value in enumerate(values):
+            if value == value and value > 0: # not nan
+                top += value
+            stop = min(max(int(math.ceil(top*total)),start),total)
+            step = self.DENSITY[min(layer,len(self.DENSITY)-1)]
+            for dot in range(start,stop,step):
+                dots[dot] = True
+            start = stop
+        return [sum(1 << k for k in range(4) if dots[4*(self.height-1-row)+k]) for row in range(self.height)]
@@ -0,0 +1,327 @@
+'''
+    OpenMetrics endpoint of ptop
+
+    Serves the latest snapshots of the sensors on /metrics in the OpenMetrics
+    text format, next to the GUI or the batch mode, for a Prometheus compatible
+    scraper. The page is rendered by a background thread once per collection
+    cycle and only for the sensors which published a new snapshot, a scrape
+    sends the last page as it is: it never reaches a scheduler and never
+    formats a value. Values are in base units, bytes, seconds and ratios, as
+    Prometheus expects. Nothing in here may import curses or npyscreen.
+'''
+
+import logging
+import math
+import threading
+
+import numpy as np
+
+from ptop.plugins.scheduler_feed import PERCENTILES
+
+logger = logging.getLogger('ptop.interfaces.openmetrics')
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+PREFIX = 'ptop_'
+
+MB = 1024.**2
+# the sensors keep the cluster values in MB, MB/s and percents, Prometheus wants bytes and ratios
+CLUSTER_METRICS = (
+    # family, (section, key) of the values of a sensor, scale to the base unit, help
+    ('cpu_usage_ratio',                 ('CPU','cpu_usage'),               0.01,
+     'mean cpu usage of the workers, 1 is one core fully used'),
+    ('used_memory_bytes',               ('Memory','used_memory'),          MB,
+     'memory used by the worker processes'),
+    ('total_memory_bytes',              ('Memory','total_memory'),         MB,
+     'sum of the memory limits of the workers'),
+    ('used_memory_ratio',               ('Memory','used_memory_percent'),  1,
+     'memory used by the worker processes over the sum of their memory limits'),
+    ('managed_memory_bytes',            ('Memory','managed_memory'),       MB,
+     'data held in memory by the workers'),
+    ('unmanaged_memory_bytes',          ('Memory','unmanaged_memory'),     MB,
+     'memory of the worker processes not holding data, the interpreter, libraries and leaks'),
+    ('spilled_memory_bytes',            ('Memory','spilled_memory'),       MB,
+     'data spilled to disk by the workers'),
+    ('managed_memory_ratio',            ('Memory','managed_memory_percent'),   1,
+     'data held in memory over the sum of the memory limits of the workers'),
+    ('unmanaged_memory_ratio',          ('Memory','unmanaged_memory_percent'), 1,
+     'unmanaged memory over the sum of the memory limits of the workers'),
+    ('spilled_memory_ratio',            ('Memory','spilled_memory_percent'),   1,
+     'data spilled to disk over the sum of the memory limits of the workers'),
+    ('spill_bytes_per_second',          ('Memory','spill_rate'),           MB,
+     'data spilled to disk per second'),
+    ('unspill_bytes_per_second',        ('Memory','unspill_rate'),         MB,
+     'spilled data read back from disk per second'),
+    ('net_read_bytes_per_second',       ('Bandwidth','net_read_rate'),     MB,
+     'smoothed bytes received per second by the hosts of the workers'),
+    ('net_write_bytes_per_second',      ('Bandwidth','net_write_rate'),    MB,
+     'smoothed bytes sent per second by the hosts of the workers'),
+    ('disk_read_bytes_per_second',      ('Bandwidth','disk_read_rate'),    MB,
+     'smoothed bytes read from disk per second by the hosts of the workers'),
+    ('disk_write_bytes_per_second',     ('Bandwidth','disk_write_rate'),   MB,
+     'smoothed bytes written to disk per second by the hosts of the workers'),
+    ('transfers_in_per_second',         ('Bandwidth','transfer_in_rate'),  1,
+     'smoothed transfers received from other workers per second'),
+    ('transfers_out_per_second',        ('Bandwidth','transfer_out_rate'), 1,
+     'smoothed transfers sent to other workers per second'),
+    ('workers',                         ('Cluster','n_workers'),           1,
+     'workers connected to the scheduler'),
+    ('paused_workers',                  ('Cluster','n_paused'),            1,
+     'workers paused because they are short of memory'),
+    ('threads',                         ('Cluster','total_threads'),       1,
+     'threads of all the workers'),
+    ('executing_tasks',                 ('Cluster','tasks_executing'),     1,
+     'tasks running on the workers'),
+    ('ready_tasks',                     ('Cluster','tasks_ready'),         1,
+     'tasks waiting for a thread of a worker'),
+    ('load_cv',                         ('Imbalance','load_cv'),           1,
+     'coefficient of variation of the seconds of work assigned per thread of the workers'),
+    ('load_max_median_ratio',           ('Imbalance','load_max_median'),   1,
+     'largest over median seconds of work assigned per thread of the workers'),
+    ('processing_cv',                   ('Imbalance','processing_cv'),     1,
+     'coefficient of variation of the number of tasks assigned to the workers'),
+    ('processing_max_median_ratio',     ('Imbalance','processing_max_median'), 1,
+     'largest over median number of tasks assigned to the workers'),
+    ('stragglers',                      ('Imbalance','n_stragglers'),      1,
+     'workers whose smoothed load is far above the load of the others'),
+)
+
+# worker columns exported per worker, byte columns are in bytes and bytes per second already
+WORKER_METRICS = (
+    # column of the snapshot, family, scale to the base unit, help
+    ('cpu',               'worker_cpu_ratio',                   0.01,
+     'cpu usage of the worker, 1 is one core fully used'),
+    ('memory',            'worker_memory_bytes',                1,
+     'memory used by the worker process'),
+    ('memory_limit',      'worker_memory_limit_bytes',          1,
+     'memory limit of the worker'),
+    ('managed',           'worker_managed_memory_bytes',        1,
+     'data held in memory by the worker'),
+    ('spilled',           'worker_spilled_memory_bytes',        1,
+     'data spilled to disk by the worker'),
+    ('spill_rate',        'worker_spill_bytes_per_second',      1,
+     'data spilled to disk per second by the worker'),
+    ('unspill_rate',      'worker_unspill_bytes_per_second',    1,
+     'spilled data read back from disk per second by the worker'),
+    ('net_read_rate',     'worker_net_read_bytes_per_second',   1,
+     'smoothed bytes received per second by the host of the worker'),
+    ('net_write_rate',    'worker_net_write_bytes_per_second',  1,
+     'smoothed bytes sent per second by the host of the worker'),
+    ('disk_read_rate',    'worker_disk_read_bytes_per_second',  1,
+     'smoothed bytes read from disk per second by the host of the worker'),
+    ('disk_write_rate',   'worker_disk_write_bytes_per_second', 1,
+     'smoothed bytes written to disk per second by the host of the worker'),
+    ('transfer_in_rate',  'worker_transfers_in_per_second',     1,
+     'smoothed transfers received from other workers per second'),
+    ('transfer_out_rate', 'worker_transfers_out_per_second',    1,
+     'smoothed transfers sent to other workers per second'),
+    ('executing',         'worker_executing_tasks',             1,
+     'tasks running on the worker'),
+    ('ready',             'worker_ready_tasks',                 1,
+     'tasks waiting for a thread of the worker'),
+    ('processing',        'worker_processing_tasks',            1,
+     'tasks the scheduler assigned to the worker'),
+    ('load',              'worker_load_seconds',                1,
+     'seconds of work the scheduler assigned per thread of the worker'),
+    ('straggler_score',   'worker_straggler_score',             1,
+     'smoothed robust z-score of the load of the worker, a straggler from 3.5'),
+)
+
+
+def _escape(value):
+    return str(value).replace('\\','\\\\').replace('"','\\"').replace('\n','\\n')
+
+
+def _number(value,scale=1):
+    '''
+        A sample value as OpenMetrics spells it
+
+        :param scale: factor to the base unit of the metric
+    '''
+    if value is None:
+        return 'NaN'
+    value = float(value)*scale
+    if scale > 1 and math.isfinite(value):
+        # scaled back to bytes from rounded MB, the fraction of a byte is noise
+        value = float(round(value))
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+
+def _numbers(column):
+    '''
+        The values of a numpy column as OpenMetrics spells them
+    '''
+    if not np.isfinite(column).all():
+        return map(_number,column.tolist())
+    # byte sizes and task counts are whole numbers, much cheaper to format as integers
+    integral = column.astype(np.int64)
+    if np.array_equal(integral,column):
+        return map(str,integral.tolist())
+    return map(repr,column.tolist())
+
+
+def _percentiles(values):
+    '''
+        PERCENTILES of the cpu of the workers in percent of a core, from the summary
+        of an aggregating scheduler or from the workers themselves
+    '''
+    summary = values.get('Summary')
+    if summary is not None:
+        return summary['percentiles']['cpu']
+    cpu = values['Workers'].column('cpu')
+    # a worker which did not report its cpu yet has no rank
+    cpu = np.sort(cpu[np.isfinite(cpu)]).tolist()
+    if not cpu:
+        return None
+    # same selection as the scheduler uses, so both modes agree
+    return [cpu[min(len(cpu)-1,int(q/100.*len(cpu)))] for q in PERCENTILES]
+
+
+# metric family -> (type, help), in the order of the page
+FAMILIES = (tuple((name,('gauge',description)) for name,_,_,description in CLUSTER_METRICS) +
+            (('worker_cpu_ratio_quantile',('gauge','quantiles of the cpu usage of the workers, 1 is one core fully used')),
+             ('update_timestamp_seconds',('gauge','unix time of the last update of the sensor'))) +
+            tuple((family,('gauge',description)) for _,family,_,description in WORKER_METRICS))
+
+
+def worker_labels(name,workers):
+    '''
+        Labels of the samples of every worker of a snapshot
+    '''
+    cluster = 'cluster="{0}"'.format(_escape(name))
+    return ['{{{0},worker="{1}"}} '.format(cluster,_escape(address)) for address in workers.addresses]
+
+
+def render_sensor(name,values,updated,labels=None):
+    '''
+        Samples of a sensor
+
+        :param name: name of the sensor, its cluster label
+        :param values: snapshot of the values of the sensor
+        :param updated: time of the snapshot
+        :param labels: worker_labels of the workers of the snapshot, if they are known already
+        :rtype: dict of metric family -> its sample lines
+    '''
+    cluster = 'cluster="{0}"'.format(_escape(name))
+    samples = {}
+    for metric,(section,key),scale,_ in CLUSTER_METRICS:
+        value = (values.get(section) or {}).get(key)
+        if value is not None:
+            samples[metric] = '{0}{1}{{{2}}} {3}\n'.format(PREFIX,metric,cluster,_number(value,scale))
+    percentiles = _percentiles(values)
+    if percentiles is not None:
+        samples['worker_cpu_ratio_quantile'] = ''.join('{0}worker_cpu_ratio_quantile{{{1},quantile="{2}"}} {3}\n'.format(
+                                                       PREFIX,cluster,q/100.,_number(value,0.01))
+                                                       for q,value in zip(PERCENTILES,percentiles))
+    samples['update_timestamp_seconds'] = '{0}update_timestamp_seconds{{{1}}} {2}\n'.format(PREFIX,cluster,
+                                                                                            _number(updated))
+
+    workers = values['Workers']
+    if not len(workers):
+        return samples
+    # a family is its name followed by the labels and the value of every worker
+    if labels is None:
+        labels = worker_labels(name,workers)
+    for column,metric,scale,_ in WORKER_METRICS:
+        if column not in workers.columns:
+            continue
+        family = PREFIX+metric
+        values = workers.column(column)
+        texts = _numbers(values*scale if scale != 1 else values)
+        samples[metric] = family+('\n'+family).join([label+text for label,text in zip(labels,texts)])+'\n'
+    return samples
+
+
+class MetricsExporter(object):
+    def __init__(self,statistics,stop_event,port,host=''):
+        '''
+            :param statistics: Statistics whose snapshots are served
+            :param stop_event: global stop event, the page is no longer rendered once set
+            :param port: port the endpoint listens on
+            :param host: interface the endpoint listens on, all of them by default
+        '''
+        # the http server pulls in half of the standard library, it is only imported when serving
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.statistics = statistics
+        self.stop_event = stop_event
+        self._samples = {} # sensor name -> (version, samples)
+        self._labels = {} # sensor name -> (layout of its workers, worker_labels)
+        self.page = self._page()
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?',1)[0] not in ('/','/metrics'):
+                    self.send_error(404)
+                    return
+                # the page is swapped in whole by the renderer, the one read here is complete
+                page = exporter.page
+                self.send_response(200)
+                self.send_header('Content-Type',CONTENT_TYPE)
+                self.send_header('Content-Length',str(len(page)))
+                self.end_headers()
+                self.wfile.write(page)
+
+            def log_message(self,format,*args):
+                logger.debug("%s - %s",self.address_string(),format % args)
+
+        # raises OSError if the port is taken, before anything else is started
+        self.server = ThreadingHTTPServer((host,port),Handler)
+        self.server.daemon_threads = True
+        self._threads = []
+
+    def _page(self):
+        '''
+            Render the sensors which published a new snapshot and assemble the page
+        '''
+        for name,version in list(self.statistics.versions.items()):
+            cached = self._samples.get(name)
+            if cached is not None and cached[0] == version:
+                continue
+            history = self.statistics.history[name]
+            updated = float(history.timestamps(1)[0]) if history.samples else None
+            values = self.statistics.statistics[name]
+            # the labels only change with the workers
+            layout = values['Workers'].layout
+            labels = self._labels.get(name)
+            if labels is None or labels[0] != layout:
+                labels = self._labels[name] = (layout,worker_labels(name,values['Workers']))
+            self._samples[name] = (version,render_sensor(name,values,updated,labels[1]))
+        # the samples of a family are grouped together, whichever sensor they come from
+        lines = []
+        for family,(kind,description) in FAMILIES:
+            lines.append('# TYPE {0}{1} {2}\n# HELP {0}{1} {3}\n'.format(PREFIX,family,kind,description))
+            for name in sorted(self._samples):
+                lines.append(self._samples[name][1].get(family,''))
+        lines.append('# EOF\n')
+        return ''.join(lines).encode('utf-8')
+
+    def _render(self):
+        seen = 0
+        while not self.stop_event.is_set():
+            updates = self.statistics.wait(seen,timeout=1.0)
+            if updates == seen:
+                continue
+            seen = updates
+            try:
+                self.page = self._page()
+            except Exception:
+                logger.warning("Unable to render the metrics",exc_info=True)
+
+    def start(self):
+        '''
+            Serve the endpoint and keep its page up to date in background threads
+        '''
+        for target in (self.server.serve_forever,self._render):
+            thread = threading.Thread(target=target,name='ptop-metrics',daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info("Serving the metrics on {0}:{1}".format(*self.server.server_address[:2]))
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
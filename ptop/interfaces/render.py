@@ -0,0 +1,85 @@
+'''
+    Render pipeline for the ptop form
+
+    Widgets are staged with their new content, only the ones whose content differs
+    from what was last drawn are updated and the changes are flushed to the terminal
+    in one go with noutrefresh/doupdate semantics. A full repaint is only done on
+    the first frame and after the form was invalidated, i.e after a resize.
+'''
+
+import curses
+import logging
+
+
+class RenderPipeline(object):
+    def __init__(self,form):
+        '''
+            :param form: npyscreen form holding the widgets
+        '''
+        self.form = form
+        # id of the widget -> content last drawn, widgets of a form are weak proxies
+        # and cannot be hashed
+        self._drawn = {}
+        self._dirty = []
+        self._full_repaint = True
+        self._logger = logging.getLogger(__name__)
+
+    def stage(self,widget,content,attribute='value',signature=None):
+        '''
+            Set the content of a widget, marking it dirty only if it changed
+
+            :param widget: npyscreen widget
+            :param content: new content of the widget
+            :param attribute: attribute of the widget holding the content
+            :param signature: compared instead of the content when given, for contents
+                              which are expensive to compare or mutated in place
+            :rtype: True if the widget needs to be redrawn
+        '''
+        key = id(widget)
+        if signature is None:
+            signature = content
+        if key in self._drawn and self._drawn[key] == signature:
+            return False
+        setattr(widget,attribute,content)
+        self._drawn[key] = signature
+        if not any(dirty is widget for dirty in self._dirty):
+            self._dirty.append(widget)
+        return True
+
+    def invalidate(self):
+        '''
+            Force a full repaint on the next flush
+        '''
+        self._full_repaint = True
+
+    def flush(self):
+        '''
+            Draw the dirty widgets and push the changed regions to the terminal
+
+            :rtype: number of widgets redrawn
+        '''
+        if self._full_repaint:
+            self._full_repaint = False
+            self._dirty = []
+            self.form.DISPLAY()
+            return len(self._drawn)
+
+        if not self._dirty:
+            return 0
+        redrawn = len(self._dirty)
+        for widget in self._dirty:
+            widget.update(clear=True)
+        self._dirty = []
+
+        # only the lines touched by the updates are copied to the virtual screen
+        # and doupdate sends the difference with the physical screen
+        max_y,max_x = self.form._max_physical()
+        try:
+            self.form.curses_pad.noutrefresh(self.form.show_from_y,self.form.show_from_x,
+                                             self.form.show_aty,self.form.show_atx,
+                                             max_y,max_x)
+            curses.doupdate()
+        except curses.error:
+            self._logger.info("Partial refresh failed, repainting the form",exc_info=True)
+            self.invalidate()
+        return redrawn
@@ -0,0 +1,106 @@
+'''
+    Virtualized worker table
+
+    The table keeps the sorted order of the workers as an index and formats a row
+    only when the widget asks for it, i.e for the rows inside the scroll window.
+    Formatted rows are cached per worker until the displayed metrics or the alerts
+    of that worker change.
+'''
+
+import numpy as np
+
+from ptop.core.snapshot import BYTE_COLUMNS, MB, WorkerRecord
+
+# columns of the snapshot shown in a row, a row is formatted again only if one of them changed
+ROW_FIELDS = ('nthreads','cpu','memory','memory_limit','net_read_rate','net_write_rate','spilled','spill_rate','paused')
+# same for a row of the stragglers table
+STRAGGLER_FIELDS = ('straggler_score','load','processing','ready','executing','cpu')
+
+
+class WorkerTable(object):
+    def __init__(self,row_format,fields=ROW_FIELDS):
+        '''
+            :param row_format: function formatting a WorkerRecord and the names of its alerts into a row
+            :param fields: columns shown in a row
+        '''
+        self.row_format = row_format
+        self.fields = fields
+        # bumped whenever the rows or their order change
+        self.version = 0
+        self._workers = None # WorkerSnapshot
+        self._layout = None
+        self._order = np.zeros(0,dtype=np.int64) # rows of the snapshot in display order
+        self._display = np.zeros((0,len(fields))) # displayed values, one line per row of the snapshot
+        self._alerts = {} # address -> names of the rules firing on the worker
+        self._rows = {} # address -> (displayed values, alerts, formatted row)
+
+    def set_workers(self,workers,sort_key=None,reverse=False,alerts=None):
+        '''
+            Replace the workers of the table
+
+            :param workers: WorkerSnapshot
+            :param sort_key: column the rows are sorted on, None keeps the order of the snapshot
+            :param reverse: sort in the descending order
+            :param alerts: dict of address -> names of the rules firing on the worker
+            :rtype: True if the table changed
+        '''
+        display = np.empty((len(workers),len(self.fields)))
+        for i,field in enumerate(self.fields):
+            column = workers.column(field)
+            display[:,i] = np.round(column/MB,2) if field in BYTE_COLUMNS else column
+        if sort_key is None:
+            order = np.arange(len(workers))
+        else:
+            order = workers.argsort(sort_key,reverse)
+
+        alerts = alerts or {}
+        changed = (workers.layout != self._layout or
+                   alerts != self._alerts or
+                   not np.array_equal(display,self._display) or
+                   not np.array_equal(order,self._order))
+
+        if workers.layout != self._layout:
+            # drop the cached rows of the workers which left
+            present = set(workers.addresses)
+            for address in [a for a in self._rows if a not in present]:
+                del self._rows[address]
+
+        self._workers = workers
+        self._layout = workers.layout
+        self._order = order
+        self._display = display
+        self._alerts = alerts
+        if changed:
+            self.version += 1
+        return changed
+
+    def address(self,index):
+        return self._workers.addresses[self._order[index]]
+
+    def alerting(self,index):
+        '''
+            :rtype: True if a rule fires on the worker of the row at index
+        '''
+        return 0 <= index < len(self._order) and self.address(index) in self._alerts
+
+    def __len__(self):
+        return len(self._order)
+
+    def __getitem__(self,index):
+        if index < 0:
+            index += len(self._order)
+        if not 0 <= index < len(self._order):
+            raise IndexError('worker table index out of range')
+        row = int(self._order[index])
+        address = self._workers.addresses[row]
+        key = self._display[row].tobytes()
+        alerts = tuple(self._alerts.get(address,()))
+        cached = self._rows.get(address)
+        if cached is None or cached[0] != key or cached[1] != alerts:
+            cached = (key,alerts,self.row_format(WorkerRecord(self._workers,row),alerts))
+            self._rows[address] = cached
+        return cached[2]
+
+    def __iter__(self):
+        for index in range(len(self._order)):
+            yield self[index]
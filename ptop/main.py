@@ -1,6 +1,5 @@
 import threading
 import logging
-import requests
 import argparse
 import sys
 import string
@@ -8,13 +7,13 @@ import random
 import os
 import platform
 
+# only what the argument parsing needs is imported up front, numpy, dask and the
+# interface are imported once it is known which of them the command uses
 from ptop import __version__, _log_file
-from ptop.statistics import Statistics
-from ptop.interfaces import PtopGUI
-from ptop.constants import SUPPORTED_THEMES
-from huepy import *
-
-from ptop.plugins.dask_sensor import DaskSensor
+from ptop.interfaces.batch import FIELDS, FORMATS, DEFAULT_FIELDS, INSTRUMENT_FIELDS
+from ptop.constants import SUPPORTED_THEMES, AGGREGATE_KEYS
+from ptop.utils.instrumentation import instruments
+from ptop.utils.logs import configure_logging, LEVELS
 
 # Backwards compatibility for string input operation
 try:
@@ -30,6 +29,8 @@ def _update():
         Try to update ptop at application start after asking the user
     '''
     try:
+        import requests
+        from huepy import blue, green, red
         CURRENT_VERSION = str(__version__)
         os_name = "{0} {1}".format(platform.system(),
                                    platform.release()
@@ -65,24 +66,92 @@ def _update():
 
 
 
+def _parse_address(address):
+    '''
+        Split a "name=address" command line address
+
+        :rtype: (name, address, timeout) of a cluster, the address is its name if none is given
+    '''
+    name,_,rest = address.partition('=')
+    if rest:
+        return name,rest,None
+    return address,address,None
+
+
+def _read_clusters(path):
+    '''
+        Read a cluster file, one cluster per line as "address", "name address" or
+        "name address timeout", blank lines and lines starting with # are skipped
+
+        :rtype: list of (name, address, timeout in seconds or None)
+    '''
+    clusters = []
+    with open(path) as f:
+        for number,line in enumerate(f,1):
+            fields = line.split('#',1)[0].split()
+            if not fields:
+                continue
+            if len(fields) == 1:
+                clusters.append((fields[0],fields[0],None))
+            elif len(fields) in (2,3):
+                try:
+                    timeout = float(fields[2])/1000 if len(fields) == 3 else None
+                except ValueError:
+                    raise ValueError("{0}:{1}: invalid timeout {2}".format(path,number,fields[2]))
+                clusters.append((fields[0],fields[1],timeout))
+            else:
+                raise ValueError("{0}:{1}: expected address, name address or name address timeout".format(path,number))
+    return clusters
+
+
 def main():
     try:
         # app wide global stop flag
         global_stop_event = threading.Event()
+        s = None
+        log_writer = None
 
         # command line argument parsing
         parser = argparse.ArgumentParser(description='ptop argument parser')
         
         parser.add_argument('-a','--address',
                             dest='dask_address',
-                            action='store',
+                            action='append',
                             type=str,
-                            required=True,
+                            required=False,
                             help=
                             '''
-                                dask-distributed scheduler address.
+                                dask-distributed scheduler address, can be repeated
+                                for monitoring several clusters and prefixed by a
+                                name. Required unless a cluster file is given or a
+                                recording is replayed.
                                 
-                                ie. 127.0.0.1:324597
+                                ie. 127.0.0.1:324597 or team=127.0.0.1:324597
+                            ''')
+
+        parser.add_argument('-c','--clusters',
+                            dest='clusters',
+                            action='store',
+                            type=str,
+                            required=False,
+                            metavar='FILE',
+                            help=
+                            '''
+                                File listing the clusters to monitor, one per line
+                                as "address", "name address" or "name address timeout"
+                                with the timeout in milliseconds
+                            ''')
+
+        parser.add_argument('--concurrency',
+                            dest='concurrency',
+                            action='store',
+                            type=int,
+                            default=8,
+                            required=False,
+                            help=
+                            '''
+                                Maximum number of clusters polled at the same time
+                                Default 8
                             ''')
 
         parser.add_argument('-r','--refresh',
@@ -97,6 +166,42 @@ def main():
                                 Default 500
                             ''')
                             
+        parser.add_argument('--min-refresh',
+                            dest='min_refresh',
+                            action='store',
+                            type=float,
+                            required=False,
+                            help=
+                            '''
+                                Shortest refresh rate in milliseconds ptop tightens
+                                to while the cluster changes quickly
+                                Default half the refresh rate
+                            ''')
+
+        parser.add_argument('--max-refresh',
+                            dest='max_refresh',
+                            action='store',
+                            type=float,
+                            required=False,
+                            help=
+                            '''
+                                Longest refresh rate in milliseconds ptop backs off
+                                to while the cluster is idle or slow to answer
+                                Default 8 times the refresh rate
+                            ''')
+
+        parser.add_argument('--timeout',
+                            dest='timeout',
+                            action='store',
+                            type=float,
+                            default=2000,
+                            required=False,
+                            help=
+                            '''
+                                Deadline in milliseconds for a single scheduler call
+                                Default 2000
+                            ''')
+
         parser.add_argument('-t','--theme',
                             dest='theme',
                             action='store',
@@ -114,29 +219,346 @@ def main():
                                  blackonwhite
                             ''')
                             
+        parser.add_argument('-s','--subscribe',
+                            dest='subscribe',
+                            action='store_true',
+                            required=False,
+                            help=
+                            '''
+                                Let the scheduler push only the worker fields that
+                                changed instead of polling the full worker state
+                            ''')
+
+        parser.add_argument('--aggregate',
+                            dest='aggregate',
+                            action='store',
+                            nargs='?',
+                            const='memory',
+                            choices=AGGREGATE_KEYS,
+                            required=False,
+                            metavar='KEY',
+                            help=
+                            '''
+                                Let the scheduler reduce the state of the workers
+                                to totals, percentiles and the --top workers with
+                                the largest KEY, among {0}. The full state is only
+                                read while the workers are shown. Default memory
+                            '''.format(', '.join(AGGREGATE_KEYS)))
+
+        parser.add_argument('--top',
+                            dest='top',
+                            action='store',
+                            type=int,
+                            default=20,
+                            required=False,
+                            help=
+                            '''
+                                Number of workers sent by the scheduler with
+                                --aggregate, default 20
+                            ''')
+
+        parser.add_argument('--record',
+                            dest='record',
+                            action='store',
+                            type=str,
+                            required=False,
+                            metavar='FILE',
+                            help=
+                            '''
+                                Append everything ptop collects to FILE
+                                for replaying it later with --replay
+                            ''')
+
+        parser.add_argument('--record-interval',
+                            dest='record_interval',
+                            action='store',
+                            type=float,
+                            default=0,
+                            required=False,
+                            help=
+                            '''
+                                Minimum time in seconds between two recorded
+                                snapshots, default 0 records every snapshot
+                            ''')
+
+        parser.add_argument('--replay',
+                            dest='replay',
+                            action='store',
+                            type=str,
+                            required=False,
+                            metavar='FILE',
+                            help=
+                            '''
+                                Play back a file written with --record
+                                instead of connecting to a scheduler
+                            ''')
+
+        parser.add_argument('--rule',
+                            dest='rules',
+                            action='append',
+                            required=False,
+                            metavar='RULE',
+                            help=
+                            '''
+                                Alert when RULE holds, e.g.
+                                'hot: memory/memory_limit > 90%% for 30s',
+                                repeat for several rules
+                            ''')
+
+        parser.add_argument('--rules',
+                            dest='rules_file',
+                            action='store',
+                            type=str,
+                            required=False,
+                            metavar='FILE',
+                            help=
+                            '''
+                                Alert on the rules listed in FILE, one per line
+                            ''')
+
+        parser.add_argument('--alert-log',
+                            dest='alert_log',
+                            action='store',
+                            type=str,
+                            required=False,
+                            metavar='FILE',
+                            help=
+                            '''
+                                Append the alerts to FILE, one JSON object per line
+                            ''')
+
+        parser.add_argument('--alert-hook',
+                            dest='alert_hook',
+                            action='store',
+                            type=str,
+                            required=False,
+                            metavar='COMMAND',
+                            help=
+                            '''
+                                Run the shell COMMAND on every alert, the alert is
+                                in PTOP_RULE, PTOP_STATE, PTOP_SENSOR and PTOP_WORKER
+                            ''')
+
+        parser.add_argument('--serve-metrics',
+                            dest='serve_metrics',
+                            action='store',
+                            type=str,
+                            required=False,
+                            metavar='[HOST:]PORT',
+                            help=
+                            '''
+                                Serve the latest values on http://HOST:PORT/metrics
+                                in the OpenMetrics format, with the interface or
+                                the batch mode. HOST is every interface by default
+                            ''')
+
+        parser.add_argument('-b','--batch',
+                            dest='batch',
+                            action='store_true',
+                            required=False,
+                            help=
+                            '''
+                                Batch mode, write every snapshot to the output
+                                instead of starting the interface
+                            ''')
+
+        parser.add_argument('-n','--iterations',
+                            dest='iterations',
+                            action='store',
+                            type=int,
+                            required=False,
+                            help=
+                            '''
+                                Number of snapshots written in batch mode
+                                before exiting, default runs until interrupted
+                            ''')
+
+        parser.add_argument('-o','--output',
+                            dest='output',
+                            action='store',
+                            type=str,
+                            required=False,
+                            metavar='FILE',
+                            help=
+                            '''
+                                File the batch mode appends to, default stdout
+                            ''')
+
+        parser.add_argument('--format',
+                            dest='format',
+                            action='store',
+                            type=str,
+                            default='jsonl',
+                            required=False,
+                            choices=FORMATS,
+                            help=
+                            '''
+                                Format of the batch mode output
+                                Default jsonl
+                            ''')
+
+        parser.add_argument('--fields',
+                            dest='fields',
+                            action='store',
+                            type=str,
+                            required=False,
+                            help=
+                            '''
+                                Comma separated fields written in batch mode,
+                                among {0}
+                            '''.format(', '.join(FIELDS)))
+
+        parser.add_argument('--instrument',
+                            dest='instrument',
+                            action='store_true',
+                            help=
+                            '''
+                                Measure ptop itself, adds the percentiles of the
+                                scheduler round trips and sensor updates to the
+                                default fields of the batch mode
+                            ''')
+
+        parser.add_argument('--log-level',
+                            dest='log_level',
+                            action='store',
+                            type=str.upper,
+                            default='INFO',
+                            required=False,
+                            choices=LEVELS,
+                            help=
+                            '''
+                                Lowest level written to ~/.ptop.log, the messages
+                                repeated on every refresh are at the DEBUG level
+                                Default INFO
+                            ''')
+
         parser.add_argument('-v','--version',
                             action='version',
                             version='ptop {}'.format(__version__))
 
         results = parser.parse_args()
+        if not results.replay and not results.dask_address and not results.clusters:
+            parser.error('a scheduler address, a cluster file or a recording to replay is required')
+        if results.replay and results.record:
+            parser.error('--record and --replay cannot be used together')
+        if results.aggregate and results.subscribe:
+            parser.error('--aggregate and --subscribe cannot be used together')
+
+        log_writer = configure_logging(_log_file,results.log_level)
+        from ptop.statistics import (Statistics, Recorder, RecordingReader, RecordingError, Rule, RuleEngine, RuleError,
+                                     AlertLog, AlertHook, read_rules)
+        from ptop.interfaces import BatchWriter
 
         # commandline arguments massaging
         theme = (results.theme if results.theme else 'elegant')
         refresh_rate = results.refresh
+        # sensor intervals are in seconds
+        interval = refresh_rate/1000
+        min_interval = (results.min_refresh if results.min_refresh is not None else refresh_rate/2)/1000
+        max_interval = (results.max_refresh if results.max_refresh is not None else refresh_rate*8)/1000
         
-        dask_sensor = DaskSensor(name='Dask', dask_address = results.dask_address, sensorType=None, interval=0.5)
-        SENSORS_LIST = [dask_sensor]
+        if results.replay:
+            from ptop.plugins.replay_sensor import ReplaySensor
+            try:
+                reader = RecordingReader(results.replay)
+                # a recording is played back at a fixed rate
+                SENSORS_LIST = [ReplaySensor(results.replay, recorded_name=name, name=name, sensorType=None, interval=interval)
+                                for name in reader.names()]
+            except (IOError, RecordingError) as e:
+                parser.error(str(e))
+            if not SENSORS_LIST:
+                parser.error('nothing to replay in {0}'.format(results.replay))
+        else:
+            # dask itself is imported by the collector, while the interface is already drawn
+            from ptop.plugins.dask_sensor import DaskSensor
+            clusters = [_parse_address(address) for address in results.dask_address or []]
+            if results.clusters:
+                try:
+                    clusters.extend(_read_clusters(results.clusters))
+                except (IOError, ValueError) as e:
+                    parser.error(str(e))
+            names = [name for name,_,_ in clusters]
+            if len(set(names)) != len(names):
+                parser.error('cluster names must be unique')
+            SENSORS_LIST = [DaskSensor(name=name, dask_address = address, subscribe = results.subscribe, asynchronous=True,
+                                       timeout=timeout, aggregate=results.aggregate, top=results.top, sensorType=None, interval=interval,
+                                       min_interval=min_interval, max_interval=max_interval)
+                            for name,address,timeout in clusters]
+        recorder = Recorder(results.record,results.record_interval) if results.record else None
+
+        rules = None
+        texts = list(results.rules or [])
+        if results.rules_file:
+            try:
+                texts.extend(read_rules(results.rules_file))
+            except IOError as e:
+                parser.error(str(e))
+        if texts:
+            try:
+                parsed = [Rule(text) for text in texts]
+            except RuleError as e:
+                parser.error(str(e))
+            sinks = []
+            if results.alert_log:
+                sinks.append(AlertLog(results.alert_log))
+            if results.alert_hook:
+                sinks.append(AlertHook(results.alert_hook))
+            rules = RuleEngine(parsed,sinks)
+        elif results.alert_log or results.alert_hook:
+            parser.error('--alert-log and --alert-hook need --rule or --rules')
 
-        sensor_refresh_rates = {SENSORS_LIST[i]: refresh_rate for i in range(len(SENSORS_LIST))}
+        sensor_refresh_rates = {SENSORS_LIST[i]: SENSORS_LIST[i].interval*1000 for i in range(len(SENSORS_LIST))}
 
         # TODO ::  Catch the exception of the child thread and kill the application gracefully
         # https://stackoverflow.com/questions/2829329/catch-a-threads-exception-in-the-caller-thread-in-python
-        s = Statistics(SENSORS_LIST,global_stop_event,sensor_refresh_rates)
-        # internally uses a thread Job 
+        s = Statistics(SENSORS_LIST,global_stop_event,sensor_refresh_rates,results.timeout,recorder=recorder,
+                       concurrency=results.concurrency,rules=rules)
+
+        if results.batch:
+            try:
+                if results.fields:
+                    fields = results.fields.split(',')
+                elif results.instrument:
+                    fields = DEFAULT_FIELDS + INSTRUMENT_FIELDS
+                else:
+                    fields = None
+                batch = BatchWriter(s,global_stop_event,results.output,results.format,fields,results.iterations)
+            except ValueError as e:
+                parser.error(str(e))
+
+        if results.serve_metrics:
+            from ptop.interfaces.openmetrics import MetricsExporter
+            host,_,port = results.serve_metrics.rpartition(':')
+            try:
+                exporter = MetricsExporter(s,global_stop_event,int(port),host)
+            except ValueError:
+                parser.error('invalid --serve-metrics {0}, expected [HOST:]PORT'.format(results.serve_metrics))
+            except OSError as e:
+                parser.error('unable to serve the metrics on {0}: {1}'.format(results.serve_metrics,e))
+            exporter.start()
+
+        # internally runs an asyncio event loop in a background thread
+        if results.instrument:
+            instruments.enable()
+
         s.generate()
         logger.info('Statistics generating started')
 
-        app = PtopGUI(s.statistics,global_stop_event,theme,sensor_refresh_rates)
+        if results.batch:
+            # blocking call, curses is never touched in batch mode
+            logger.info('Starting the batch mode')
+            complete = batch.run()
+            s.close()
+            s.collector.join(results.timeout/1000)
+            log_writer.stop()
+            if not complete:
+                for name,error in sorted(batch.failed.items()):
+                    sys.stderr.write('ptop: gave up on {0}: {1}\n'.format(name,error))
+                sys.exit(1)
+            return
+
+        from ptop.interfaces import PtopGUI
+        app = PtopGUI(s,global_stop_event,theme,sensor_refresh_rates)
         # blocking call
         logger.info('Starting the GUI application')
         app.run()
@@ -145,6 +567,11 @@ def main():
     # catch the kill signals here and perform the clean up
     except KeyboardInterrupt:
         global_stop_event.set()
+        if s is not None:
+            s.close()
+        # the queued records are written before the file is cleared
+        if log_writer is not None:
+            log_writer.stop()
         # clear log file
         # Add code for wait for all the threads before join
         with open(_log_file,'w'):
@@ -154,8 +581,12 @@ def main():
 
     except Exception as e:
         global_stop_event.set()
+        if s is not None:
+            s.close()
         # don't clear the log file
         logger.info("Exception :: main.py "+str(e))
+        if log_writer is not None:
+            log_writer.stop()
         print(sys.exc_info())
         raise SystemExit
 
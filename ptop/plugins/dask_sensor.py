@@ -1,92 +1,525 @@
+import asyncio
+import importlib
+import logging
+from collections import deque
 from time import time
-from dask.distributed import Client
-from distributed.utils import key_split
 
-from ptop.core import Plugin
+import numpy as np
+
+from ptop.core import Plugin, WorkerIndex, WorkerSnapshot
+from ptop.core.snapshot import SMOOTHED_COLUMNS
+from ptop.plugins import scheduler_feed, worker_detail
+from ptop.statistics.imbalance import ImbalanceTracker
+from ptop.statistics.rates import RateEngine
+from ptop.statistics.task_activity import TaskActivity
+from ptop.utils.instrumentation import instruments
+
+logger = logging.getLogger('ptop.plugins.dask_sensor')
+
+# maximum number of task stream records read per update
+TASK_STREAM_LIMIT = 10000
+# seconds the detail of a worker is reused for
+DETAIL_TTL = 2.0
+# deadline in seconds of fetching the detail of a worker, unless the sensor has a timeout
+DETAIL_TIMEOUT = 5.0
+# seconds before the load of the workers is asked again after a failure, doubled on every
+# failure in a row up to LOAD_RETRY_MAX
+LOAD_RETRY = 5.0
+LOAD_RETRY_MAX = 300.0
+# errors of a scheduler that cannot run worker_load at all, the load is no longer asked
+LOAD_UNSUPPORTED = (AttributeError, ImportError, NotImplementedError, TypeError)
+
+
+def _ship_remote_code():
+    try:
+        import cloudpickle
+        # the scheduler and the workers do not have ptop installed, ship the code running there by value
+        cloudpickle.register_pickle_by_value(scheduler_feed)
+        cloudpickle.register_pickle_by_value(worker_detail)
+    except (ImportError, AttributeError):
+        logger.info("cloudpickle cannot pickle by value, ptop needs to be importable on the scheduler and the workers")
+
 
 class DaskSensor(Plugin):
-    def __init__(self, dask_address, **kwargs):
+    def __init__(self, dask_address, subscribe=False, asynchronous=False, timeout=None, aggregate=None, top=20,
+                 **kwargs):
+        '''
+            :param dask_address: address of the scheduler
+            :param subscribe: let the scheduler push the worker deltas instead of polling
+            :param aggregate: one of ptop.constants.AGGREGATE_KEYS, let the scheduler reduce the state of the
+                              workers while nobody looks at them and only send the top largest
+            :param top: number of workers sent by the scheduler when aggregating
+            :param asynchronous: create the client on the collector loop, see start_async
+            :param timeout: deadline in seconds of a call to this scheduler, the collector default if None
+        '''
         super(DaskSensor, self).__init__(**kwargs)
-        self.client = Client(address = dask_address)
+        self.dask_address = dask_address
+        self.asynchronous = asynchronous
+        self.timeout = timeout
+        self.worker_info = {}
+        # columnar snapshot of worker_info, the workers keep their index across snapshots
+        self._worker_index = WorkerIndex()
+        self.workers = WorkerSnapshot.empty()
+        self._activity = None
+        self._refreshed = None
+        # smoothed throughput of every worker, and of the cluster when only its totals are known
+        self._rates = RateEngine()
+        self._cluster_rates = RateEngine()
+        # load imbalance across the workers, and the stragglers
+        self._imbalance = ImbalanceTracker()
+        # the scheduler answers worker_load, only asked when polling and while the workers are tracked
+        self._load_available = True
+        self._load_failures = 0 # failures of worker_load in a row
+        self._load_retry = 0 # time before which worker_load is not asked again
+        # statistics of the load of the workers reduced by the scheduler, see scheduler_feed.load_summary,
+        # None while the load is not known
+        self._load_summary = None
+
+        # subscription mode, worker deltas pushed by the scheduler
+        self.subscribe_requested = subscribe
+        self.subscribed = False
+        self._feed_id = None
+        self._feed_seq = 0
+        self._renewed = 0 # time the subscription was last renewed
+        self._pending_deltas = deque()
+
+        # aggregation on the scheduler, the state of every worker is only read while someone looks at it
+        self.aggregate_key = aggregate
+        self.top = top
+        self.track_workers = True
+        self.summary = None
+        self.totals = self._sum_workers(self.workers)
+
+        # task activity, only read from the scheduler while someone looks at it
+        self.track_tasks = False
+        self._task_index = -1
+        self.tasks = TaskActivity()
+
+        # detail of the worker looked at, fetched from that worker only
+        self._detail = None
+
+        # an asynchronous client has to be created on the collector loop, see start_async
+        self.client = None
+        if not asynchronous:
+            from dask.distributed import Client
+            _ship_remote_code()
+            self.client = Client(address = dask_address)
+            if subscribe:
+                self.subscribe()
         
         self.currentValue = {'Memory' :{'total_memory':0,
-                                        'used_memory':0},
+                                        'used_memory':0,
+                                        'managed_memory':0,
+                                        'unmanaged_memory':0,
+                                        'spilled_memory':0,
+                                        'spill_rate':0,
+                                        'unspill_rate':0},
                              'CPU'    :{'cpu_usage':0},
+                             'Bandwidth':dict((name,0) for name,_ in SMOOTHED_COLUMNS),
                              'Cluster':{'n_workers':0,
-                                        'total_threads':0},
-                             'Workers':[]}
+                                        'n_paused':0,
+                                        'total_threads':0,
+                                        'tasks_executing':0,
+                                        'tasks_ready':0},
+                             'Workers':self.workers,
+                             'Imbalance':self._imbalance.update(self.workers,time()),
+                             'Tasks'  :[],
+                             'Summary':None}
     
     def close(self):
+        self.unsubscribe()
         self.client.close()
-        
+
+    def prepare(self):
+        '''
+            Import dask, called by the collector in its thread pool before connecting.
+            A cold import takes seconds, longer than the deadline of the connection
+        '''
+        # done here rather than before the interface is drawn, importing dask takes most of the startup
+        importlib.import_module('dask.distributed')
+        _ship_remote_code()
+
+    async def start_async(self):
+        '''
+            Connect the asynchronous client, called on the collector loop once prepared
+        '''
+        from dask.distributed import Client
+        client = Client(address = self.dask_address, asynchronous = True)
+        try:
+            await client
+        except BaseException:
+            # the deadline cancelled the connection, the client still has to be closed on the loop
+            asyncio.ensure_future(client.close())
+            raise
+        self.client = client
+        if self.subscribe_requested:
+            await self.subscribe_async()
+
+    async def close_async(self):
+        if self.client is None:
+            return
+        await self.unsubscribe_async()
+        await self.client.close()
+
+    def _install_feed(self):
+        self.client.subscribe_topic(scheduler_feed.FEED_TOPIC, self._pending_deltas.append)
+
+    def subscribe(self):
+        '''
+            Install the delta feed on the scheduler and start applying the deltas
+            it publishes instead of polling the full scheduler_info(). Falls back
+            to polling if the feed cannot be installed.
+        '''
+        try:
+            self._install_feed()
+            self._set_snapshot(self.client.run_on_scheduler(scheduler_feed.subscribe, self.client.id, self.interval,
+                                                            self._subscription_ttl()))
+            self.subscribed = True
+        except Exception:
+            logger.info("Unable to subscribe to the scheduler feed, polling instead", exc_info=True)
+            self.subscribed = False
+
+    async def subscribe_async(self):
+        try:
+            self._install_feed()
+            self._set_snapshot(await self.client.run_on_scheduler(scheduler_feed.subscribe, self.client.id,
+                                                                  self.interval, self._subscription_ttl()))
+            self.subscribed = True
+        except Exception:
+            logger.info("Unable to subscribe to the scheduler feed, polling instead", exc_info=True)
+            self.subscribed = False
+
+    def unsubscribe(self):
+        if not self.subscribed:
+            return
+        self.subscribed = False
+        try:
+            self.client.unsubscribe_topic(scheduler_feed.FEED_TOPIC)
+            self.client.run_on_scheduler(scheduler_feed.unsubscribe, self.client.id)
+        except Exception:
+            logger.info("Unable to unsubscribe from the scheduler feed", exc_info=True)
+
+    async def unsubscribe_async(self):
+        if not self.subscribed:
+            return
+        self.subscribed = False
+        try:
+            self.client.unsubscribe_topic(scheduler_feed.FEED_TOPIC)
+            await self.client.run_on_scheduler(scheduler_feed.unsubscribe, self.client.id)
+        except Exception:
+            logger.info("Unable to unsubscribe from the scheduler feed", exc_info=True)
+
+    def _set_snapshot(self, initial):
+        '''
+            Start over from a full snapshot of the feed, used on subscription and
+            whenever a gap in the delta sequence is detected
+        '''
+        self._feed_id = initial['feed']
+        self._feed_seq = initial['seq']
+        self.worker_info = initial['workers']
+        self._add_load(initial['load'], initial['load_summary'])
+        self._renewed = time()
+
+    def _subscription_ttl(self):
+        # the interval backs off up to max_interval, the subscription outlives a few of the longest ones
+        return scheduler_feed.EXPIRY_INTERVALS * max(self.interval, self.max_interval or 0)
+
+    def _renew_due(self):
+        # renewed a few times per lifetime, a late update does not let it expire
+        return time() - self._renewed >= self._subscription_ttl() / 3
+
+    def _apply_deltas(self):
+        '''
+            Apply the deltas received since the last update to the local worker state
+
+            :rtype: False if a gap was detected and a new snapshot is required
+        '''
+        while self._pending_deltas:
+            _, delta = self._pending_deltas.popleft()
+            if delta['feed'] == self._feed_id and delta['seq'] <= self._feed_seq:
+                # already part of the snapshot we started from
+                continue
+            if delta['feed'] != self._feed_id or delta['seq'] != self._feed_seq + 1:
+                logger.info("Gap in the scheduler feed, resyncing")
+                self._pending_deltas.clear()
+                return False
+            self._feed_seq = delta['seq']
+            for addr in delta['removed']:
+                self.worker_info.pop(addr, None)
+            for addr, fields in delta['updated'].items():
+                worker = self.worker_info.setdefault(addr, {'metrics': {}})
+                metrics = fields.pop('metrics', None)
+                worker.update(fields)
+                if metrics:
+                    worker['metrics'].update(metrics)
+            self._add_load(delta['load'], delta['load_summary'])
+        return True
+
+    def _add_load(self, loads, summary):
+        '''
+            Merge the occupancy and the number of tasks processing of the workers,
+            polled with scheduler_feed.worker_load or published by the feed, into
+            the worker state
+
+            :param loads: dict of address -> (occupancy, processing)
+            :param summary: scheduler_feed.load_summary of the cluster
+        '''
+        for addr, (occupancy, processing) in loads.items():
+            info = self.worker_info.get(addr)
+            if info is not None:
+                info['occupancy'] = occupancy
+                info['processing'] = processing
+        self._load_summary = summary
+
+    def _load_read(self, load):
+        self._load_failures = 0
+        self._add_load(load['workers'], load['summary'])
+
+    def _load_failed(self, error):
+        # scheduler_info() alone still shows everything but the load
+        self._load_summary = None
+        if isinstance(error, LOAD_UNSUPPORTED):
+            logger.info("The scheduler cannot tell the load of the workers", exc_info=error)
+            self._load_available = False
+            return
+        # a timeout or a lost connection, the scheduler is left alone for a while
+        delay = min(LOAD_RETRY * 2 ** self._load_failures, LOAD_RETRY_MAX)
+        self._load_failures += 1
+        self._load_retry = time() + delay
+        logger.info("Unable to read the load of the workers from the scheduler, asking again in {0:g} s".format(delay),
+                    exc_info=error)
+
+    def _load_wanted(self):
+        # the load is one more call to the scheduler, only made while the imbalance and the stragglers are looked at
+        return self._load_available and self.track_workers and time() >= self._load_retry
+
+    def aggregating(self):
+        return self.aggregate_key is not None and not self.track_workers
+
+    def _set_summary(self, summary):
+        '''
+            Keep the workers reduced by the scheduler, see scheduler_feed.aggregate,
+            only the top ones are left in worker_info
+        '''
+        self.summary = summary
+        self.worker_info = summary['top']
+
     def update(self):
-        self.worker_info = self.client.scheduler_info()['workers']
-        self.currentValue['Memory']['total_memory'] = round(self.available_memory() / (1024**2),2)
-        self.currentValue['Memory']['used_memory']  = round(self.used_memory() / (1024**2),2)
-        self.currentValue['Memory']['used_memory_percent']  = self.currentValue['Memory']['used_memory'] / self.currentValue['Memory']['total_memory']
+        if self.subscribed:
+            synced = self._apply_deltas()
+            if synced and self._renew_due():
+                synced = self.client.run_on_scheduler(scheduler_feed.renew, self.client.id, self._subscription_ttl())
+                self._renewed = time()
+            if not synced:
+                self._set_snapshot(self.client.run_on_scheduler(scheduler_feed.subscribe, self.client.id, self.interval,
+                                                                self._subscription_ttl()))
+        elif self.aggregating():
+            with instruments.timer('scheduler_rtt'):
+                self._set_summary(self.client.run_on_scheduler(scheduler_feed.aggregate, self.top, self.aggregate_key))
+        else:
+            with instruments.timer('scheduler_rtt'):
+                self.worker_info = self.client.scheduler_info()['workers']
+            if not self._load_wanted():
+                self._load_summary = None
+            else:
+                try:
+                    load = self.client.run_on_scheduler(scheduler_feed.worker_load)
+                except Exception as e:
+                    self._load_failed(e)
+                else:
+                    self._load_read(load)
+            self.summary = None
+        if self.track_tasks:
+            self._add_tasks(self.client.run_on_scheduler(scheduler_feed.task_stream_since, self._task_index, TASK_STREAM_LIMIT))
+        else:
+            self._stop_tasks()
+        self.refresh()
+
+    async def update_async(self):
+        if self.subscribed:
+            synced = self._apply_deltas()
+            if synced and self._renew_due():
+                synced = await self.client.run_on_scheduler(scheduler_feed.renew, self.client.id, self._subscription_ttl())
+                self._renewed = time()
+            if not synced:
+                self._set_snapshot(await self.client.run_on_scheduler(scheduler_feed.subscribe, self.client.id,
+                                                                      self.interval, self._subscription_ttl()))
+        elif self.aggregating():
+            with instruments.timer('scheduler_rtt'):
+                self._set_summary(await self.client.run_on_scheduler(scheduler_feed.aggregate, self.top,
+                                                                     self.aggregate_key))
+        else:
+            with instruments.timer('scheduler_rtt'):
+                if self._load_wanted():
+                    # both are asked at once, the load costs no extra round trip
+                    identity, load = await asyncio.gather(self.client.scheduler.identity(),
+                                                          self.client.run_on_scheduler(scheduler_feed.worker_load),
+                                                          return_exceptions=True)
+                    if isinstance(identity, BaseException):
+                        raise identity
+                else:
+                    identity, load = await self.client.scheduler.identity(), None
+                    self._load_summary = None
+            self.worker_info = identity['workers']
+            if isinstance(load, BaseException):
+                self._load_failed(load)
+            elif load is not None:
+                self._load_read(load)
+            self.summary = None
+        if self.track_tasks:
+            self._add_tasks(await self.client.run_on_scheduler(scheduler_feed.task_stream_since, self._task_index, TASK_STREAM_LIMIT))
+        else:
+            self._stop_tasks()
+        self.refresh()
+
+    def _cached_detail(self, address):
+        if self._detail is not None and self._detail['address'] == address and time() - self._detail['fetched'] < DETAIL_TTL:
+            return self._detail
+        return None
+
+    def _keep_detail(self, address, result):
+        detail = dict(result[address])
+        detail['address'] = address
+        detail['fetched'] = time()
+        # only the worker looked at is kept
+        self._detail = detail
+        return detail
+
+    def fetch_worker_detail(self, address):
+        '''
+            Detail of a single worker, see ptop.plugins.worker_detail. It is asked
+            to that worker alone and reused for DETAIL_TTL seconds, the polling of
+            the cluster is not affected.
+        '''
+        return self._cached_detail(address) or self._keep_detail(
+            address, self.client.run(worker_detail.worker_detail, workers=[address]))
+
+    async def fetch_worker_detail_async(self, address):
+        detail = self._cached_detail(address)
+        if detail is None:
+            result = await asyncio.wait_for(self.client.run(worker_detail.worker_detail, workers=[address]),
+                                            self.timeout or DETAIL_TIMEOUT)
+            detail = self._keep_detail(address, result)
+        return detail
+
+    def _add_tasks(self, stream):
+        '''
+            Account the task stream records read from the cursor and move it forward
+        '''
+        self._task_index = stream['index']
+        self.tasks.add(time(), stream['records'], stream['missed'])
+        self.currentValue['Tasks'] = self.tasks.summary()
+
+    def _stop_tasks(self):
+        '''
+            Forget the task activity once nobody looks at it, the cursor starts
+            again from the current task when the tracking is resumed
+        '''
+        if self._task_index >= 0:
+            self._task_index = -1
+            self.tasks.clear()
+            self.currentValue['Tasks'] = []
+
+    def refresh(self):
+        '''
+            Recompute the current values from the local worker state
+        '''
+        now = time()
+        elapsed = now - self._refreshed if self._refreshed is not None else 0
+        self._refreshed = now
+        previous = self.workers
+        self.workers = WorkerSnapshot.from_worker_info(self.worker_info,self._worker_index,self.workers)
+        self.workers.measure_rates(previous,elapsed)
+        self._rates.update(self.workers,now)
+        self.currentValue['Imbalance'] = self._imbalance.update(
+            self.workers,now,self.summary if self.summary is not None else self._load_summary)
+        if self.summary is None:
+            self._activity = self._measure_activity(previous,self.workers)
+            self.totals = self._sum_workers(self.workers)
+        else:
+            totals = dict(self.summary['totals'],n_workers=self.summary['n_workers'])
+            # only the top workers are known, the rates come from the change of the total
+            spilled = totals['spilled'] - self.totals['spilled'] if elapsed > 0 else 0
+            totals['spill_rate'] = max(spilled,0) / elapsed if elapsed > 0 else 0
+            totals['unspill_rate'] = max(-spilled,0) / elapsed if elapsed > 0 else 0
+            smoothed = self._cluster_rates.smooth(['cluster'],np.array([now]),
+                                                  np.array([[totals[source] for _,(source,_) in SMOOTHED_COLUMNS]]))
+            totals.update((name,smoothed[0,i]) for i,(name,_) in enumerate(SMOOTHED_COLUMNS))
+            self._activity = self._measure_totals(self.totals,totals)
+            self.totals = totals
+        memory = self.currentValue['Memory']
+        memory['total_memory'] = round(self.available_memory() / (1024**2),2)
+        memory['used_memory']  = round(self.used_memory() / (1024**2),2)
+        memory['managed_memory'] = round(self.totals['managed'] / (1024**2),2)
+        memory['unmanaged_memory'] = round(self.totals['unmanaged'] / (1024**2),2)
+        memory['spilled_memory'] = round(self.totals['spilled'] / (1024**2),2)
+        memory['spill_rate'] = round(self.totals['spill_rate'] / (1024**2),2)
+        memory['unspill_rate'] = round(self.totals['unspill_rate'] / (1024**2),2)
+        total_memory = memory['total_memory']
+        for name in ('used_memory','managed_memory','unmanaged_memory','spilled_memory'):
+            memory[name+'_percent'] = memory[name] / total_memory if total_memory else 0
+        bandwidth = self.currentValue['Bandwidth']
+        for name,(_,kind) in SMOOTHED_COLUMNS:
+            # bytes in MB/s, counters per second
+            bandwidth[name] = round(self.totals[name] / (1024**2),2) if kind == 'rate' else round(self.totals[name],2)
         self.currentValue['CPU']['cpu_usage'] = self.cpu_usage()
         self.currentValue['Cluster']['n_workers'] = self.num_workers()
-        self.currentValue['Cluster']['total_threads'] = self.num_workers()
-        self.currentValue['Workers'] = self.get_worker_stats()
-    
+        self.currentValue['Cluster']['n_paused'] = int(self.totals['paused'])
+        self.currentValue['Cluster']['total_threads'] = self.num_threads()
+        self.currentValue['Cluster']['tasks_executing'] = int(self.totals['executing'])
+        self.currentValue['Cluster']['tasks_ready'] = int(self.totals['ready'])
+        self.currentValue['Workers'] = self.workers
+        self.currentValue['Summary'] = self.summary
+
+    def _sum_workers(self, workers):
+        names = ('nthreads', 'memory_limit', 'memory', 'cpu', 'managed', 'unmanaged', 'spilled', 'paused', 'spill_rate',
+                 'unspill_rate', 'executing', 'ready') + tuple(name for name, _ in SMOOTHED_COLUMNS)
+        totals = dict((name, workers.sum(name)) for name in names)
+        totals['n_workers'] = len(workers)
+        return totals
+
+    def _measure_totals(self, previous, totals):
+        '''
+            Same as _measure_activity, from the totals of the scheduler
+        '''
+        if previous['n_workers'] != totals['n_workers']:
+            return 1.0
+        if not totals['n_workers']:
+            return 0.0
+        cpu = abs(totals['cpu'] - previous['cpu']) / totals['n_workers'] / 100
+        memory = abs(totals['memory'] - previous['memory']) / totals['memory_limit'] if totals['memory_limit'] else 0
+        return max(cpu, memory)
+
+    def _measure_activity(self, previous, workers):
+        '''
+            Largest relative change between two snapshots: a worker joining or
+            leaving, the change of the mean cpu usage or of the used memory
+        '''
+        if previous.layout != workers.layout:
+            return 1.0
+        if not len(workers):
+            return 0.0
+        cpu = abs(workers.mean('cpu') - previous.mean('cpu')) / 100
+        total = workers.sum('memory_limit')
+        memory = abs(workers.sum('memory') - previous.sum('memory')) / total if total else 0
+        return max(cpu, memory)
+
+    def activity(self):
+        return self._activity
+
     def num_workers(self):
-        return len(self.worker_info)
+        return self.totals['n_workers']
     
     def num_threads(self):
-        threads = [worker['nthreads'] for _, worker in self.worker_info.items()]
-        return(sum(threads))
+        return int(self.totals['nthreads'])
     
     def available_memory(self):
-        tots = 0
-        for w, info in self.worker_info.items():
-            tots += info['memory_limit']
-        return tots
+        return self.totals['memory_limit']
     
     def used_memory(self):
-        tots = 0
-        for w, info in self.worker_info.items():
-            tots += info['metrics']['memory']
-        return tots
-    
-    def get_worker_stats(self):
-        worker_stats=[]
-        for w, info in self.worker_info.items():
-            stats = {'user':'filler',
-                     'id' : 'filler',
-                     'name' : 'filler',
-                     'rawtime':1,
-                     'time':1,
-                     'command':'',
-                     'cpu':1,
-                     'memory':1,
-                     'local_ports':'filler'}
-            stats['address'] = w
-            stats['nthreads'] = info['nthreads']
-            stats['memory']   = round(info['metrics']['memory'] / (1024**2),2)
-            stats['memory_limit'] = round(info['memory_limit'] / (1024**2), 2)
-            stats['cpu']      = info['metrics']['cpu'] 
-            stats['read']     =  round(info['metrics']['read_bytes'] / (1024**2), 2)
-            stats['write']     = round(info['metrics']['write_bytes'] / (1024**2), 2)
-            
-            worker_stats.append(stats)
-        return worker_stats
+        return self.totals['memory']
     
     def cpu_usage(self):
-        usages = []
-        for w, info in self.worker_info.items():
-            usages.append(info['metrics']['cpu'])
-        if len(usages)>0:
-            return sum(usages) / len(usages)
-        else:
+        if not self.totals['n_workers']:
             return 0
-
-    def task_status(self):
-        tasks = self.client.get_task_stream(start = time()-10)
-        task_keys = [key_split(t['key']) for t in tasks]
-        task_counts = dict()
-        for k in task_keys:
-            if k not in task_counts:
-                task_counts[k]=0
-            task_counts[k]+=1
-        return task_counts
-        
\ No newline at end of file
+        return self.totals['cpu'] / self.totals['n_workers']
@@ -0,0 +1,111 @@
+import logging
+from bisect import bisect_right
+from time import time
+
+from ptop.core import Plugin, WorkerIndex, WorkerSnapshot
+from ptop.statistics.recording import RecordingReader
+
+logger = logging.getLogger('ptop.plugins.replay_sensor')
+
+
+class ReplaySensor(Plugin):
+    '''
+        Plays back the values a sensor recorded with --record, the values have
+        the same layout as the ones of the recorded sensor
+    '''
+    # bounds of the playback speed
+    MIN_SPEED = 1/64.
+    MAX_SPEED = 1024
+
+    def __init__(self, path, recorded_name='Dask', speed=1, **kwargs):
+        '''
+            :param path: recording to play back
+            :param recorded_name: name of the recorded sensor
+            :param speed: playback speed, 2 plays two seconds of the recording per second
+        '''
+        super(ReplaySensor, self).__init__(**kwargs)
+        self.reader = RecordingReader(path)
+        self.recorded_name = recorded_name
+        self.speed = speed
+        self.paused = False
+        # position in the recording and wall clock time it was last moved at
+        self.position = self.reader.start or 0
+        self._moved_at = None
+        self._frame = None # (chunk, frame) shown
+        self._worker_index = WorkerIndex()
+        self.workers = WorkerSnapshot.empty()
+        self.currentValue = {'Memory' :{'total_memory':0,
+                                        'used_memory':0},
+                             'CPU'    :{'cpu_usage':0},
+                             'Cluster':{'n_workers':0,
+                                        'total_threads':0},
+                             'Workers':self.workers,
+                             'Tasks'  :[],
+                             'Replay' :self._replay_status()}
+        if not len(self.reader):
+            logger.info("Nothing to replay in {0}".format(path))
+
+    def _replay_status(self):
+        return {'position': self.position,
+                'start': self.reader.start,
+                'stop': self.reader.stop,
+                'speed': self.speed,
+                'paused': self.paused}
+
+    def seek(self, seconds):
+        '''
+            Move the playback position, bounded by the recording
+        '''
+        self._advance()
+        self.position += seconds
+        self._clamp()
+
+    def change_speed(self, factor):
+        self._advance()
+        self.speed = min(max(self.speed * factor, self.MIN_SPEED), self.MAX_SPEED)
+
+    def toggle_pause(self):
+        self._advance()
+        self.paused = not self.paused
+
+    def _advance(self):
+        now = time()
+        if self._moved_at is not None and not self.paused:
+            self.position += (now - self._moved_at) * self.speed
+        self._moved_at = now
+        self._clamp()
+
+    def _clamp(self):
+        if len(self.reader):
+            self.position = min(max(self.position, self.reader.start), self.reader.stop)
+
+    def update(self):
+        self._advance()
+        self.currentValue['Replay'] = self._replay_status()
+        if not len(self.reader):
+            return
+        # the frame shown is the last one recorded at or before the position,
+        # it is either in the chunk starting before the position or in the previous one
+        chunk = self.reader.chunk_at(self.position)
+        for index in (chunk, chunk - 1):
+            if index < 0:
+                break
+            frames = self.reader.chunk(index).get(self.recorded_name)
+            if not frames:
+                continue
+            position = bisect_right([t for t, _ in frames], self.position) - 1
+            if position >= 0:
+                self._show((index, position), frames[position][1])
+                return
+
+    def _show(self, frame, value):
+        if frame == self._frame:
+            return
+        self._frame = frame
+        for key, item in value.items():
+            if isinstance(item, tuple):
+                addresses, columns = item
+                self.workers = WorkerSnapshot.from_columns(addresses, columns, self._worker_index, self.workers)
+                self.currentValue[key] = self.workers
+            else:
+                self.currentValue[key] = item
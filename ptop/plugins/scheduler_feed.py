@@ -0,0 +1,412 @@
+'''
+    ptop.plugins.scheduler_feed
+
+    Code that is shipped to and executed inside the dask scheduler through
+    client.run_on_scheduler. It installs a periodic callback which diffs the
+    worker state against what was published last time and logs only the changed
+    fields as an event, so that subscribed ptop clients pay for churn rather than
+    for the size of the cluster. The load of the workers moves on every task, it
+    is published apart and only once it moved enough, next to statistics of the
+    load of the whole cluster. Subscriptions have to be renewed, the callback
+    stops once all of them expired. It also hands out the task stream incrementally,
+    from a cursor on the counter of the task stream plugin.
+
+    Everything in here must only depend on what a scheduler process already has
+    available (distributed and tornado), this module is pickled by value.
+'''
+import uuid
+from time import time
+
+FEED_TOPIC = 'ptop-worker-deltas'
+# a subscription expires once it was not renewed for that many publishing intervals, unless
+# the subscriber asks for another lifetime, the feed of a crashed ptop stops on its own
+EXPIRY_INTERVALS = 5
+
+# per worker fields that change on every heartbeat but are of no use to ptop,
+# publishing them would turn every tick into a full snapshot
+VOLATILE_FIELDS = ('last_seen',)
+VOLATILE_METRICS = ('time',)
+# the load of a worker moves on every task, it is only published again once it moved by
+# LOAD_CHANGE of the value published last, and by at least the floor of each of its fields:
+# seconds of occupancy and number of tasks processing
+LOAD_CHANGE = 0.1
+LOAD_FLOORS = (0.1, 1)
+
+# name of the attribute used for storing the feed state on the scheduler
+_FEED_ATTRIBUTE = '_ptop_feed'
+
+
+def _worker_state(ws):
+    '''
+        Flat copy of the published part of a WorkerState, same layout
+        as the entries of scheduler_info()['workers']
+    '''
+    state = dict(ws.identity())
+    for field in VOLATILE_FIELDS:
+        state.pop(field, None)
+    metrics = dict(state.get('metrics', {}))
+    for field in VOLATILE_METRICS:
+        metrics.pop(field, None)
+    state['metrics'] = metrics
+    return state
+
+
+def _load(ws):
+    '''
+        Load of a worker only the scheduler knows about: the expected seconds of
+        work assigned to it and the number of tasks assigned to it
+    '''
+    return round(ws.occupancy, 3), len(ws.processing)
+
+
+def _load_moved(old, new):
+    '''
+        True once a load moved enough from the one published last to be published again
+    '''
+    return any(abs(value - before) >= max(LOAD_CHANGE * abs(before), floor)
+               for before, value, floor in zip(old, new, LOAD_FLOORS))
+
+
+def worker_load(dask_scheduler=None):
+    '''
+        Load of every worker, the part of it scheduler_info() leaves out
+
+        :rtype: dict with the (occupancy in seconds, number of tasks processing) of every
+                worker and the load_summary of the cluster
+    '''
+    workers = list(dask_scheduler.workers.values())
+    return {'workers': dict((ws.address, (ws.occupancy, len(ws.processing))) for ws in workers),
+            'summary': load_summary(workers)}
+
+
+def _diff(old, new):
+    '''
+        Fields of new which differ from old, metrics are diffed one level deeper
+    '''
+    delta = {}
+    for field, value in new.items():
+        if field == 'metrics':
+            old_metrics = old.get('metrics', {})
+            changed = dict((k, v) for k, v in value.items() if old_metrics.get(k) != v)
+            if changed:
+                delta['metrics'] = changed
+        elif old.get(field) != value:
+            delta[field] = value
+    return delta
+
+
+class WorkerDeltaFeed(object):
+    '''
+        Scheduler side publisher of worker deltas
+    '''
+    def __init__(self, scheduler, interval):
+        from tornado.ioloop import PeriodicCallback
+
+        self.scheduler = scheduler
+        self.id = uuid.uuid4().hex
+        self.seq = 0
+        self.subscribers = {}  # subscriber -> time its subscription expires at
+        self.published = {}
+        self.loads = {}  # address -> load published last, see _load
+        self.load_summary = None
+        self.callback = PeriodicCallback(self.publish, interval * 1000)
+
+    def renew(self, subscriber, ttl):
+        self.subscribers[subscriber] = time() + ttl
+
+    def stop(self):
+        self.callback.stop()
+        if getattr(self.scheduler, _FEED_ATTRIBUTE, None) is self:
+            setattr(self.scheduler, _FEED_ATTRIBUTE, None)
+
+    def snapshot(self):
+        return dict((addr, _worker_state(ws)) for addr, ws in self.scheduler.workers.items())
+
+    def moved_loads(self):
+        '''
+            Loads which moved enough since they were published, see _load_moved, the
+            workers which left are forgotten
+        '''
+        moved = {}
+        loads = {}
+        for addr, ws in self.scheduler.workers.items():
+            load = _load(ws)
+            before = self.loads.get(addr)
+            if before is None or _load_moved(before, load):
+                moved[addr] = before = load
+            loads[addr] = before
+        self.loads = loads
+        return moved
+
+    def publish(self):
+        now = time()
+        for subscriber in [s for s, expires in self.subscribers.items() if expires < now]:
+            del self.subscribers[subscriber]
+        if not self.subscribers:
+            # every subscriber left without unsubscribing
+            self.stop()
+            return
+        current = self.snapshot()
+        updated = {}
+        for addr, state in current.items():
+            delta = _diff(self.published.get(addr, {}), state)
+            if delta:
+                updated[addr] = delta
+        removed = [addr for addr in self.published if addr not in current]
+        self.published = current
+        loads = self.moved_loads()
+        summary = load_summary(list(self.scheduler.workers.values()))
+        # nothing changed, nothing to send
+        if not updated and not removed and not loads and summary == self.load_summary:
+            return
+        self.load_summary = summary
+        self.seq += 1
+        self.scheduler.log_event(FEED_TOPIC, {'feed': self.id,
+                                              'seq': self.seq,
+                                              'updated': updated,
+                                              'removed': removed,
+                                              'load': loads,
+                                              'load_summary': summary})
+
+
+def subscribe(subscriber, interval, ttl=None, dask_scheduler=None):
+    '''
+        Register a subscriber, starting the feed if this is the first one.
+
+        :param subscriber: id of the subscribing client
+        :param interval: publishing interval in seconds
+        :param ttl: seconds the subscription lasts unless renewed, EXPIRY_INTERVALS intervals if None
+        :rtype: dict with the feed id, the current sequence number, a full snapshot, the load of
+                every worker and the load_summary
+    '''
+    feed = getattr(dask_scheduler, _FEED_ATTRIBUTE, None)
+    if feed is None:
+        feed = WorkerDeltaFeed(dask_scheduler, interval)
+        setattr(dask_scheduler, _FEED_ATTRIBUTE, feed)
+        feed.published = feed.snapshot()
+        feed.moved_loads()
+        feed.load_summary = load_summary(list(dask_scheduler.workers.values()))
+        feed.callback.start()
+    feed.renew(subscriber, ttl or EXPIRY_INTERVALS * interval)
+    # the snapshot is consistent with everything published up to seq
+    return {'feed': feed.id,
+            'seq': feed.seq,
+            'workers': feed.published,
+            'load': feed.loads,
+            'load_summary': feed.load_summary}
+
+
+def renew(subscriber, ttl, dask_scheduler=None):
+    '''
+        Keep a subscription alive for ttl more seconds
+
+        :rtype: False if the subscription expired already, the subscriber has to subscribe again
+    '''
+    feed = getattr(dask_scheduler, _FEED_ATTRIBUTE, None)
+    if feed is None or subscriber not in feed.subscribers:
+        return False
+    feed.renew(subscriber, ttl)
+    return True
+
+
+def unsubscribe(subscriber, dask_scheduler=None):
+    '''
+        Remove a subscriber, stopping the feed once nobody is listening anymore
+    '''
+    feed = getattr(dask_scheduler, _FEED_ATTRIBUTE, None)
+    if feed is None:
+        return
+    feed.subscribers.pop(subscriber, None)
+    if not feed.subscribers:
+        feed.stop()
+
+
+def _task_stream_plugin(scheduler):
+    '''
+        The task stream plugin of the scheduler, installed if nobody did yet
+    '''
+    from distributed.diagnostics.task_stream import TaskStreamPlugin
+
+    plugins = scheduler.plugins
+    if isinstance(plugins, dict):
+        plugins = plugins.values()
+    for plugin in plugins:
+        if isinstance(plugin, TaskStreamPlugin):
+            return plugin
+    plugin = TaskStreamPlugin(scheduler)
+    scheduler.add_plugin(plugin)
+    return plugin
+
+
+def task_stream_since(index, limit, dask_scheduler=None):
+    '''
+        Tasks finished since the task stream counter was at index, reduced to
+        (prefix, stop, compute time, transfer time, nbytes) tuples
+
+        :param index: value of the counter returned by the previous call, -1 to start from now
+        :param limit: maximum number of records returned, the oldest ones are skipped
+        :rtype: dict with the new counter, the records and the number of skipped records
+    '''
+    from dask.utils import key_split
+
+    plugin = _task_stream_plugin(dask_scheduler)
+    if index < 0:
+        return {'index': plugin.index, 'records': [], 'missed': 0}
+    new = plugin.index - index
+    if new < 0:
+        # the plugin was replaced, everything in it is new
+        new = plugin.index
+    n = min(new, len(plugin.buffer), limit)
+
+    records = []
+    # the newest records are at the right end of the buffer
+    for i, record in enumerate(reversed(plugin.buffer)):
+        if i >= n:
+            break
+        compute = transfer = 0
+        stop = 0
+        for startstop in record['startstops']:
+            duration = startstop['stop'] - startstop['start']
+            if startstop['action'] == 'compute':
+                compute += duration
+            elif startstop['action'] == 'transfer':
+                transfer += duration
+            stop = max(stop, startstop['stop'])
+        records.append((key_split(record['key']), stop, compute, transfer, record.get('nbytes') or 0))
+    records.reverse()
+    return {'index': plugin.index, 'records': records, 'missed': new - n}
+
+
+def _status(ws):
+    return getattr(ws.status, 'name', ws.status)
+
+
+def _managed(ws):
+    '''
+        bytes of data held in memory by a worker, managed_bytes counts the spilled data as well
+    '''
+    spilled = ws.metrics.get('spilled_bytes') or {}
+    return max(ws.metrics.get('managed_bytes', 0) - spilled.get('memory', 0), 0)
+
+
+def _net_io(ws, direction):
+    '''
+        bytes per second received (read) or sent (write) by the host of a worker,
+        older workers send them as read_bytes and write_bytes
+    '''
+    net_io = ws.metrics.get('host_net_io')
+    if net_io is None:
+        return ws.metrics.get(direction + '_bytes', 0)
+    return net_io.get(direction + '_bps', 0)
+
+
+# worker columns summarized by aggregate, name -> function reading it from a WorkerState
+_AGGREGATED = (
+    ('nthreads', lambda ws: ws.nthreads),
+    ('memory_limit', lambda ws: ws.memory_limit or 0),
+    ('memory', lambda ws: ws.metrics.get('memory', 0)),
+    ('cpu', lambda ws: ws.metrics.get('cpu', 0)),
+    ('read', lambda ws: _net_io(ws, 'read')),
+    ('write', lambda ws: _net_io(ws, 'write')),
+    ('managed', _managed),
+    ('unmanaged', lambda ws: max(ws.metrics.get('memory', 0) - _managed(ws), 0)),
+    ('spilled', lambda ws: (ws.metrics.get('spilled_bytes') or {}).get('disk', 0)),
+    ('paused', lambda ws: _status(ws) == 'paused'),
+    ('disk_read', lambda ws: (ws.metrics.get('host_disk_io') or {}).get('read_bps', 0)),
+    ('disk_write', lambda ws: (ws.metrics.get('host_disk_io') or {}).get('write_bps', 0)),
+    ('transfers_in', lambda ws: (ws.metrics.get('transfer') or {}).get('incoming_count_total', 0)),
+    ('transfers_out', lambda ws: (ws.metrics.get('transfer') or {}).get('outgoing_count_total', 0)),
+    ('executing', lambda ws: (ws.metrics.get('task_counts') or {}).get('executing', 0)),
+    ('ready', lambda ws: (ws.metrics.get('task_counts') or {}).get('ready', 0)),
+    ('occupancy', lambda ws: ws.occupancy),
+    ('processing', lambda ws: len(ws.processing)),
+    ('load', lambda ws: ws.occupancy / max(ws.nthreads, 1)),
+)
+PERCENTILES = (0, 50, 90, 99, 100)
+# columns whose spread is returned by aggregate and load_summary, for telling the stragglers apart
+SPREAD = ('load', 'processing')
+
+
+def _percentiles(values):
+    values = sorted(values)
+    if not values:
+        return [0] * len(PERCENTILES)
+    return [values[min(len(values) - 1, int(q / 100. * len(values)))] for q in PERCENTILES]
+
+
+def _spread(values):
+    '''
+        (standard deviation, median absolute deviation, mean absolute deviation from the median)
+    '''
+    if not values:
+        return 0, 0, 0
+    mean = sum(values) / float(len(values))
+    median = sorted(values)[len(values) // 2]
+    deviations = sorted(abs(value - median) for value in values)
+    return ((sum((value - mean) ** 2 for value in values) / len(values)) ** 0.5,
+            deviations[len(deviations) // 2],
+            sum(deviations) / len(deviations))
+
+
+def load_summary(workers):
+    '''
+        Numbers the stragglers are told apart with, see ptop.statistics.imbalance,
+        reduced here rather than by every ptop looking at the cluster
+
+        :param workers: WorkerStates of the scheduler
+        :rtype: dict laid out like the result of aggregate, for the SPREAD columns only
+    '''
+    columns = dict((name, [extract(ws) for ws in workers]) for name, extract in _AGGREGATED if name in SPREAD)
+    return {'n_workers': len(workers),
+            'totals': dict((name, sum(values)) for name, values in columns.items()),
+            'percentiles': dict((name, _percentiles(values)) for name, values in columns.items()),
+            'spread': dict((name, _spread(values)) for name, values in columns.items())}
+
+
+def aggregate(top, key, dask_scheduler=None):
+    '''
+        Cluster wide numbers reduced on the scheduler, instead of shipping the
+        state of every worker
+
+        :param top: number of workers whose state is returned
+        :param key: column of _AGGREGATED the returned workers are the largest of
+        :rtype: dict with the number of workers, the totals and the PERCENTILES
+                of every column, the spread of the SPREAD columns, the top
+                workers laid out like the entries of scheduler_info()['workers']
+                and the number of tasks per state
+    '''
+    workers = list(dask_scheduler.workers.values())
+    columns = dict((name, [extract(ws) for ws in workers]) for name, extract in _AGGREGATED)
+    order = sorted(range(len(workers)), key=columns[key].__getitem__, reverse=True)[:top]
+    largest = {}
+    for i in sorted(order):
+        ws = workers[i]
+        largest[ws.address] = {'nthreads': ws.nthreads,
+                               'memory_limit': ws.memory_limit,
+                               'status': _status(ws),
+                               'occupancy': columns['occupancy'][i],
+                               'processing': columns['processing'][i],
+                               'metrics': {'cpu': columns['cpu'][i],
+                                           'memory': columns['memory'][i],
+                                           'host_net_io': {'read_bps': columns['read'][i],
+                                                           'write_bps': columns['write'][i]},
+                                           'managed_bytes': columns['managed'][i],
+                                           'spilled_bytes': {'memory': 0, 'disk': columns['spilled'][i]},
+                                           'host_disk_io': {'read_bps': columns['disk_read'][i],
+                                                            'write_bps': columns['disk_write'][i]},
+                                           'transfer': {'incoming_count_total': columns['transfers_in'][i],
+                                                        'outgoing_count_total': columns['transfers_out'][i]},
+                                           'task_counts': {'executing': columns['executing'][i],
+                                                           'ready': columns['ready'][i]},
+                                           'time': ws.metrics.get('time', 0)}}
+    task_states = {}
+    for prefix in dask_scheduler.task_prefixes.values():
+        for state, count in prefix.states.items():
+            if count:
+                task_states[state] = task_states.get(state, 0) + count
+    return {'n_workers': len(workers),
+            'totals': dict((name, sum(values)) for name, values in columns.items()),
+            'percentiles': dict((name, _percentiles(values)) for name, values in columns.items()),
+            'spread': dict((name, _spread(columns[name])) for name in SPREAD),
+            'top': largest,
+            'task_states': task_states}
@@ -0,0 +1,98 @@
+'''
+    ptop.plugins.worker_detail
+
+    Code that is shipped to and executed inside a single dask worker through
+    client.run(..., workers=[address]) when the detail of that worker is looked
+    at. It reads the state the worker already keeps, nothing is computed on the
+    worker while nobody looks at it.
+
+    Everything in here must only depend on what a worker process already has
+    available, this module is pickled by value.
+'''
+import sys
+from time import time
+
+
+def _stored(state, top):
+    '''
+        Largest keys held in memory by the worker, (key, bytes)
+    '''
+    sizes = [(str(key), ts.nbytes or 0) for key, ts in state.tasks.items() if ts.state == 'memory']
+    sizes.sort(key=lambda item: item[1], reverse=True)
+    return sizes[:top], len(sizes), sum(size for _, size in sizes)
+
+
+def _spilled(data):
+    '''
+        (keys, bytes) spilled to disk, zeros if the worker does not spill
+    '''
+    slow = getattr(data, 'slow', None)
+    total = getattr(data, 'spilled_total', None)
+    if slow is None or total is None:
+        return 0, 0
+    return len(slow), total.disk
+
+
+def _threads(worker):
+    '''
+        What every busy thread of the worker is running, (key, innermost frame)
+    '''
+    frames = sys._current_frames()
+    threads = []
+    with worker.active_threads_lock:
+        active = dict(worker.active_threads)
+    for ident, key in active.items():
+        frame = frames.get(ident)
+        where = ''
+        if frame is not None:
+            where = '{0} ({1}:{2})'.format(frame.f_code.co_name, frame.f_code.co_filename.rsplit('/', 1)[-1],
+                                           frame.f_lineno)
+        threads.append((str(key), where))
+    return sorted(threads)
+
+
+def _profile(tree, top):
+    '''
+        Functions the recent profile of the worker spent the most samples in,
+        (function, samples)
+    '''
+    leaves = {}
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        children = node.get('children') or {}
+        if children:
+            stack.extend(children.values())
+            own = node.get('count', 0) - sum(child.get('count', 0) for child in children.values())
+        else:
+            own = node.get('count', 0)
+        description = node.get('description') or {}
+        if own > 0 and description.get('name'):
+            name = '{0} ({1}:{2})'.format(description['name'], description.get('filename', '').rsplit('/', 1)[-1],
+                                          description.get('line_number', 0))
+            leaves[name] = leaves.get(name, 0) + own
+    return sorted(leaves.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def worker_detail(top=10, dask_worker=None):
+    '''
+        :param top: number of keys and functions listed
+        :rtype: dict with the task counts, the largest keys in memory, the spilled
+                data, the busy threads and the recent profile of the worker
+    '''
+    state = dask_worker.state
+    stored, n_stored, stored_bytes = _stored(state, top)
+    n_spilled, spilled_bytes = _spilled(dask_worker.data)
+    return {'time': time(),
+            'executing': state.executing_count,
+            'ready': len(state.ready),
+            'constrained': len(state.constrained),
+            'long_running': len(state.long_running),
+            'in_flight': state.in_flight_tasks_count,
+            'stored': stored,
+            'n_stored': n_stored,
+            'stored_bytes': stored_bytes,
+            'n_spilled': n_spilled,
+            'spilled_bytes': spilled_bytes,
+            'threads': _threads(dask_worker),
+            'profile': _profile(dask_worker.profile_recent, top)}
@@ -1 +1,5 @@
-from .statistics import Statistics
\ No newline at end of file
+from .statistics import Statistics
+from .timeseries import RingBuffer, TimeSeriesStore
+from .task_activity import TaskActivity
+from .recording import Recorder, RecordingReader, RecordingError
+from .rules import Rule, RuleEngine, RuleError, AlertLog, AlertHook, read_rules
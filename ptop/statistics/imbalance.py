@@ -0,0 +1,114 @@
+'''
+    ptop.statistics.imbalance
+
+    Load imbalance across the workers of a cluster. The load of a worker is the
+    work the scheduler assigned to it, in seconds per thread, and the number of
+    tasks assigned to it. For both the coefficient of variation and the ratio of
+    the largest to the median value tell how uneven the cluster is, and the
+    robust z-score of every worker (its distance to the median in median
+    absolute deviations) tells which workers hold the others up. The score of a
+    worker is smoothed over time so a single busy heartbeat does not make it a
+    straggler.
+
+    The statistics are reduced by the scheduler, see scheduler_feed.load_summary,
+    so only the scores of the workers are computed here, and the smoothed scores
+    are carried from one snapshot to the next.
+'''
+
+import numpy as np
+
+from ptop.statistics.rates import RateEngine
+
+# columns the imbalance is measured on
+IMBALANCE_METRICS = ('load','processing')
+# robust z-score from which a worker is a straggler, the usual cutoff for outliers
+STRAGGLER_SCORE = 3.5
+# number of stragglers named in the values of the sensor
+STRAGGLERS_LISTED = 5
+
+# the median absolute deviation of a normal distribution is 0.6745 standard deviations
+_MAD_SCALE = 0.6745
+# and its mean absolute deviation 0.7979 standard deviations
+_MEAN_AD_SCALE = 0.7979
+
+
+def robust_scores(values,median,mad,mean_ad):
+    '''
+        Robust z-score of values, the mean absolute deviation is used when more
+        than half of the values are the median
+
+        :rtype: numpy array, 0 for every value if they are all the same
+    '''
+    if mad > 0:
+        return _MAD_SCALE*(values-median)/mad
+    if mean_ad > 0:
+        return _MEAN_AD_SCALE*(values-median)/mean_ad
+    return np.zeros(len(values))
+
+
+def _imbalance(mean,std,median,largest):
+    '''
+        (coefficient of variation, largest over median), None where the median or
+        the mean is 0 while a worker has some load
+    '''
+    cv = std/mean if mean > 0 else (0. if largest <= 0 else None)
+    ratio = largest/median if median > 0 else (0. if largest <= 0 else None)
+    return cv,ratio
+
+
+class ImbalanceTracker(object):
+    def __init__(self,threshold=STRAGGLER_SCORE,halflife=5.0):
+        '''
+            :param threshold: smoothed robust z-score from which a worker is a straggler
+            :param halflife: time in seconds after which a score weighs half of the smoothed score
+        '''
+        self.threshold = threshold
+        self._scores = RateEngine(halflife,columns=(('straggler_score',('straggler_score','rate')),))
+
+    def _measure(self,workers,summary):
+        '''
+            Statistics of the cluster and raw scores of the workers of a snapshot, which
+            may only hold the top workers of an aggregating scheduler
+        '''
+        statistics = {}
+        raw = np.zeros(len(workers))
+        n = summary['n_workers']
+        for name in IMBALANCE_METRICS:
+            percentiles = summary['percentiles'].get(name)
+            spread = summary.get('spread',{}).get(name)
+            if not n or percentiles is None or spread is None:
+                statistics[name] = (0.,0.)
+                continue
+            std,mad,mean_ad = spread
+            median,largest = percentiles[1],percentiles[-1]
+            statistics[name] = _imbalance(summary['totals'][name]/n,std,median,largest)
+            raw = np.maximum(raw,robust_scores(workers.column(name),median,mad,mean_ad))
+        return statistics,raw
+
+    def update(self,workers,now,summary=None):
+        '''
+            Fill the straggler_score column of a WorkerSnapshot
+
+            :param workers: WorkerSnapshot
+            :param now: time of the snapshot
+            :param summary: load summary of the scheduler, see scheduler_feed.load_summary and aggregate,
+                            None if the load of the workers is not known
+            :rtype: dict with the coefficient of variation and the largest over median of every
+                    IMBALANCE_METRICS, the number of stragglers and the largest (address, score),
+                    empty if the load is not known
+        '''
+        if summary is None:
+            workers.columns['straggler_score'] = np.zeros(len(workers))
+            return {}
+        statistics,raw = self._measure(workers,summary)
+        scores = self._scores.smooth(workers.addresses,np.full(len(workers),now),raw[:,None])[:,0]
+        workers.columns['straggler_score'] = scores
+
+        stragglers = np.flatnonzero(scores >= self.threshold)
+        ranked = stragglers[np.argsort(-scores[stragglers],kind='stable')][:STRAGGLERS_LISTED]
+        imbalance = {'n_stragglers': len(stragglers),
+                     'stragglers': [(workers.addresses[row],round(float(scores[row]),2)) for row in ranked]}
+        for name,(cv,ratio) in statistics.items():
+            imbalance[name+'_cv'] = round(cv,3) if cv is not None else None
+            imbalance[name+'_max_median'] = round(ratio,2) if ratio is not None else None
+        return imbalance
@@ -0,0 +1,97 @@
+'''
+    ptop.statistics.rates
+
+    Smoothed per second rates of the workers. Every worker keeps its last
+    sample, a counter is turned into its change per second and every rate is
+    smoothed with an exponentially weighted moving average whose weight depends
+    on the time elapsed since the previous sample, so an irregular heartbeat
+    does not bias it. A counter going backwards is a restarted worker, the
+    sample is skipped and the counter followed from its new value.
+'''
+
+import math
+
+import numpy as np
+
+from ptop.core.snapshot import SMOOTHED_COLUMNS
+
+
+class RateEngine(object):
+    def __init__(self,halflife=5.0,columns=SMOOTHED_COLUMNS):
+        '''
+            :param halflife: time in seconds after which a sample weighs half of the average
+            :param columns: column -> (column it is computed from, kind), see SMOOTHED_COLUMNS
+        '''
+        self.halflife = halflife
+        self.columns = columns
+        self._counters = np.array([kind == 'counter' for _,(_,kind) in columns])
+        self._addresses = []
+        self._times = np.zeros(0) # time of the last sample of every worker
+        self._raw = np.zeros((0,len(columns))) # last sample
+        self._smoothed = np.zeros((0,len(columns)))
+        self._primed = np.zeros((0,len(columns)),dtype=bool) # a counter has its first rate
+
+    def _align(self,addresses):
+        '''
+            rows of the previous samples for the given workers, -1 for a new worker
+        '''
+        if addresses == self._addresses:
+            return np.arange(len(addresses))
+        before = dict((address,row) for row,address in enumerate(self._addresses))
+        return np.fromiter((before.get(address,-1) for address in addresses),np.int64,len(addresses))
+
+    def smooth(self,addresses,times,raw):
+        '''
+            Add a sample of every worker
+
+            :param addresses: list of the workers, one per row
+            :param times: time of the sample of every worker
+            :param raw: matrix with a row per worker and a column per entry of columns
+            :rtype: matrix of the smoothed rates, same layout as raw
+        '''
+        n = len(addresses)
+        rows = self._align(addresses)
+        known = rows >= 0
+        previous_times = np.where(known,self._times[rows] if len(self._times) else 0,times)
+        previous_raw = np.where(known[:,None],self._raw[rows] if len(self._raw) else 0,raw)
+        smoothed = np.where(known[:,None],self._smoothed[rows] if len(self._smoothed) else 0,0)
+        primed = np.where(known[:,None],self._primed[rows] if len(self._primed) else False,False)
+
+        elapsed = times - previous_times
+        fresh = known & (elapsed > 0)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            rates = np.where(self._counters,(raw-previous_raw)/elapsed[:,None],raw)
+        # a counter which went backwards belongs to a restarted worker
+        valid = fresh[:,None] & ~(self._counters & (raw < previous_raw))
+        weight = 1-np.exp(-elapsed*math.log(2)/self.halflife)
+        # the first rate of a worker is taken as it is
+        weight = np.where(primed,weight[:,None],1.)
+        smoothed = np.where(valid,smoothed+weight*(np.nan_to_num(rates)-smoothed),smoothed)
+        primed = primed | valid
+        # a rate column starts from its first value
+        new = ~known[:,None] & ~self._counters
+        smoothed = np.where(new,raw,smoothed)
+        primed = primed | new
+
+        self._addresses = list(addresses)
+        self._times = np.where(fresh | ~known,times,previous_times)
+        self._raw = np.where((fresh | ~known)[:,None],raw,previous_raw)
+        self._smoothed = smoothed.reshape(n,len(self.columns))
+        self._primed = primed.reshape(n,len(self.columns))
+        return self._smoothed
+
+    def update(self,workers,now):
+        '''
+            Fill the smoothed columns of a WorkerSnapshot
+
+            :param workers: WorkerSnapshot
+            :param now: time of the snapshot, for the workers without a heartbeat time
+        '''
+        times = workers.column('heartbeat')
+        times = np.where(times > 0,times,now)
+        raw = np.empty((len(workers),len(self.columns)))
+        for i,(_,(source,_)) in enumerate(self.columns):
+            raw[:,i] = workers.column(source)
+        smoothed = self.smooth(workers.addresses,times,raw)
+        for i,(name,_) in enumerate(self.columns):
+            workers.columns[name] = smoothed[:,i]
@@ -0,0 +1,282 @@
+'''
+    ptop.statistics.recording
+
+    Append-only log of the sensor values. The file is a magic header followed by
+    independent chunks, every chunk starts with a fixed size header holding the
+    time range it covers and the length of its zlib compressed body, so the time
+    index of a file is built by hopping over the chunk headers and a seek is a
+    bisection over it.
+
+    Inside a chunk the first frame of every sensor is stored in full and the next
+    ones as differences to the previous frame: the worker columns are quantized to
+    int64, subtracted from the previous frame when the workers did not change and
+    byte shuffled, so that the mostly zero high order bytes compress away. The
+    worker addresses are only written when they change. A crash loses at most the
+    frames of the chunk being filled.
+'''
+
+import json
+import logging
+import os
+import struct
+import threading
+import zlib
+from bisect import bisect_right
+
+import numpy as np
+
+from ptop.core.snapshot import BYTE_COLUMNS, COLUMN_NAMES, WorkerSnapshot
+
+
+logger = logging.getLogger('ptop.statistics.recording')
+
+MAGIC = b'PTOPREC1'
+CHUNK_MAGIC = b'CHNK'
+# chunk magic, number of frames, first timestamp, last timestamp, body length
+CHUNK_HEADER = struct.Struct('<4sIddI')
+
+# the worker columns are stored as int64 multiples of 1/scale, a tenth of a
+# percent of cpu and KiB for the byte columns, below what the interface shows
+COLUMN_SCALE = {'cpu': 10}
+COLUMN_SCALE.update((name,1/1024.) for name in BYTE_COLUMNS)
+
+
+class RecordingError(Exception):
+    pass
+
+
+def _shuffle(data):
+    '''
+        Group the n-th bytes of the int64 values together
+    '''
+    return np.frombuffer(data,np.uint8).reshape(-1,8).T.tobytes()
+
+
+def _unshuffle(data):
+    return np.frombuffer(data,np.uint8).reshape(8,-1).T.tobytes()
+
+
+class Recorder(object):
+    def __init__(self,path,interval=0,chunk_frames=256,chunk_seconds=60,level=6):
+        '''
+            :param path: file the frames are appended to, created if needed
+            :param interval: minimum time between two frames of a sensor, 0 records every frame
+            :param chunk_frames: maximum number of frames in a chunk
+            :param chunk_seconds: maximum time span of a chunk, bounds what a crash loses
+            :param level: zlib compression level
+        '''
+        self.path = path
+        self.interval = interval
+        self.chunk_frames = chunk_frames
+        self.chunk_seconds = chunk_seconds
+        self.level = level
+        self.columns = list(COLUMN_NAMES)
+        self._scale = np.array([COLUMN_SCALE.get(name,1) for name in self.columns],dtype=np.float64)
+        self._lock = threading.Lock()
+        self._file = self._open(path)
+        self._recorded = {} # sensor name -> timestamp of its last frame
+        self._reset_chunk()
+
+    def _open(self,path):
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            f = open(path,'wb')
+            f.write(MAGIC)
+            f.flush()
+            return f
+        # keep appending to an existing recording, dropping a chunk cut by a crash
+        end = RecordingReader(path).end
+        f = open(path,'r+b')
+        f.truncate(end)
+        f.seek(end)
+        return f
+
+    def _reset_chunk(self):
+        self._frames = []
+        self._blocks = []
+        self._previous = {} # sensor name -> (addresses, int64 matrix) of its last frame
+        self._first = None
+        self._last = None
+
+    def append(self,timestamp,name,value):
+        '''
+            Add a frame holding the current value of a sensor
+
+            :param timestamp: time of the values
+            :param name: name of the sensor
+            :param value: currentValue of the sensor
+        '''
+        if timestamp - self._recorded.get(name,float('-inf')) < self.interval:
+            return
+        self._recorded[name] = timestamp
+        frame = {'s': name, 't': timestamp, 'v': {}}
+        matrix = None
+        for key,item in value.items():
+            if isinstance(item,WorkerSnapshot):
+                frame['w'] = key
+                matrix = self._quantize(item)
+                addresses = item.addresses
+            else:
+                frame['v'][key] = item
+
+        with self._lock:
+            if self._file is None:
+                return
+            if matrix is not None:
+                previous = self._previous.get(name)
+                if previous is not None and previous[0] == addresses:
+                    block = matrix - previous[1]
+                    frame['d'] = 1
+                else:
+                    block = matrix
+                    frame['a'] = list(addresses)
+                frame['n'] = len(addresses)
+                self._previous[name] = (addresses,matrix)
+                # column after column, similar values end up next to each other
+                self._blocks.append(block.T.tobytes())
+            # encoded right away, the sensor updates its values in place
+            self._frames.append(json.dumps(frame,separators=(',',':'),default=float))
+            if self._first is None:
+                self._first = timestamp
+            self._last = timestamp
+            if len(self._frames) >= self.chunk_frames or timestamp - self._first >= self.chunk_seconds:
+                self._write_chunk()
+
+    def _quantize(self,workers):
+        matrix = np.empty((len(workers),len(self.columns)))
+        for i,name in enumerate(self.columns):
+            matrix[:,i] = workers.column(name)
+        return np.round(np.nan_to_num(matrix)*self._scale).astype(np.int64)
+
+    def _write_chunk(self):
+        if not self._frames:
+            return
+        meta = '{{"columns":{0},"scale":{1},"frames":[{2}]}}'.format(json.dumps(self.columns),
+                                                                  json.dumps(self._scale.tolist()),
+                                                                  ','.join(self._frames)).encode('utf-8')
+        body = zlib.compress(struct.pack('<I',len(meta)) + meta + _shuffle(b''.join(self._blocks)),self.level)
+        self._file.write(CHUNK_HEADER.pack(CHUNK_MAGIC,len(self._frames),self._first,self._last,len(body)))
+        self._file.write(body)
+        self._file.flush()
+        self._reset_chunk()
+
+    def flush(self):
+        '''
+            Write the frames of the chunk being filled
+        '''
+        with self._lock:
+            if self._file is not None:
+                self._write_chunk()
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._write_chunk()
+            self._file.close()
+            self._file = None
+
+
+class RecordingReader(object):
+    def __init__(self,path):
+        '''
+            Index the chunks of a recording, only their headers are read
+
+            :param path: recording written by a Recorder
+        '''
+        self.path = path
+        self.starts = [] # first timestamp of every chunk
+        self.stops = [] # last timestamp of every chunk
+        self.offsets = [] # offset of the body of every chunk
+        self.lengths = []
+        self._cache = (None,None) # last decoded chunk
+        with open(path,'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise RecordingError("{0} is not a ptop recording".format(path))
+            size = os.fstat(f.fileno()).st_size
+            offset = len(MAGIC)
+            while offset + CHUNK_HEADER.size <= size:
+                f.seek(offset)
+                magic,_,first,last,length = CHUNK_HEADER.unpack(f.read(CHUNK_HEADER.size))
+                body = offset + CHUNK_HEADER.size
+                if magic != CHUNK_MAGIC or body + length > size:
+                    logger.info("Truncated chunk at offset {0} of {1}".format(offset,path))
+                    break
+                self.starts.append(first)
+                self.stops.append(last)
+                self.offsets.append(body)
+                self.lengths.append(length)
+                offset = body + length
+        # end of the last complete chunk
+        self.end = offset
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def start(self):
+        return self.starts[0] if self.starts else None
+
+    @property
+    def stop(self):
+        return self.stops[-1] if self.stops else None
+
+    def names(self):
+        '''
+            :rtype: names of the sensors in the first and the last chunk
+        '''
+        names = []
+        for index in sorted(set((0,len(self)-1))) if len(self) else ():
+            names.extend(name for name in self.chunk(index) if name not in names)
+        return names
+
+    def chunk_at(self,timestamp):
+        '''
+            :rtype: index of the last chunk starting at or before timestamp
+        '''
+        return max(bisect_right(self.starts,timestamp)-1,0)
+
+    def chunk(self,index):
+        '''
+            Decode a chunk
+
+            :rtype: dict of sensor name -> list of (timestamp, value) with the worker
+                    columns turned back into a dict of column name -> float64 array and
+                    the addresses
+        '''
+        if self._cache[0] == index:
+            return self._cache[1]
+        with open(self.path,'rb') as f:
+            f.seek(self.offsets[index])
+            data = zlib.decompress(f.read(self.lengths[index]))
+        length, = struct.unpack_from('<I',data)
+        meta = json.loads(data[4:4+length].decode('utf-8'))
+        blocks = np.frombuffer(_unshuffle(data[4+length:]),np.int64)
+        columns = meta['columns']
+        scale = np.array(meta['scale'])
+
+        frames = {}
+        previous = {}
+        position = 0
+        for frame in meta['frames']:
+            value = frame['v']
+            if 'w' in frame:
+                name = frame['s']
+                n = frame['n']
+                block = blocks[position:position+n*len(columns)].reshape(len(columns),n).T
+                position += n*len(columns)
+                if frame.get('d'):
+                    addresses,matrix = previous[name]
+                    matrix = matrix + block
+                else:
+                    addresses,matrix = frame['a'],block
+                previous[name] = (addresses,matrix)
+                values = matrix / scale
+                decoded = dict((column,values[:,i]) for i,column in enumerate(columns))
+                # columns added after the recording was made
+                for column in COLUMN_NAMES:
+                    if column not in decoded:
+                        decoded[column] = np.zeros(n)
+                value[frame['w']] = (addresses,decoded)
+            frames.setdefault(frame['s'],[]).append((frame['t'],value))
+        self._cache = (index,frames)
+        return frames
@@ -0,0 +1,371 @@
+'''
+    ptop.statistics.rules
+
+    Alert rules checked on every snapshot of a sensor. A rule is an expression
+    over the worker columns and the cluster metrics, optionally followed by how
+    long it has to hold before firing, how long it has to stop holding before
+    clearing and how long to wait before notifying it again:
+
+        high-memory: memory/memory_limit > 90% for 30s
+        idle: cpu < 5 while ready > 0 for 1m cooldown 10m
+        lost-workers: n_workers dropped by > 10%
+
+    A rule naming a worker column is checked on every worker at once, the
+    expression is compiled into numpy operations over the columns of the
+    snapshot so a check costs a few vectorized operations per rule. The state of
+    the rules is kept in arrays indexed like the workers of the snapshots.
+
+    Worker columns are in the units of the snapshots (bytes, percent of a core),
+    cluster metrics in the units of the batch output (MB, percent). A name which
+    is both refers to the worker column, cluster.name to the cluster metric.
+'''
+
+import ast
+import json
+import logging
+import os
+import re
+import subprocess
+import threading
+from collections import deque
+
+import numpy as np
+
+from ptop.constants import CLUSTER_METRICS
+from ptop.core.snapshot import COLUMN_NAMES
+
+logger = logging.getLogger('ptop.statistics.rules')
+
+# seconds over which dropped by compares a cluster metric to its largest value
+DROP_WINDOW = 60.0
+# seconds a fired rule waits before notifying again, unless the rule has a cooldown
+DEFAULT_COOLDOWN = 60.0
+
+_CLUSTER_NAMES = dict(CLUSTER_METRICS)
+_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+_NAME = re.compile(r'^\s*([A-Za-z][\w-]*)\s*:(?!=)\s*(.*)$')
+_CLAUSE = re.compile(r'\s+(for|clear|cooldown)\s+(\d+(?:\.\d+)?)\s*(ms|s|m|h)?\s*(?=$|\s)')
+_DROPPED = re.compile(r'([A-Za-z_][\w.]*)\s+dropped\s+by\b')
+_PERCENT = re.compile(r'(\d+(?:\.\d+)?)\s*%')
+_WHILE = re.compile(r'\bwhile\b')
+
+_COMPARE = {ast.Lt: np.less, ast.LtE: np.less_equal, ast.Gt: np.greater, ast.GtE: np.greater_equal,
+            ast.Eq: np.equal, ast.NotEq: np.not_equal}
+_ARITHMETIC = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.true_divide}
+
+
+class RuleError(ValueError):
+    pass
+
+
+class Rule(object):
+    def __init__(self,text):
+        '''
+            :param text: rule as written by the user, see the module documentation
+        '''
+        self.text = text.strip()
+        match = _NAME.match(self.text)
+        name,body = (match.group(1),match.group(2)) if match else (None,self.text)
+
+        durations = {}
+        def clause(match):
+            durations[match.group(1)] = float(match.group(2))*_UNITS[match.group(3) or 's']
+            return ' '
+        expression = _CLAUSE.sub(clause,' '+body).strip()
+        if not expression:
+            raise RuleError("Empty rule {0!r}".format(self.text))
+        self.duration = durations.get('for',0.)
+        # hysteresis, a firing rule clears once it stopped holding for as long as it had to hold
+        self.clear = durations.get('clear',self.duration)
+        self.cooldown = durations.get('cooldown',DEFAULT_COOLDOWN)
+        self.expression = expression
+        self.name = name or expression
+
+        source = _WHILE.sub(' and ',_PERCENT.sub(r'(\1/100.)',_DROPPED.sub(r'drop(\1)',expression)))
+        try:
+            tree = ast.parse(source,mode='eval')
+        except SyntaxError:
+            raise RuleError("Invalid rule {0!r}".format(self.text))
+        self.worker_names = set()
+        self.cluster_names = set()
+        self.dropped = set() # cluster metrics compared to their recent largest value
+        self.evaluate = self._compile(tree.body)
+        # a rule naming a worker column is checked on every worker
+        self.per_worker = bool(self.worker_names)
+
+    def _compile(self,node):
+        '''
+            Turn an expression into a function of (worker columns, cluster metrics,
+            drops) evaluating it with numpy
+        '''
+        if isinstance(node,ast.BoolOp):
+            operands = [self._compile(value) for value in node.values]
+            combine = np.logical_and if isinstance(node.op,ast.And) else np.logical_or
+            def boolean(columns,cluster,drops):
+                result = operands[0](columns,cluster,drops)
+                for operand in operands[1:]:
+                    result = combine(result,operand(columns,cluster,drops))
+                return result
+            return boolean
+        if isinstance(node,ast.UnaryOp) and isinstance(node.op,(ast.Not,ast.USub)):
+            operand = self._compile(node.operand)
+            negate = np.logical_not if isinstance(node.op,ast.Not) else np.negative
+            return lambda columns,cluster,drops: negate(operand(columns,cluster,drops))
+        if isinstance(node,ast.BinOp) and type(node.op) in _ARITHMETIC:
+            left,right,operator = self._compile(node.left),self._compile(node.right),_ARITHMETIC[type(node.op)]
+            return lambda columns,cluster,drops: operator(left(columns,cluster,drops),right(columns,cluster,drops))
+        if isinstance(node,ast.Compare) and all(type(op) in _COMPARE for op in node.ops):
+            operands = [self._compile(operand) for operand in [node.left]+node.comparators]
+            operators = [_COMPARE[type(op)] for op in node.ops]
+            def compare(columns,cluster,drops):
+                values = [operand(columns,cluster,drops) for operand in operands]
+                result = operators[0](values[0],values[1])
+                for i in range(1,len(operators)):
+                    result = np.logical_and(result,operators[i](values[i],values[i+1]))
+                return result
+            return compare
+        if isinstance(node,ast.Constant) and isinstance(node.value,(int,float)) and not isinstance(node.value,bool):
+            value = float(node.value)
+            return lambda columns,cluster,drops: value
+        if isinstance(node,ast.Name):
+            if node.id in COLUMN_NAMES:
+                self.worker_names.add(node.id)
+                return lambda columns,cluster,drops: columns[node.id]
+            return self._cluster(node.id)
+        if isinstance(node,ast.Attribute) and isinstance(node.value,ast.Name) and node.value.id == 'cluster':
+            return self._cluster(node.attr)
+        if (isinstance(node,ast.Call) and isinstance(node.func,ast.Name) and node.func.id == 'drop' and
+                len(node.args) == 1 and not node.keywords):
+            argument = node.args[0]
+            if isinstance(argument,ast.Attribute) and isinstance(argument.value,ast.Name) and argument.value.id == 'cluster':
+                name = argument.attr
+            elif isinstance(argument,ast.Name):
+                name = argument.id
+            else:
+                raise RuleError("Only a cluster metric can have dropped in {0!r}".format(self.text))
+            self._cluster(name)
+            self.dropped.add(name)
+            return lambda columns,cluster,drops: drops[name]
+        unparse = getattr(ast,'unparse',ast.dump)
+        raise RuleError("Unsupported expression {0!r} in {1!r}".format(unparse(node),self.text))
+
+    def _cluster(self,name):
+        if name not in _CLUSTER_NAMES:
+            raise RuleError("Unknown name {0!r} in {1!r}, worker columns are {2}, cluster metrics are {3}".format(
+                name,self.text,', '.join(COLUMN_NAMES),', '.join(_CLUSTER_NAMES)))
+        self.cluster_names.add(name)
+        return lambda columns,cluster,drops: cluster[name]
+
+
+class RuleState(object):
+    '''
+        Where a rule stands for every slot, a slot being a worker for a rule
+        checked per worker and the cluster otherwise
+    '''
+    def __init__(self,size=0):
+        self.holding_since = np.full(size,np.nan)
+        self.failing_since = np.full(size,np.nan)
+        self.firing = np.zeros(size,dtype=bool)
+        self.notified = np.zeros(size,dtype=bool)
+        self.last_notified = np.full(size,-np.inf)
+
+    def grow(self,size):
+        if size <= len(self.firing):
+            return
+        extra = size-len(self.firing)
+        self.holding_since = np.concatenate([self.holding_since,np.full(extra,np.nan)])
+        self.failing_since = np.concatenate([self.failing_since,np.full(extra,np.nan)])
+        self.firing = np.concatenate([self.firing,np.zeros(extra,dtype=bool)])
+        self.notified = np.concatenate([self.notified,np.zeros(extra,dtype=bool)])
+        self.last_notified = np.concatenate([self.last_notified,np.full(extra,-np.inf)])
+
+    def reset(self,slots):
+        self.holding_since[slots] = np.nan
+        self.failing_since[slots] = np.nan
+        self.firing[slots] = False
+        self.notified[slots] = False
+        self.last_notified[slots] = -np.inf
+
+
+class SensorRules(object):
+    '''
+        State of the rules for the snapshots of one sensor
+    '''
+    def __init__(self,rules):
+        self.states = [RuleState(0 if rule.per_worker else 1) for rule in rules]
+        self.addresses = [] # address of the worker of every slot
+        self.layout = None
+        self.drops = dict((name,deque()) for rule in rules for name in rule.dropped) # (time, value)
+
+
+class RuleEngine(object):
+    def __init__(self,rules,sinks=()):
+        '''
+            :param rules: list of Rule
+            :param sinks: objects whose notify(event) is called when a rule fires or clears
+        '''
+        self.rules = rules
+        self.sinks = sinks
+        self._sensors = {} # sensor name -> SensorRules
+
+    def _slots(self,state,workers):
+        '''
+            Slots of the workers of a snapshot, the state of a slot taken over by
+            another worker is reset
+        '''
+        slots = workers.index
+        if workers.layout != state.layout:
+            size = int(slots.max())+1 if len(slots) else 0
+            if size > len(state.addresses):
+                state.addresses.extend([None]*(size-len(state.addresses)))
+            moved = []
+            for slot,address in zip(slots.tolist(),workers.addresses):
+                if state.addresses[slot] != address:
+                    state.addresses[slot] = address
+                    moved.append(slot)
+            for rule,rule_state in zip(self.rules,state.states):
+                if rule.per_worker:
+                    rule_state.grow(size)
+                    rule_state.reset(moved)
+            state.layout = workers.layout
+        return slots
+
+    def _drops(self,state,now,cluster):
+        drops = {}
+        for name,samples in state.drops.items():
+            value = cluster[name]
+            samples.append((now,value))
+            while samples[0][0] < now-DROP_WINDOW:
+                samples.popleft()
+            largest = max(sample for _,sample in samples)
+            drops[name] = (largest-value)/largest if largest > 0 else 0.
+        return drops
+
+    def evaluate(self,name,now,value):
+        '''
+            Check the rules on a snapshot of a sensor
+
+            :param name: name of the sensor
+            :param now: time of the snapshot
+            :param value: currentValue of the sensor
+            :rtype: dict with the rules firing on the cluster and on every worker
+        '''
+        state = self._sensors.get(name)
+        if state is None:
+            state = self._sensors[name] = SensorRules(self.rules)
+        workers = value['Workers']
+        cluster = {}
+        for metric,(section,key) in CLUSTER_METRICS:
+            metric_value = value.get(section,{}).get(key)
+            cluster[metric] = np.nan if metric_value is None else float(metric_value)
+        drops = self._drops(state,now,cluster)
+        slots = self._slots(state,workers)
+
+        alerts = {'cluster': [], 'workers': {}}
+        for rule,rule_state in zip(self.rules,state.states):
+            with np.errstate(all='ignore'):
+                holds = rule.evaluate(workers.columns,cluster,drops)
+            if rule.per_worker:
+                rows = slots
+                holds = np.broadcast_to(np.asarray(holds,dtype=bool),(len(slots),))
+            else:
+                rows = np.zeros(1,dtype=np.int64)
+                holds = np.array([bool(holds)])
+            holding_since = rule_state.holding_since[rows]
+            failing_since = rule_state.failing_since[rows]
+            holding_since = np.where(holds,np.where(np.isnan(holding_since),now,holding_since),np.nan)
+            failing_since = np.where(holds,np.nan,np.where(np.isnan(failing_since),now,failing_since))
+            firing = rule_state.firing[rows]
+            fired = ~firing & holds & (now-holding_since >= rule.duration)
+            cleared = firing & ~holds & (now-failing_since >= rule.clear)
+            firing = (firing | fired) & ~cleared
+            rule_state.holding_since[rows] = holding_since
+            rule_state.failing_since[rows] = failing_since
+            rule_state.firing[rows] = firing
+
+            if fired.any() or cleared.any():
+                self._notify(name,now,rule,rule_state,rows,fired,cleared,workers if rule.per_worker else None)
+            if rule.per_worker:
+                for row in np.flatnonzero(firing).tolist():
+                    alerts['workers'].setdefault(workers.addresses[row],[]).append(rule.name)
+            elif firing[0]:
+                alerts['cluster'].append(rule.name)
+        return alerts
+
+    def _notify(self,name,now,rule,rule_state,rows,fired,cleared,workers):
+        last_notified = rule_state.last_notified[rows]
+        notified = rule_state.notified[rows]
+        # a rule notifies again only once its cooldown is over, and clears only what it notified
+        announce = fired & (now-last_notified >= rule.cooldown)
+        retract = cleared & notified
+        rule_state.last_notified[rows] = np.where(announce,now,last_notified)
+        rule_state.notified[rows] = (notified | announce) & ~retract
+        for state,changed in (('firing',announce),('cleared',retract)):
+            for row in np.flatnonzero(changed).tolist():
+                event = {'time': now, 'sensor': name, 'rule': rule.name, 'state': state,
+                         'worker': workers.addresses[row] if workers is not None else None}
+                for sink in self.sinks:
+                    try:
+                        sink.notify(event)
+                    except Exception:
+                        logger.warning("Unable to notify {0} of {1}".format(sink,event),exc_info=True)
+
+
+def read_rules(path):
+    '''
+        Rules listed in a file, one per line, # starts a comment
+
+        :rtype: list of the rule texts
+    '''
+    rules = []
+    with open(path) as f:
+        for line in f:
+            line = line.split('#',1)[0].strip()
+            if line:
+                rules.append(line)
+    return rules
+
+
+class AlertLog(object):
+    def __init__(self,path):
+        '''
+            Append every alert to a file, one JSON object per line
+
+            :param path: file the alerts are appended to
+        '''
+        self.path = path
+
+    def notify(self,event):
+        with open(self.path,'a') as f:
+            f.write(json.dumps(event,separators=(',',':'))+'\n')
+
+    def __str__(self):
+        return self.path
+
+
+class AlertHook(object):
+    def __init__(self,command):
+        '''
+            Run a shell command on every alert, without waiting for it. The alert
+            is passed in the environment as PTOP_RULE, PTOP_STATE, PTOP_SENSOR,
+            PTOP_WORKER and PTOP_TIME.
+
+            :param command: shell command
+        '''
+        self.command = command
+        self._running = []
+        self._lock = threading.Lock()
+
+    def notify(self,event):
+        environment = dict(os.environ)
+        environment.update(PTOP_RULE=event['rule'],PTOP_STATE=event['state'],PTOP_SENSOR=event['sensor'],
+                           PTOP_WORKER=event['worker'] or '',PTOP_TIME=repr(event['time']))
+        with self._lock:
+            # reap the commands which are done
+            self._running = [process for process in self._running if process.poll() is None]
+            self._running.append(subprocess.Popen(self.command,shell=True,env=environment,
+                                                  stdin=subprocess.DEVNULL,stdout=subprocess.DEVNULL,
+                                                  stderr=subprocess.DEVNULL))
+
+    def __str__(self):
+        return self.command
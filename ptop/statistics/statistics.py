@@ -7,33 +7,105 @@
 
 import os
 import logging
-from ptop.utils import ThreadJob
+import threading
+from time import time
+from ptop.utils import AsyncCollector
+from ptop.utils.instrumentation import instruments
+from .timeseries import TimeSeriesStore
 
 
 logger = logging.getLogger('ptop.statistics')
 
 
+def snapshot(values):
+    '''
+        Copy of the values of a sensor which the sensor does not change afterwards,
+        its sections are copied and the worker snapshots and task summaries are
+        replaced rather than changed by the sensors so they are shared
+    '''
+    return dict((key,dict(section) if isinstance(section,dict) else section) for key,section in values.items())
+
+
 class Statistics:
-    def __init__(self,sensors_list,stop_event,sensor_refresh_rates):
+    def __init__(self,sensors_list,stop_event,sensor_refresh_rates,sensor_timeout=2000,history_size=1024,recorder=None,
+                 concurrency=8,rules=None):
         '''
             Record keeping for primitive system parameters
+
+            :param recorder: Recorder the values of the sensors are appended to, if any
+            :param concurrency: maximum number of sensors updating at the same time
+            :param rules: RuleEngine checked on every snapshot, its alerts are published as the Alerts section
         '''
         self.sensor_refresh_rates = sensor_refresh_rates
+        self.sensor_timeout = sensor_timeout
+        self.concurrency = concurrency
         self.plugin_dir = os.path.join(os.path.dirname(__file__),'plugins') #plugins directory
         self.plugins = sensors_list # plugins list
-        self.statistics = {} # statistics object to be passed to the GUI
+        # statistics object to be passed to the GUI, sensor name -> snapshot of its values,
+        # a snapshot is replaced by the next one and never changed once published
+        self.statistics = {}
+        # sensor name -> version of its snapshot, moves every time a snapshot is published
+        self.versions = {}
+        self.history = {} # time series of every sensor, also passed to the GUI
         for sensor in self.plugins:
-            self.statistics[sensor.name] = sensor.currentValue
+            self.statistics[sensor.name] = snapshot(sensor.currentValue)
+            self.versions[sensor.name] = 0
+            self.history[sensor.name] = TimeSeriesStore(history_size)
         self.stop_event = stop_event
+        self.recorder = recorder
+        self.rules = rules
+        self.collector = None
+        # number of sensor updates recorded so far, waited upon by the headless mode
+        self.updates = 0
+        self._updated = threading.Condition()
 
     def generate(self):
         '''
-            Generate the stats using the plugins list periodically
+            Generate the stats using the plugins list periodically, all the sensors
+            share a single event loop running in the background
         '''
-        for sensor in self.plugins:
-            # update the sensors value periodically
-            job = ThreadJob(sensor.update,self.stop_event,self.sensor_refresh_rates[sensor]/1000)
-            job.start()
+        self.collector = AsyncCollector(self.plugins,self.stop_event,self.sensor_timeout/1000,
+                                        on_update=self.record,concurrency=self.concurrency)
+        self.collector.start()
+
+    def record(self,sensor):
+        '''
+            Append the latest values of a sensor to its history
+        '''
+        now = time()
+        self.history[sensor.name].record(now,sensor.currentValue)
+        if self.recorder is not None:
+            self.recorder.append(now,sensor.name,sensor.currentValue)
+        # the sensor is done updating, its values are copied and the copy swapped in whole,
+        # the version is moved after the swap so a reader never sees it ahead of the values
+        values = snapshot(sensor.currentValue)
+        if self.rules is not None:
+            with instruments.timer('rule_check'):
+                values['Alerts'] = self.rules.evaluate(sensor.name,now,values)
+        self.statistics[sensor.name] = values
+        self.versions[sensor.name] += 1
+        with self._updated:
+            self.updates += 1
+            self._updated.notify_all()
+
+    def wait(self,seen,timeout=None):
+        '''
+            Block until more than seen sensor updates were recorded or the stop
+            event is set
+
+            :param seen: number of updates already consumed
+            :rtype: number of updates recorded so far
+        '''
+        with self._updated:
+            self._updated.wait_for(lambda: self.updates > seen or self.stop_event.is_set(),timeout)
+            return self.updates
+
+    def close(self):
+        '''
+            Write what is left of the recording
+        '''
+        if self.recorder is not None:
+            self.recorder.close()
 
 
 
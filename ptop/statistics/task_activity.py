@@ -0,0 +1,98 @@
+'''
+    ptop.statistics.task_activity
+
+    Rolling per task prefix counters over the task stream. The records are
+    accumulated into one second buckets, a bucket leaving the window is
+    subtracted from the running totals so that a summary never walks over the
+    individual tasks.
+'''
+
+from collections import deque
+
+
+class TaskActivity(object):
+    # running totals kept per prefix
+    FIELDS = ('count','compute','transfer','nbytes')
+
+    def __init__(self,window=10,resolution=1):
+        '''
+            :param window: length of the rolling window in seconds
+            :param resolution: width of a bucket in seconds
+        '''
+        self.window = window
+        self.resolution = resolution
+        self._buckets = deque() # (bucket start, dict of prefix -> counters)
+        self._totals = {} # prefix -> counters over the whole window
+        self.missed = 0 # records dropped by the scheduler before they could be read
+        self._started = None # first add, the rates are over less than a window until then
+        self._last = None
+
+    def _expire(self,now):
+        horizon = now - self.window
+        while self._buckets and self._buckets[0][0] + self.resolution <= horizon:
+            _,counters = self._buckets.popleft()
+            for prefix,values in counters.items():
+                totals = self._totals[prefix]
+                for i,value in enumerate(values):
+                    totals[i] -= value
+                if totals[0] <= 0:
+                    del self._totals[prefix]
+
+    def add(self,now,records,missed=0):
+        '''
+            Account the records read from the task stream since the last call
+
+            :param now: time at which the records were read
+            :param records: (prefix, stop, compute time, transfer time, nbytes) tuples
+            :param missed: number of records skipped by the reader
+        '''
+        self.missed += missed
+        if self._started is None:
+            self._started = now
+        self._last = now
+        self._expire(now)
+        if not records:
+            return
+        start = now - now % self.resolution
+        if not self._buckets or self._buckets[-1][0] != start:
+            self._buckets.append((start,{}))
+        counters = self._buckets[-1][1]
+        for prefix,_,compute,transfer,nbytes in records:
+            values = counters.get(prefix)
+            if values is None:
+                values = counters[prefix] = [0,0,0,0]
+            totals = self._totals.get(prefix)
+            if totals is None:
+                totals = self._totals[prefix] = [0,0,0,0]
+            for row in (values,totals):
+                row[0] += 1
+                row[1] += compute
+                row[2] += transfer
+                row[3] += nbytes
+
+    def clear(self):
+        self._buckets.clear()
+        self._totals.clear()
+        self.missed = 0
+        self._started = self._last = None
+
+    def summary(self,now=None):
+        '''
+            :param now: drop the buckets older than the window at that time first
+            :rtype: list of (prefix, tasks/s, mean compute time, mean transfer time, bytes/s),
+                    the busiest prefix first
+        '''
+        if now is not None:
+            self._expire(now)
+        if not self._totals:
+            return []
+        span = float(min(self.window,max(self._last-self._started,self.resolution)))
+        rows = []
+        for prefix,(count,compute,transfer,nbytes) in self._totals.items():
+            rows.append((prefix,
+                         count/span,
+                         compute/count,
+                         transfer/count,
+                         nbytes/span))
+        rows.sort(key=lambda row: row[1],reverse=True)
+        return rows
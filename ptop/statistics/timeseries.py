@@ -0,0 +1,183 @@
+'''
+    Module ptop.statistics.timeseries
+
+    Fixed capacity history of the cluster and per worker metrics, kept in preallocated
+    numpy ring buffers so that appending a sample is O(1) and reading a window of
+    the latest samples never copies
+'''
+
+from collections import deque
+
+import numpy as np
+
+from ptop.constants import CLUSTER_METRICS
+
+# per worker metrics, columns of the worker snapshot (bytes are kept in bytes)
+WORKER_METRICS = ('cpu','memory','memory_limit','read','write','nthreads')
+
+
+class RingBuffer(object):
+    '''
+        Preallocated ring buffer of rows. Every row is written twice, at its slot and
+        at slot + capacity, so the latest n rows are always contiguous in memory and
+        can be handed out as a view.
+    '''
+    def __init__(self,capacity,width=1,fill=np.nan):
+        '''
+            :param capacity: number of rows kept
+            :param width: number of columns of every row
+            :param fill: value of the rows which were never written
+        '''
+        self.capacity = capacity
+        self.fill = fill
+        self._data = np.full((2*capacity,width),fill,dtype=np.float64)
+        self._head = 0
+        self.count = 0
+
+    @property
+    def width(self):
+        return self._data.shape[1]
+
+    def append(self,row):
+        '''
+            O(1) append of a row, the oldest row is dropped once the buffer is full
+        '''
+        self._data[self._head] = row
+        self._data[self._head+self.capacity] = row
+        self._head = (self._head+1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def window(self,n=None):
+        '''
+            View on the latest n rows, oldest first
+
+            :rtype: numpy array of shape (min(n,count), width)
+        '''
+        if n is None or n > self.count:
+            n = self.count
+        end = self._head + self.capacity
+        return self._data[end-n:end]
+
+    def latest(self):
+        '''
+            :rtype: the last appended row or None if nothing was appended yet
+        '''
+        if not self.count:
+            return None
+        return self._data[self._head+self.capacity-1]
+
+    def grow(self,width):
+        '''
+            Widen the buffer to at least width columns, the new columns hold the fill value
+        '''
+        if width <= self.width:
+            return
+        data = np.full((2*self.capacity,width),self.fill,dtype=np.float64)
+        data[:,:self.width] = self._data
+        self._data = data
+
+
+class TimeSeriesStore(object):
+    '''
+        History of a dask sensor. Cluster metrics share one ring buffer with a column per
+        metric, every worker metric has its own ring buffer with a column per worker.
+    '''
+    def __init__(self,capacity=1024,workers=64):
+        '''
+            :param capacity: number of samples kept
+            :param workers: number of worker columns preallocated, grown by doubling
+        '''
+        self.capacity = capacity
+        self.times = RingBuffer(capacity)
+        self.cluster = RingBuffer(capacity,len(CLUSTER_METRICS))
+        self.workers = dict((metric,RingBuffer(capacity,workers)) for metric in WORKER_METRICS)
+        self._cluster_columns = dict((name,i) for i,(name,_) in enumerate(CLUSTER_METRICS))
+        self._worker_columns = {} # address -> column
+        self._layout = None # layout of the snapshot the columns were computed for
+        self._columns = np.zeros(0,dtype=np.int64) # column of every row of the snapshot
+        self._released = deque() # (sample number, column) of the workers which left, oldest first
+        self._next_column = 0
+        self._samples = 0
+        self._cluster_row = np.empty(len(CLUSTER_METRICS))
+        self._worker_rows = dict((metric,np.empty(workers)) for metric in WORKER_METRICS)
+
+    def __len__(self):
+        return self.times.count
+
+    @property
+    def samples(self):
+        '''
+            total number of samples recorded, including the ones dropped from the buffers
+        '''
+        return self._samples
+
+    def _column(self,address):
+        '''
+            Column of a worker, a column is reused only once the history of its
+            previous worker went out of the buffer
+        '''
+        column = self._worker_columns.get(address)
+        if column is not None:
+            return column
+        if self._released and self._samples - self._released[0][0] >= self.capacity:
+            column = self._released.popleft()[1]
+        else:
+            column = self._next_column
+            self._next_column += 1
+            width = self.workers[WORKER_METRICS[0]].width
+            if column >= width:
+                self._grow(2*width)
+        self._worker_columns[address] = column
+        return column
+
+    def _grow(self,width):
+        for buffer in self.workers.values():
+            buffer.grow(width)
+        self._worker_rows = dict((metric,np.empty(width)) for metric in WORKER_METRICS)
+
+    def record(self,timestamp,value):
+        '''
+            Append a sample taken from the currentValue of a dask sensor
+
+            :param timestamp: time of the sample in seconds
+            :param value: currentValue of the sensor
+        '''
+        for i,(_,(section,key)) in enumerate(CLUSTER_METRICS):
+            self._cluster_row[i] = value.get(section,{}).get(key,np.nan)
+
+        workers = value.get('Workers')
+        if workers is not None and workers.layout != self._layout:
+            present = set(workers.addresses)
+            # forget the workers that left, their columns age out of the buffers
+            for address in [a for a in self._worker_columns if a not in present]:
+                self._released.append((self._samples,self._worker_columns.pop(address)))
+            self._columns = np.fromiter((self._column(address) for address in workers.addresses),
+                                        np.int64,len(workers))
+            self._layout = workers.layout
+
+        for metric,row in self._worker_rows.items():
+            row.fill(np.nan)
+            if workers is not None:
+                row[self._columns] = workers.columns[metric]
+            self.workers[metric].append(row)
+
+        self.times.append(timestamp)
+        self.cluster.append(self._cluster_row)
+        self._samples += 1
+
+    def series(self,metric,n=None):
+        '''
+            View on the latest n samples of a cluster metric, oldest first
+        '''
+        return self.cluster.window(n)[:,self._cluster_columns[metric]]
+
+    def worker_series(self,metric,address,n=None):
+        '''
+            View on the latest n samples of a worker metric, oldest first. Samples taken
+            before the worker joined are nan.
+        '''
+        return self.workers[metric].window(n)[:,self._worker_columns[address]]
+
+    def timestamps(self,n=None):
+        return self.times.window(n)[:,0]
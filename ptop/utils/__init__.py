@@ -1 +1,10 @@
-from .thread_jobs import ThreadJob
\ No newline at end of file
+from .thread_jobs import ThreadJob
+from .scheduler import AdaptiveInterval, DeadlineScheduler
+
+
+def __getattr__(name):
+    # the collector pulls in asyncio, it is only imported when asked for
+    if name == 'AsyncCollector':
+        from .async_jobs import AsyncCollector
+        return AsyncCollector
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__,name))
@@ -0,0 +1,173 @@
+'''
+    Collector engine running all the sensors on a single asyncio event loop,
+    hosted by one background thread
+'''
+
+import asyncio
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from .scheduler import AdaptiveInterval, DeadlineScheduler
+from .instrumentation import instruments
+
+
+class AsyncCollector(threading.Thread):
+    def __init__(self,sensors,event,timeout,on_update=None,concurrency=8):
+        '''runs the update coroutine of every sensor concurrently
+
+        Sensors providing an ``update_async`` coroutine are awaited directly, plain
+        ``update`` callbacks are run in a bounded thread pool so that they cannot
+        block the loop. At most ``concurrency`` sensor calls are in flight at once.
+        Every call is bounded by the timeout of the sensor, a sensor which misses
+        its deadline keeps its last values and is retried at its next interval
+        without delaying the other ones.
+
+        A sensor may provide a blocking ``prepare`` callback, run in the thread pool
+        before it connects and without any deadline, for one-off work such as slow
+        imports which would otherwise make it miss the deadline of its first call.
+
+        The updates are dispatched from a single heap of absolute deadlines, the
+        interval of a sensor adapts between its ``min_interval`` and ``max_interval``
+        according to the ``activity()`` it reports and the time its updates take.
+
+        :param sensors: list of plugin objects, their ``interval`` is the starting interval
+        :param event: external event for stopping the collector
+        :param timeout: deadline in seconds for every sensor call, unless the sensor
+                        has a ``timeout`` attribute of its own
+        :param on_update: called on the loop with the sensor after every successful update
+        :param concurrency: maximum number of sensor calls running at the same time
+        :type timeout: float
+        '''
+        self.sensors = sensors
+        self.event = event
+        self.timeout = timeout
+        self.on_update = on_update
+        self.concurrency = concurrency
+        self.intervals = dict((sensor,AdaptiveInterval(sensor.interval,
+                                                       getattr(sensor,'min_interval',None),
+                                                       getattr(sensor,'max_interval',None)))
+                              for sensor in sensors)
+        self.timers = DeadlineScheduler()
+        # sensor name -> dict with the time of the last update, its latency, the last error,
+        # the number of updates failed in a row and the current interval
+        self.health = dict((sensor.name,{'updated': None,'latency': None,'error': None,'failures': 0,
+                                         'interval': sensor.interval}) for sensor in sensors)
+        self.loop = None
+        self._slots = None
+        self._executor = None
+        self._wakeup = None
+        self._connected = set()
+        self._running = set()
+        self.logger = logging.getLogger(__name__)
+        super(AsyncCollector,self).__init__()
+        self.daemon = True
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._wakeup = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self.logger.info('Started the collector for the sensors {0}'.format(self.sensors))
+        try:
+            self.loop.run_until_complete(self._main())
+        finally:
+            self.loop.close()
+            self._executor.shutdown(wait=False)
+        self.logger.info('Finished the collector')
+
+    def submit(self,coroutine):
+        '''schedule a coroutine on the collector loop from another thread
+
+        :rtype: concurrent.futures.Future
+        '''
+        return asyncio.run_coroutine_threadsafe(coroutine,self.loop)
+
+    async def _call(self,sensor,name):
+        '''invoke ``<name>_async`` or the blocking ``<name>`` of a sensor'''
+        coroutine = getattr(sensor,name+'_async',None)
+        if coroutine is not None:
+            return await coroutine()
+        callback = getattr(sensor,name,None)
+        if callback is not None:
+            return await self.loop.run_in_executor(self._executor,callback)
+
+    async def _bounded_call(self,sensor,name):
+        '''call a sensor within its deadline, holding one of the concurrency slots'''
+        async with self._slots:
+            # timed once it holds a slot, the wait for the slot is not the sensor's
+            with instruments.timer('sensor_'+name):
+                return await asyncio.wait_for(self._call(sensor,name),self._timeout(sensor))
+
+    def _timeout(self,sensor):
+        return getattr(sensor,'timeout',None) or self.timeout
+
+    async def _update(self,sensor,deadline):
+        health = self.health[sensor.name]
+        begin = self.loop.time()
+        failed = True
+        try:
+            if sensor not in self._connected:
+                await self._call(sensor,'prepare')
+                await self._bounded_call(sensor,'start')
+                self._connected.add(sensor)
+            await self._bounded_call(sensor,'update')
+            failed = False
+            health['updated'] = time.time()
+            health['latency'] = self.loop.time()-begin
+            health['error'] = None
+            health['failures'] = 0
+            if self.on_update is not None:
+                self.on_update(sensor)
+        except asyncio.TimeoutError:
+            health['error'] = 'timeout'
+            self.logger.info('Sensor {0} missed its deadline of {1}s'.format(sensor.name,self._timeout(sensor)))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            health['error'] = str(e) or e.__class__.__name__
+            self.logger.info('Sensor {0} failed to update'.format(sensor.name),exc_info=True)
+        if failed:
+            health['failures'] += 1
+
+        activity = getattr(sensor,'activity',None)
+        interval = self.intervals[sensor].update(activity() if activity is not None and not failed else None,
+                                                 self.loop.time()-begin,failed)
+        health['interval'] = interval
+        self.timers.schedule(sensor,DeadlineScheduler.following(deadline,interval,self.loop.time()))
+        self._wakeup.set()
+
+    async def _dispatch(self):
+        '''start the updates whose deadline passed, a sensor is back in the heap
+        only once its update is done so its updates never overlap'''
+        while True:
+            for deadline,sensor in self.timers.pop_due(self.loop.time()):
+                task = self.loop.create_task(self._update(sensor,deadline))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+            self._wakeup.clear()
+            next_deadline = self.timers.next_deadline()
+            delay = None if next_deadline is None else max(0,next_deadline-self.loop.time())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(),delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _main(self):
+        now = self.loop.time()
+        for sensor in self.sensors:
+            self.timers.schedule(sensor,now)
+        dispatcher = self.loop.create_task(self._dispatch())
+        # wait for the global stop flag without blocking the loop
+        await self.loop.run_in_executor(None,self.event.wait)
+        tasks = [dispatcher] + list(self._running)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks,return_exceptions=True)
+        for sensor in self.sensors:
+            try:
+                await asyncio.wait_for(self._call(sensor,'close'),self._timeout(sensor))
+            except Exception:
+                self.logger.info('Sensor {0} failed to close'.format(sensor.name),exc_info=True)
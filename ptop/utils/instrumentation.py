@@ -0,0 +1,177 @@
+'''
+    Self instrumentation of ptop
+
+    Durations are recorded into log bucketed histograms covering the last minute
+    or two. Instrumentation is off by default, a disabled timer is a shared
+    object whose enter and exit do nothing, so the hooks left in the hot paths
+    cost a method call.
+'''
+
+import math
+import threading
+from time import perf_counter, time
+
+
+# name -> description, the order is the one of the overlay
+METRICS = (
+    ('scheduler_rtt', 'scheduler round trip'),
+    ('sensor_update', 'sensor update'),
+    ('rule_check',    'rule check'),
+    ('gui_update',    'frame'),
+    ('gui_charts',    'frame: charts'),
+    ('gui_table',     'frame: table'),
+    ('gui_display',   'frame: display'),
+    ('data_age',      'age of the data shown'),
+)
+
+# metrics measured by the collector, available without the interface
+COLLECTOR_METRICS = ('scheduler_rtt','sensor_update','rule_check')
+
+
+class Histogram(object):
+    '''
+        Histogram of durations with buckets growing geometrically by base, from
+        low to high seconds. Percentiles are accurate to half a bucket.
+    '''
+    def __init__(self,low=1e-5,high=100.,base=1.05):
+        self.low = low
+        self.base = base
+        self._log_base = math.log(base)
+        self.counts = [0]*(int(math.ceil(math.log(high/low)/self._log_base))+1)
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+
+    def record(self,value):
+        if value <= self.low:
+            bucket = 0
+        else:
+            bucket = min(int(math.log(value/self.low)/self._log_base)+1,len(self.counts)-1)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self,other):
+        merged = Histogram.__new__(Histogram)
+        merged.low,merged.base,merged._log_base = self.low,self.base,self._log_base
+        merged.counts = [a+b for a,b in zip(self.counts,other.counts)]
+        merged.count = self.count+other.count
+        merged.total = self.total+other.total
+        merged.max = max(self.max,other.max)
+        return merged
+
+    def percentile(self,q):
+        '''
+            :param q: percentile between 0 and 100
+            :rtype: value under which q percent of the samples are, None without samples
+        '''
+        if not self.count:
+            return None
+        rank = q/100.*self.count
+        seen = 0
+        for bucket,count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                if bucket == 0:
+                    return self.low
+                # geometric middle of the bucket
+                return min(self.low*self.base**(bucket-0.5),self.max)
+        return self.max
+
+
+class _Timer(object):
+    __slots__ = ('instruments','name','start')
+
+    def __init__(self,instruments,name):
+        self.instruments = instruments
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self,*args):
+        self.instruments.record(self.name,perf_counter()-self.start)
+
+
+class _NullTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Instruments(object):
+    def __init__(self,window=60):
+        '''
+            :param window: the percentiles cover between one and two windows, in seconds
+        '''
+        self.enabled = False
+        self.window = window
+        self._current = {}
+        self._previous = {}
+        self._rotated = time()
+        self._lock = threading.Lock()
+
+    def enable(self,enabled=True):
+        self.enabled = enabled
+
+    def timer(self,name):
+        '''
+            Context manager recording the time spent in its block
+        '''
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self,name)
+
+    def record(self,name,value):
+        if not self.enabled:
+            return
+        with self._lock:
+            if time() - self._rotated >= self.window:
+                self._previous,self._current = self._current,{}
+                self._rotated = time()
+            histogram = self._current.get(name)
+            if histogram is None:
+                histogram = self._current[name] = Histogram()
+            histogram.record(value)
+
+    def histogram(self,name):
+        '''
+            :rtype: Histogram of the last one to two windows, None without samples
+        '''
+        with self._lock:
+            current = self._current.get(name)
+            previous = self._previous.get(name)
+        if current is None or previous is None:
+            return current or previous
+        return current.merge(previous)
+
+    def summary(self,names=None):
+        '''
+            :param names: metrics to summarize, all of METRICS if None
+            :rtype: dict of name -> dict with count, p50, p99 and max in seconds
+        '''
+        summary = {}
+        for name in names or [name for name,_ in METRICS]:
+            histogram = self.histogram(name)
+            if histogram is None:
+                summary[name] = {'count': 0,'p50': None,'p99': None,'max': None}
+            else:
+                summary[name] = {'count': histogram.count,
+                                 'p50': histogram.percentile(50),
+                                 'p99': histogram.percentile(99),
+                                 'max': histogram.max}
+        return summary
+
+
+# shared by the whole process
+instruments = Instruments()
@@ -0,0 +1,90 @@
+'''
+    Logging of ptop
+
+    Records are put on a queue by the thread logging them and written to the
+    rotating log file by a background thread, so neither the interface nor the
+    collector ever wait on the disk. Every call site is rate limited, a message
+    repeated on every frame or every update ends up in the log a few times a
+    minute along with the number of times it was suppressed. Warnings and
+    errors are never suppressed.
+'''
+
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+LEVELS = ('DEBUG','INFO','WARNING','ERROR','CRITICAL')
+
+FORMAT = '%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s'
+DATE_FORMAT = '%H:%M:%S'
+
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self,rate=0.2,burst=5):
+        '''
+            Token bucket per call site, records of level WARNING and above always pass
+
+            :param rate: records per second let through once the burst is spent
+            :param burst: records let through at once
+        '''
+        super(RateLimitFilter,self).__init__()
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {} # (pathname, lineno) -> [tokens, last refill, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self,record):
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.pathname,record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst,now,0]
+            bucket[0] = min(self.burst,bucket[0]+(now-bucket[1])*self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            suppressed,bucket[2] = bucket[2],0
+        if suppressed:
+            record.msg = '{0} [{1} similar messages suppressed]'.format(record.getMessage(),suppressed)
+            record.args = None
+        return True
+
+
+def configure_logging(path,level='INFO',max_bytes=4*1024**2,backups=2):
+    '''
+        Send the records of every logger to a rotating file written by a
+        background thread
+
+        :param path: log file
+        :param level: name of the lowest level logged, see LEVELS
+        :param max_bytes: size the file is rotated at
+        :param backups: number of rotated files kept
+        :rtype: QueueListener writing the file, stop it to flush the log
+    '''
+    # create file if not exists
+    if not os.path.exists(path):
+        open(path,'w').close()
+
+    writer = logging.handlers.RotatingFileHandler(path,maxBytes=max_bytes,backupCount=backups)
+    writer.setFormatter(logging.Formatter(FORMAT,DATE_FORMAT))
+    records = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(records)
+    handler.addFilter(RateLimitFilter())
+
+    root = logging.getLogger()
+    for previous in root.handlers[:]:
+        root.removeHandler(previous)
+    root.addHandler(handler)
+    root.setLevel(getattr(logging,level))
+
+    listener = logging.handlers.QueueListener(records,writer)
+    listener.start()
+    return listener
@@ -0,0 +1,100 @@
+'''
+    Deadline based scheduling of the sensor updates
+
+    Every sensor has an absolute deadline in a heap shared by all the sensors,
+    the next deadline is computed from the previous one and not from the end of
+    the update so the time spent updating does not add up to the period. The
+    period itself adapts between the bounds of the sensor, see AdaptiveInterval.
+'''
+
+import heapq
+import itertools
+import math
+
+
+class AdaptiveInterval(object):
+    def __init__(self,interval,min_interval=None,max_interval=None,backoff=1.5,quiet=0.01,busy=0.05):
+        '''
+            Update interval of a sensor, backing off while its values are idle or its
+            source is slow to answer and tightening while its values change quickly
+
+            :param interval: interval in seconds to start from
+            :param min_interval: lower bound of the interval, interval if None
+            :param max_interval: upper bound of the interval, interval if None
+            :param backoff: factor the interval grows by when backing off
+            :param quiet: activity under which the values are considered idle
+            :param busy: activity over which the values are considered changing quickly
+        '''
+        self.min_interval = min(min_interval or interval,interval)
+        self.max_interval = max(max_interval or interval,interval)
+        self.interval = interval
+        self.backoff = backoff
+        self.quiet = quiet
+        self.busy = busy
+
+    @property
+    def adaptive(self):
+        return self.min_interval < self.max_interval
+
+    def update(self,activity=None,latency=0,failed=False):
+        '''
+            Adapt the interval after an update
+
+            :param activity: how fast the values changed since the previous update, None if unknown
+            :param latency: time in seconds the update took
+            :param failed: the update failed or missed its deadline
+            :rtype: new interval
+        '''
+        interval = self.interval
+        if failed:
+            interval *= 2
+        elif activity is not None and activity >= self.busy:
+            interval /= 2
+        elif activity is not None and activity <= self.quiet:
+            interval *= self.backoff
+        # a source is never asked more often than it can answer
+        interval = max(interval,2*latency)
+        self.interval = min(max(interval,self.min_interval),self.max_interval)
+        return self.interval
+
+
+class DeadlineScheduler(object):
+    '''
+        Heap of the absolute deadlines of the sensors
+    '''
+    def __init__(self):
+        self._heap = [] # (deadline, tie breaker, key)
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def schedule(self,key,deadline):
+        heapq.heappush(self._heap,(deadline,next(self._counter),key))
+
+    def next_deadline(self):
+        '''
+            :rtype: earliest deadline, None if nothing is scheduled
+        '''
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self,now):
+        '''
+            :rtype: list of (deadline, key) due at now, earliest first
+        '''
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline,_,key = heapq.heappop(self._heap)
+            due.append((deadline,key))
+        return due
+
+    @staticmethod
+    def following(deadline,interval,now):
+        '''
+            Deadline following deadline, the periods that were overrun are skipped
+            rather than run in a burst
+
+            :rtype: first deadline + k*interval after now, k >= 1
+        '''
+        periods = max(1,int(math.floor((now-deadline)/interval))+1)
+        return deadline + periods*interval
@@ -3,7 +3,9 @@
     run things as a thread job
 '''
 
-import threading,logging
+import threading,logging,time
+
+from .scheduler import DeadlineScheduler
 
 class ThreadJob(threading.Thread):
     def __init__(self,callback,event,interval):
@@ -23,6 +25,9 @@ class ThreadJob(threading.Thread):
 
     def run(self):
         self.logger.info('Started thread job for the sensor {0}'.format(self.callback))
-        while not self.event.wait(self.interval):
+        # absolute deadlines, the time spent in the callback does not delay the next one
+        deadline = time.time() + self.interval
+        while not self.event.wait(max(0,deadline-time.time())):
             self.callback()
+            deadline = DeadlineScheduler.following(deadline,self.interval,time.time())
         self.logger.info("Finished thread job {0}".format(self.callback))
@@ -32,16 +32,18 @@ setup(
 
         # Specify the Python versions you support here. In particular, ensure
         # that you indicate whether you support Python 2, Python 3 or both.
-        'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
-        'Programming Language :: Python :: 3.7'
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12'
     ],
 
+    # asyncio, module __getattr__, ThreadingHTTPServer and ast.Constant literals
+    python_requires='>=3.8',
+
     author='Ankush Sharma',
 
     author_email='darxtrix@gmail.com',
@@ -62,7 +64,8 @@ setup(
         "drawille>=0.1.0",
         "requests>=2.20.1",
         "urllib3>=1.24.1",
-        "huepy>=0.9.8.1"
+        "huepy>=0.9.8.1",
+        "numpy>=1.17"
     ],
 
     data_files=['VERSION','README.md','CONTRIBUTORS.md','LICENSE'],
@@ -0,0 +1,108 @@
+'''
+    Headless batch mode
+'''
+
+import csv
+import json
+import threading
+
+import pytest
+
+from ptop.core.snapshot import WorkerIndex, WorkerSnapshot
+from ptop.interfaces.batch import BatchWriter, GIVE_UP_FAILURES
+from ptop.statistics.timeseries import TimeSeriesStore
+
+
+class FakeSensor(object):
+    track_workers = None
+
+
+class FakeCollector(object):
+    def __init__(self,names):
+        self.health = dict((name,{'failures': 0,'error': None}) for name in names)
+
+
+class FakeStatistics(object):
+    '''
+        Statistics whose sensors update on every wait, except the ones told to fail
+    '''
+    def __init__(self,names,failing=()):
+        self.statistics = dict((name,{}) for name in names)
+        self.history = dict((name,TimeSeriesStore(capacity=8)) for name in names)
+        self.collector = FakeCollector(names)
+        self.plugins = [FakeSensor() for _ in names]
+        self.failing = failing
+        self.waits = 0
+
+    def wait(self,seen,timeout=None):
+        self.waits += 1
+        for name in self.statistics:
+            if name in self.failing:
+                health = self.collector.health[name]
+                health['failures'] += 1
+                health['error'] = 'no answer from '+name
+                continue
+            workers = WorkerSnapshot.from_worker_info(
+                {'tcp://w': {'nthreads': 2,'memory_limit': 0,'metrics': {'memory': 0,'cpu': self.waits}}},WorkerIndex())
+            value = {'CPU': {'cpu_usage': self.waits},'Workers': workers}
+            self.statistics[name] = value
+            self.history[name].record(float(self.waits),value)
+        return seen + 1
+
+
+def _run(tmp_path,statistics,**kwargs):
+    output = str(tmp_path / 'out')
+    writer = BatchWriter(statistics,threading.Event(),output=output,flush_interval=0,**kwargs)
+    done = writer.run()
+    with open(output) as f:
+        return writer,done,f.read()
+
+
+def test_jsonl_rows(tmp_path):
+    statistics = FakeStatistics(['a','b'])
+    writer,done,text = _run(tmp_path,statistics,fields=('time','sensor','cpu_usage','workers'),iterations=2)
+    assert done
+    assert writer.stop_event.is_set()
+    rows = [json.loads(line) for line in text.splitlines()]
+    assert [(row['sensor'],row['time'],row['cpu_usage']) for row in rows] == [
+        ('a',1,1),('b',1,1),('a',2,2),('b',2,2)]
+    assert rows[0]['workers'][0]['address'] == 'tcp://w'
+    assert rows[0]['workers'][0]['cpu'] == 1
+    # the workers are only tracked when they are written out
+    assert all(sensor.track_workers for sensor in statistics.plugins)
+
+
+def test_csv_rows(tmp_path):
+    statistics = FakeStatistics(['a'])
+    _,done,text = _run(tmp_path,statistics,fmt='csv',fields=('sensor','cpu_usage'),iterations=3)
+    assert done
+    assert list(csv.reader(text.splitlines())) == [['sensor','cpu_usage'],['a','1'],['a','2'],['a','3']]
+    assert not statistics.plugins[0].track_workers
+
+
+def test_gives_up_on_a_failing_sensor(tmp_path):
+    statistics = FakeStatistics(['a','down'],failing=('down',))
+    writer,done,text = _run(tmp_path,statistics,fields=('sensor',),iterations=1)
+    # the sensor that answers writes its row, the other one is given up on after a few failures
+    assert not done
+    assert writer.failed == {'down': 'no answer from down'}
+    assert statistics.waits == GIVE_UP_FAILURES
+    assert [json.loads(line) for line in text.splitlines()] == [{'sensor': 'a'}]
+
+
+def test_load_fields_track_the_workers(tmp_path):
+    statistics = FakeStatistics(['a','b'])
+    # the imbalance of a polling sensor needs the load of every worker, an aggregating scheduler sends it
+    statistics.plugins[1].aggregate_key = 'cpu'
+    _run(tmp_path,statistics,fields=('sensor','load_cv'),iterations=1)
+    assert [sensor.track_workers for sensor in statistics.plugins] == [True,False]
+
+
+def test_invalid_options():
+    statistics = FakeStatistics(['a'])
+    with pytest.raises(ValueError):
+        BatchWriter(statistics,threading.Event(),fields=('nope',))
+    with pytest.raises(ValueError):
+        BatchWriter(statistics,threading.Event(),fmt='xml')
+    with pytest.raises(ValueError):
+        BatchWriter(statistics,threading.Event(),fmt='csv',fields=('sensor','workers'))
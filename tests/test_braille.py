@@ -0,0 +1,70 @@
+'''
+    Scaling of the samples of the braille charts
+'''
+
+from ptop.interfaces.braille import BrailleChart, StackedBrailleChart
+
+FULL = chr(0x28ff)
+# both columns of a cell with only their bottom dot drawn
+BOTTOM = chr(0x2800|0x40|0x80)
+
+
+def _columns(chart):
+    '''
+        the last column of every row, from the top
+    '''
+    return [line[-1] for line in chart.frame().split('\n')]
+
+
+def test_scaling():
+    chart = BrailleChart(4,2)
+    # 2 rows of 4 dots, a value is drawn with ceil(value*8) dots
+    for value,expected in ((0,[' ',' ']),
+                           (0.1,[' ',BOTTOM]),
+                           (0.5,[' ',FULL]),
+                           (0.51,[BOTTOM,FULL]),
+                           (1,[FULL,FULL])):
+        chart.push(value)
+        assert _columns(chart) == expected,value
+
+
+def test_out_of_range_values_are_clamped():
+    chart = BrailleChart(4,2)
+    chart.push(3.5)
+    assert _columns(chart) == [FULL,FULL]
+    chart.push(-1)
+    assert _columns(chart) == [' ',' ']
+    chart.push(float('nan'))
+    assert _columns(chart) == [' ',' ']
+
+
+def test_scrolling():
+    chart = BrailleChart(3,1)
+    assert chart.capacity == 3
+    chart.extend([1,1,0,1])
+    # the oldest sample scrolled out, every row keeps the width of the chart
+    assert chart.frame() == FULL+' '+FULL
+    chart.clear()
+    assert chart.frame() == '   '
+
+
+def test_single_dot_samples():
+    chart = BrailleChart(2,1,peak_width=1)
+    assert chart.capacity == 4
+    chart.push(1)
+    # the left column of a new cell, then its right column
+    assert chart.frame()[-1] == chr(0x2800|0x01|0x02|0x04|0x40)
+    chart.push(0.25)
+    assert chart.frame()[-1] == chr(0x2800|0x01|0x02|0x04|0x40|0x80)
+    assert len(chart.frame()) == 2
+
+
+def test_stacked_layers():
+    chart = StackedBrailleChart(2,1)
+    # the first layer is solid, the second one has every other dot drawn: the two
+    # bottom dots, then the third one
+    chart.push((0.5,0.5))
+    assert chart.frame()[-1] == chr(0x2800|0x40|0x80|0x04|0x20|0x02|0x10)
+    # the layers are clamped to the height of the chart
+    chart.push((1,1))
+    assert chart.frame()[-1] == FULL
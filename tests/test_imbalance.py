@@ -0,0 +1,84 @@
+'''
+    Load imbalance and stragglers
+'''
+
+import numpy as np
+import pytest
+
+from ptop.core.snapshot import WorkerIndex, WorkerSnapshot
+from ptop.plugins.scheduler_feed import load_summary
+from ptop.statistics.imbalance import ImbalanceTracker, robust_scores
+
+
+class FakeWorker(object):
+    def __init__(self,address,occupancy,processing):
+        self.address = address
+        self.nthreads = 1
+        self.occupancy = occupancy
+        self.processing = set(range(processing))
+        self.metrics = {}
+
+    def info(self):
+        return {'nthreads': self.nthreads,'memory_limit': 0,'occupancy': self.occupancy,
+                'processing': len(self.processing),'metrics': {'memory': 0,'cpu': 0}}
+
+
+def _cluster(loads):
+    workers = [FakeWorker('tcp://{0}'.format(i),occupancy,processing) for i,(occupancy,processing) in enumerate(loads)]
+    snapshot = WorkerSnapshot.from_worker_info(dict((ws.address,ws.info()) for ws in workers),WorkerIndex())
+    # the summary is reduced by the scheduler
+    return snapshot,load_summary(workers)
+
+
+def test_robust_scores():
+    values = np.array([1.,2.,3.,4.,100.])
+    # distance to the median in median absolute deviations, scaled to standard deviations
+    assert robust_scores(values,3,1,20.2).tolist() == pytest.approx([-1.349,-0.6745,0,0.6745,65.4265])
+    # more than half of the values are the median, the mean absolute deviation is used
+    assert robust_scores(values,3,0,20.2)[-1] == pytest.approx(0.7979*97/20.2)
+    assert robust_scores(values,3,0,0).tolist() == [0,0,0,0,0]
+
+
+def test_scores_and_statistics():
+    workers,summary = _cluster([(1,1),(2,2),(3,3),(4,4),(100,4)])
+    imbalance = ImbalanceTracker().update(workers,0.,summary)
+    # a worker is scored on its most unusual load, only a load above the median counts and
+    # the first score is taken as it is
+    assert workers.column('straggler_score').tolist() == pytest.approx([0,0,0,0.6745,65.4265])
+    assert imbalance['n_stragglers'] == 1
+    assert imbalance['stragglers'] == [('tcp://4',65.43)]
+    assert imbalance['load_cv'] == pytest.approx(1.773)
+    assert imbalance['load_max_median'] == pytest.approx(33.33)
+    assert imbalance['processing_cv'] == pytest.approx(0.416)
+    assert imbalance['processing_max_median'] == pytest.approx(1.33)
+
+
+def test_straggler_threshold_and_smoothing():
+    tracker = ImbalanceTracker(threshold=3.5,halflife=5)
+    # median 1 and mad 1, c is 6 standard deviations above the median
+    summary = {'n_workers': 3,'totals': {'load': 0},'percentiles': {'load': [0,1,1,1,1]},
+               'spread': {'load': (1,1,1)}}
+    high = WorkerSnapshot.from_columns(['a','b','c'],{'load': np.array([0.,1.,1.+6/0.6745])},WorkerIndex())
+    imbalance = tracker.update(high,0.,summary)
+    assert imbalance['stragglers'] == [('c',6.0)]
+    # the load is back to the median, the score halves over a halflife
+    back = WorkerSnapshot.from_columns(['a','b','c'],{'load': np.array([0.,1.,1.])},WorkerIndex())
+    imbalance = tracker.update(back,5.,summary)
+    assert back.column('straggler_score')[2] == pytest.approx(3)
+    assert imbalance['n_stragglers'] == 0
+    # a score right at the threshold is a straggler
+    at = WorkerSnapshot.from_columns(['a','b','c'],{'load': np.array([0.,1.,1.+4/0.6745])},WorkerIndex())
+    imbalance = tracker.update(at,10.,summary)
+    assert at.column('straggler_score')[2] == pytest.approx(3.5)
+    assert imbalance['n_stragglers'] == 1
+
+
+def test_unknown_load():
+    workers,_ = _cluster([(1,1),(100,1)])
+    assert ImbalanceTracker().update(workers,0.) == {}
+    assert workers.column('straggler_score').tolist() == [0,0]
+    # an empty cluster has no imbalance
+    empty,summary = _cluster([])
+    imbalance = ImbalanceTracker().update(empty,0.,summary)
+    assert imbalance['n_stragglers'] == 0
+    assert imbalance['load_cv'] == 0
@@ -0,0 +1,80 @@
+'''
+    OpenMetrics page of the sensors
+'''
+
+import threading
+
+from ptop.core.snapshot import WorkerIndex, WorkerSnapshot
+from ptop.interfaces.openmetrics import MetricsExporter, render_sensor
+from ptop.statistics.timeseries import TimeSeriesStore
+
+
+def _workers(cpus):
+    return WorkerSnapshot.from_worker_info(dict(
+        ('tcp://'+address,{'nthreads': 2,'memory_limit': 1024,'metrics': {'memory': 512,'cpu': cpu}})
+        for address,cpu in zip('abcd',cpus)),WorkerIndex())
+
+
+def test_render_sensor():
+    values = {'CPU': {'cpu_usage': 50},'Memory': {'used_memory': 2.5},'Workers': _workers([150,50])}
+    samples = render_sensor('c"1',values,100.)
+    # values are in base units and the labels are escaped
+    assert samples['cpu_usage_ratio'] == 'ptop_cpu_usage_ratio{cluster="c\\"1"} 0.5\n'
+    assert samples['used_memory_bytes'] == 'ptop_used_memory_bytes{cluster="c\\"1"} 2621440.0\n'
+    assert samples['update_timestamp_seconds'] == 'ptop_update_timestamp_seconds{cluster="c\\"1"} 100.0\n'
+    assert 'total_memory_bytes' not in samples
+    assert samples['worker_memory_bytes'] == ('ptop_worker_memory_bytes{cluster="c\\"1",worker="tcp://a"} 512\n'
+                                              'ptop_worker_memory_bytes{cluster="c\\"1",worker="tcp://b"} 512\n')
+    assert samples['worker_cpu_ratio'] == ('ptop_worker_cpu_ratio{cluster="c\\"1",worker="tcp://a"} 1.5\n'
+                                           'ptop_worker_cpu_ratio{cluster="c\\"1",worker="tcp://b"} 0.5\n')
+    quantiles = samples['worker_cpu_ratio_quantile'].splitlines()
+    assert quantiles[0] == 'ptop_worker_cpu_ratio_quantile{cluster="c\\"1",quantile="0.0"} 0.5'
+    assert quantiles[-1] == 'ptop_worker_cpu_ratio_quantile{cluster="c\\"1",quantile="1.0"} 1.5'
+
+
+def test_quantiles_skip_unknown_cpu():
+    samples = render_sensor('c',{'Workers': _workers([float('nan'),30,10,20])},0)
+    assert 'worker="tcp://a"} NaN\n' in samples['worker_cpu_ratio']
+    # the worker without a cpu is left out of the ranking rather than breaking it
+    assert [line.rsplit(' ',1)[1] for line in samples['worker_cpu_ratio_quantile'].splitlines()] == [
+        '0.1','0.2','0.3','0.3','0.3']
+    # no cpu known at all, no quantiles
+    assert 'worker_cpu_ratio_quantile' not in render_sensor('c',{'Workers': _workers([float('nan')])},0)
+
+
+class FakeStatistics(object):
+    def __init__(self,names):
+        self.statistics = dict((name,{'CPU': {'cpu_usage': 10},'Workers': _workers([10])}) for name in names)
+        self.history = dict((name,TimeSeriesStore(capacity=4)) for name in names)
+        self.versions = dict((name,0) for name in names)
+
+    def update(self,name,cpu):
+        self.statistics[name] = {'CPU': {'cpu_usage': cpu},'Workers': self.statistics[name]['Workers']}
+        self.history[name].record(float(cpu),self.statistics[name])
+        self.versions[name] += 1
+
+
+def test_page():
+    statistics = FakeStatistics(['b','a'])
+    exporter = MetricsExporter(statistics,threading.Event(),0,host='127.0.0.1')
+    try:
+        page = exporter.page.decode('utf-8')
+        assert page.startswith('# TYPE ptop_cpu_usage_ratio gauge\n# HELP ptop_cpu_usage_ratio ')
+        assert page.endswith('# EOF\n')
+        # the samples of a family are grouped, in the order of the sensor names
+        cpu = [line for line in page.splitlines() if line.startswith('ptop_cpu_usage_ratio')]
+        assert cpu == ['ptop_cpu_usage_ratio{cluster="a"} 0.1','ptop_cpu_usage_ratio{cluster="b"} 0.1']
+        # a sensor without a sample has no update time yet
+        assert 'ptop_update_timestamp_seconds{cluster="a"} NaN\n' in page
+
+        statistics.update('a',20)
+        # only the sensors with a new version are rendered again
+        rendered = exporter._samples['b']
+        page = exporter._page().decode('utf-8')
+        assert exporter._samples['b'] is rendered
+        assert 'ptop_cpu_usage_ratio{cluster="a"} 0.2\n' in page
+        assert 'ptop_update_timestamp_seconds{cluster="a"} 20.0\n' in page
+        assert 'ptop_cpu_usage_ratio{cluster="b"} 0.1\n' in page
+    finally:
+        # never started, only its socket is open
+        exporter.server.server_close()
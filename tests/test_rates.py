@@ -0,0 +1,67 @@
+'''
+    Exponentially weighted rates of the workers
+'''
+
+import math
+
+import numpy as np
+import pytest
+
+from ptop.statistics.rates import RateEngine
+
+COLUMNS = (('speed',('speed','rate')),('count',('count','counter')))
+
+
+def _smooth(engine,addresses,now,rows):
+    return engine.smooth(addresses,np.full(len(addresses),float(now)),np.array(rows,dtype=float))
+
+
+def test_first_samples():
+    engine = RateEngine(halflife=10,columns=COLUMNS)
+    # a rate starts from its first value, a counter has no rate before its second sample
+    assert _smooth(engine,['a'],0,[[100,1000]]).tolist() == [[100,0]]
+    # the first rate of a counter is taken as it is
+    assert _smooth(engine,['a'],10,[[100,1500]]).tolist() == [[100,50]]
+
+
+def test_weight_depends_on_the_elapsed_time():
+    engine = RateEngine(halflife=10,columns=COLUMNS)
+    _smooth(engine,['a'],0,[[0,0]])
+    _smooth(engine,['a'],10,[[0,0]])
+    # a sample one halflife after the previous one weighs half
+    assert _smooth(engine,['a'],20,[[100,1000]]).tolist() == [[50,50]]
+    # and a sample after a shorter gap weighs less
+    smoothed = _smooth(engine,['a'],25,[[100,1250]])
+    weight = 1-math.exp(-5*math.log(2)/10)
+    assert smoothed[0,0] == pytest.approx(50+weight*50)
+    assert smoothed[0,1] == pytest.approx(50)
+
+
+def test_stale_sample_is_ignored():
+    engine = RateEngine(halflife=10,columns=COLUMNS)
+    _smooth(engine,['a'],0,[[10,0]])
+    _smooth(engine,['a'],10,[[10,100]])
+    # a heartbeat seen twice does not move the average
+    assert _smooth(engine,['a'],10,[[90,900]]).tolist() == [[10,10]]
+
+
+def test_counter_reset():
+    engine = RateEngine(halflife=10,columns=COLUMNS)
+    _smooth(engine,['a'],0,[[0,1000]])
+    _smooth(engine,['a'],10,[[0,1100]])
+    # the worker restarted, its counter went backwards: the rate is kept
+    assert _smooth(engine,['a'],20,[[0,5]]).tolist() == [[0,10]]
+    # and the counter is followed from its new value
+    assert _smooth(engine,['a'],30,[[0,105]]).tolist() == [[0,10]]
+    assert _smooth(engine,['a'],40,[[0,405]]).tolist() == [[0,20]]
+
+
+def test_workers_joining_and_leaving():
+    engine = RateEngine(halflife=10,columns=COLUMNS)
+    _smooth(engine,['a','b'],0,[[10,0],[20,0]])
+    _smooth(engine,['a','b'],10,[[10,100],[20,200]])
+    # the rows follow the workers, a new worker starts over
+    smoothed = _smooth(engine,['c','b'],20,[[30,7],[20,400]])
+    assert smoothed.tolist() == [[30,0],[20,20]]
+    smoothed = _smooth(engine,['b','c'],30,[[20,600],[30,107]])
+    assert smoothed.tolist() == [[20,20],[30,10]]
@@ -0,0 +1,99 @@
+'''
+    Recordings written by the Recorder, read back by the RecordingReader and
+    played back by the ReplaySensor
+'''
+
+import numpy as np
+import pytest
+
+from ptop.core import WorkerIndex, WorkerSnapshot
+from ptop.plugins.replay_sensor import ReplaySensor
+from ptop.statistics import Recorder, RecordingError, RecordingReader
+
+
+def _value(sample,addresses,index,previous=None):
+    info = dict((address,{'nthreads': 2,'memory_limit': 8*1024**3,
+                          'metrics': {'cpu': 12.34+sample+i,'memory': 1024**3+sample*4096+i}})
+                for i,address in enumerate(addresses))
+    workers = WorkerSnapshot.from_worker_info(info,index,previous)
+    return {'Memory': {'used_memory': float(sample)},'Cluster': {'n_workers': len(addresses)},'Workers': workers}
+
+
+def _record(path,samples=10,chunk_frames=4):
+    '''
+        samples one second apart, a worker joins at the fifth one
+    '''
+    recorder = Recorder(path,chunk_frames=chunk_frames)
+    index = WorkerIndex()
+    values = []
+    workers = None
+    for sample in range(samples):
+        addresses = ['a','b'] if sample < 4 else ['a','b','c']
+        value = _value(sample,addresses,index,workers)
+        workers = value['Workers']
+        recorder.append(100.+sample,'c',value)
+        values.append(value)
+    recorder.close()
+    return values
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path/'rec')
+    values = _record(path)
+    reader = RecordingReader(path)
+    # 4 frames per chunk
+    assert len(reader) == 3
+    assert (reader.start,reader.stop) == (100.,109.)
+    assert reader.names() == ['c']
+
+    frames = [frame for chunk in range(len(reader)) for frame in reader.chunk(chunk)['c']]
+    assert [timestamp for timestamp,_ in frames] == [100.+sample for sample in range(10)]
+    for (_,frame),value in zip(frames,values):
+        assert frame['Memory'] == value['Memory']
+        assert frame['Cluster'] == value['Cluster']
+        addresses,columns = frame['Workers']
+        assert addresses == value['Workers'].addresses
+        # quantized to a tenth of a percent of cpu and to the KiB
+        np.testing.assert_allclose(columns['cpu'],value['Workers'].column('cpu'),atol=0.05)
+        np.testing.assert_allclose(columns['memory'],value['Workers'].column('memory'),atol=512)
+        np.testing.assert_array_equal(columns['nthreads'],[2]*len(addresses))
+
+
+def test_append_to_a_truncated_recording(tmp_path):
+    path = str(tmp_path/'rec')
+    _record(path,samples=8)
+    with open(path,'ab') as f:
+        # a chunk cut by a crash
+        f.write(b'CHNK\x01\x00')
+    assert len(RecordingReader(path)) == 2
+    recorder = Recorder(path)
+    recorder.append(200.,'c',_value(0,['a'],WorkerIndex()))
+    recorder.close()
+    reader = RecordingReader(path)
+    assert len(reader) == 3
+    assert reader.stop == 200.
+
+
+def test_not_a_recording(tmp_path):
+    path = tmp_path/'rec'
+    path.write_bytes(b'something else')
+    with pytest.raises(RecordingError):
+        RecordingReader(str(path))
+
+
+def test_seek(tmp_path):
+    path = str(tmp_path/'rec')
+    _record(path)
+    reader = RecordingReader(path)
+    assert [reader.chunk_at(t) for t in (0.,100.,103.5,104.,108.9,1000.)] == [0,0,0,1,2,2]
+
+    replay = ReplaySensor(path,recorded_name='c',name='c',sensorType=None,interval=1)
+    replay.toggle_pause()
+    replay.update()
+    assert replay.currentValue['Memory']['used_memory'] == 0.
+    # the frame shown is the last one at or before the position, the position stays in the recording
+    for seconds,sample in ((5.5,5),(-2,3),(100,9),(-1000,0),(7.2,7)):
+        replay.seek(seconds)
+        replay.update()
+        assert replay.currentValue['Memory']['used_memory'] == float(sample)
+        assert len(replay.currentValue['Workers']) == (2 if sample < 4 else 3)
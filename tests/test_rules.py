@@ -0,0 +1,124 @@
+'''
+    Parsing of the alert rules and their firing and clearing
+'''
+
+import numpy as np
+import pytest
+
+from ptop.core import WorkerIndex, WorkerSnapshot
+from ptop.statistics import Rule, RuleEngine, RuleError
+
+
+class Sink(object):
+    def __init__(self):
+        self.events = []
+
+    def notify(self,event):
+        self.events.append((event['time'],event['rule'],event['state'],event['worker']))
+
+
+class Cluster(object):
+    '''
+        Values of a sensor, the workers keep their slots across snapshots
+    '''
+    def __init__(self):
+        self.index = WorkerIndex()
+        self.workers = None
+
+    def value(self,n_workers=0,cpu=None):
+        cpu = cpu or {}
+        info = dict((address,{'nthreads': 1,'memory_limit': 100,'metrics': {'cpu': value,'memory': 50}})
+                    for address,value in cpu.items())
+        self.workers = WorkerSnapshot.from_worker_info(info,self.index,self.workers)
+        return {'Workers': self.workers,'Cluster': {'n_workers': n_workers},'Memory': {'used_memory': 1.}}
+
+
+def test_parsing():
+    rule = Rule('hot: memory/memory_limit > 90% for 1m clear 5s cooldown 10m')
+    assert rule.name == 'hot'
+    assert rule.expression == 'memory/memory_limit > 90%'
+    assert (rule.duration,rule.clear,rule.cooldown) == (60,5,600)
+    assert rule.per_worker
+    assert rule.worker_names == {'memory','memory_limit'}
+
+    rule = Rule('idle: cpu < 5 while cluster.n_workers > 2 for 500ms')
+    assert rule.duration == 0.5
+    # the rule clears after as long as it had to hold, and notifies once a minute
+    assert (rule.clear,rule.cooldown) == (0.5,60)
+    assert rule.cluster_names == {'n_workers'}
+
+    rule = Rule('n_workers dropped by > 10%')
+    assert rule.name == 'n_workers dropped by > 10%'
+    assert not rule.per_worker
+    assert rule.dropped == {'n_workers'}
+
+
+@pytest.mark.parametrize('text',['broken:','cpu >','unknown > 1','cpu.real > 1','__import__("os") > 1',
+                                 'cpu dropped by > 1%','cpu > "a"'])
+def test_invalid_rules(text):
+    with pytest.raises(RuleError):
+        Rule(text)
+
+
+def test_cluster_rule_hysteresis():
+    sink = Sink()
+    engine = RuleEngine([Rule('big: n_workers > 2 for 10s clear 5s')],[sink])
+    cluster = Cluster()
+    alerts = lambda now,n: engine.evaluate('c',now,cluster.value(n))['cluster']
+
+    assert alerts(0,3) == []
+    # has to hold for 10s, a dip starts the duration over
+    assert alerts(5,1) == []
+    assert alerts(6,3) == []
+    assert alerts(15,3) == []
+    assert alerts(16,3) == ['big']
+    # keeps firing through a dip shorter than the clear duration
+    assert alerts(17,1) == ['big']
+    assert alerts(20,3) == ['big']
+    assert alerts(21,1) == ['big']
+    assert alerts(26,1) == []
+    assert sink.events == [(16,'big','firing',None),(26,'big','cleared',None)]
+
+
+def test_cooldown():
+    sink = Sink()
+    engine = RuleEngine([Rule('big: n_workers > 2 cooldown 30s')],[sink])
+    cluster = Cluster()
+    for now,n in ((0,3),(1,1),(2,3),(3,1),(40,3)):
+        engine.evaluate('c',now,cluster.value(n))
+    # firing again within the cooldown is not notified, and neither is its clearing
+    assert sink.events == [(0,'big','firing',None),(1,'big','cleared',None),(40,'big','firing',None)]
+
+
+def test_worker_rule():
+    sink = Sink()
+    engine = RuleEngine([Rule('hot: cpu > 90 for 2s')],[sink])
+    cluster = Cluster()
+    evaluate = lambda now,cpu: engine.evaluate('c',now,cluster.value(len(cpu),cpu))['workers']
+
+    assert evaluate(0,{'a': 95,'b': 10}) == {}
+    assert evaluate(2,{'a': 95,'b': 95}) == {'a': ['hot']}
+    assert evaluate(4,{'a': 95,'b': 95}) == {'a': ['hot'],'b': ['hot']}
+    # a worker taking over the slot of another one starts from scratch
+    assert evaluate(5,{'c': 95,'b': 95}) == {'b': ['hot']}
+    assert evaluate(7,{'c': 95,'b': 95}) == {'b': ['hot'],'c': ['hot']}
+    assert [event for event in sink.events if event[2] == 'firing'] == [(2,'hot','firing','a'),
+                                                                          (4,'hot','firing','b'),
+                                                                          (7,'hot','firing','c')]
+
+
+def test_dropped_by():
+    engine = RuleEngine([Rule('shrink: n_workers dropped by > 10%')])
+    cluster = Cluster()
+    alerts = lambda now,n: engine.evaluate('c',now,cluster.value(n))['cluster']
+    assert alerts(0,10) == []
+    assert alerts(1,9) == []
+    assert alerts(2,8) == ['shrink']
+    # compared to the largest value of the last minute only
+    assert alerts(100,8) == []
+
+
+def test_missing_cluster_metric_does_not_hold():
+    engine = RuleEngine([Rule('spilling: spilled_memory > 0')])
+    with np.errstate(invalid='raise'):
+        assert engine.evaluate('c',0,Cluster().value(1))['cluster'] == []
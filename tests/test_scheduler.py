@@ -0,0 +1,59 @@
+'''
+    Deadlines and adaptive intervals of the sensor updates
+'''
+
+from ptop.utils.scheduler import AdaptiveInterval, DeadlineScheduler
+
+
+def test_pop_due_in_deadline_order():
+    scheduler = DeadlineScheduler()
+    assert scheduler.next_deadline() is None
+    scheduler.schedule('b',2)
+    scheduler.schedule('a',1)
+    scheduler.schedule('c',2)
+    scheduler.schedule('d',5)
+    assert len(scheduler) == 4
+    assert scheduler.next_deadline() == 1
+    # equal deadlines keep the order they were scheduled in
+    assert scheduler.pop_due(2) == [(1,'a'),(2,'b'),(2,'c')]
+    assert scheduler.pop_due(4) == []
+    assert scheduler.next_deadline() == 5
+
+
+def test_following_skips_overrun_periods():
+    # the next deadline is computed from the previous one, not from the end of the update
+    assert DeadlineScheduler.following(0,1,0.5) == 1
+    # periods overrun are skipped rather than run in a burst
+    assert DeadlineScheduler.following(0,1,3.5) == 4
+    assert DeadlineScheduler.following(0,1,3) == 4
+    # an update done early still waits for a whole period
+    assert DeadlineScheduler.following(10,1,5) == 11
+
+
+def test_fixed_interval():
+    interval = AdaptiveInterval(2)
+    assert not interval.adaptive
+    assert interval.update(activity=0) == 2
+    assert interval.update(activity=1) == 2
+    assert interval.update(failed=True) == 2
+
+
+def test_adaptive_interval():
+    interval = AdaptiveInterval(1,min_interval=0.25,max_interval=4,backoff=2)
+    assert interval.adaptive
+    # idle values back off, up to the maximum
+    assert interval.update(activity=0) == 2
+    assert interval.update(activity=0) == 4
+    assert interval.update(activity=0) == 4
+    # values changing quickly tighten it, down to the minimum
+    assert interval.update(activity=1) == 2
+    assert interval.update(activity=1) == 1
+    assert interval.update(activity=1) == 0.5
+    assert interval.update(activity=1) == 0.25
+    # neither idle nor busy, or unknown, keeps the interval
+    assert interval.update(activity=0.03) == 0.25
+    assert interval.update() == 0.25
+    # a failure doubles it
+    assert interval.update(activity=1,failed=True) == 0.5
+    # and a slow source is not asked more often than it can answer
+    assert interval.update(activity=1,latency=0.75) == 1.5
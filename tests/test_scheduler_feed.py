@@ -0,0 +1,285 @@
+'''
+    Worker deltas published by the scheduler feed and applied by the sensor
+'''
+
+import copy
+
+import pytest
+
+from ptop.plugins import dask_sensor, scheduler_feed
+from ptop.plugins.dask_sensor import DaskSensor
+
+
+class FakeWorker(object):
+    def __init__(self,address,cpu=0.):
+        self.address = address
+        self.nthreads = 2
+        self.memory_limit = 1024**3
+        self.occupancy = 0.
+        self.processing = set()
+        self.metrics = {'cpu': cpu,'memory': 1024**2,'time': 0.}
+        self.last_seen = 0.
+
+    def identity(self):
+        return {'type': 'Worker','id': self.address,'nthreads': self.nthreads,'memory_limit': self.memory_limit,
+                'last_seen': self.last_seen,'metrics': dict(self.metrics)}
+
+
+class FakeScheduler(object):
+    '''
+        Scheduler delivering its events to the subscribed clients right away
+    '''
+    def __init__(self,addresses):
+        self.workers = dict((address,FakeWorker(address)) for address in addresses)
+        self.handlers = []
+        self.delivering = True
+
+    def log_event(self,topic,msg):
+        if self.delivering:
+            for handler in self.handlers:
+                handler((0.,msg))
+
+
+class FakeClient(object):
+    id = 'client-1'
+
+    def __init__(self,scheduler):
+        self.scheduler = scheduler
+        self.calls = []
+        self.errors = {} # name of a function -> exception it raises
+
+    def run_on_scheduler(self,function,*args):
+        self.calls.append(function.__name__)
+        if function.__name__ in self.errors:
+            raise self.errors[function.__name__]
+        # the result is sent over the network, nothing of the scheduler is shared
+        return copy.deepcopy(function(*args,dask_scheduler=self.scheduler))
+
+    def scheduler_info(self):
+        self.calls.append('scheduler_info')
+        return {'workers': dict((address,ws.identity()) for address,ws in self.scheduler.workers.items())}
+
+    def subscribe_topic(self,topic,handler):
+        assert topic == scheduler_feed.FEED_TOPIC
+        self.scheduler.handlers.append(handler)
+
+    def unsubscribe_topic(self,topic):
+        self.scheduler.handlers = []
+
+
+@pytest.fixture
+def cluster():
+    scheduler = FakeScheduler(['tcp://a:1','tcp://b:1'])
+    sensor = DaskSensor(dask_address='fake',subscribe=True,asynchronous=True,name='c',sensorType=None,interval=1)
+    sensor.client = FakeClient(scheduler)
+    sensor.subscribe()
+    assert sensor.subscribed
+    yield scheduler,sensor
+    sensor.unsubscribe()
+    assert getattr(scheduler,scheduler_feed._FEED_ATTRIBUTE) is None
+
+
+def _feed(scheduler):
+    return getattr(scheduler,scheduler_feed._FEED_ATTRIBUTE)
+
+
+def _workers(feed):
+    '''
+        Worker state a sensor following the feed has, the published state and load
+    '''
+    workers = copy.deepcopy(feed.published)
+    for address,(occupancy,processing) in feed.loads.items():
+        workers[address].update(occupancy=occupancy,processing=processing)
+    return workers
+
+
+def test_diff():
+    old = {'status': 'running','nthreads': 2,'metrics': {'cpu': 1.,'memory': 10}}
+    new = {'status': 'paused','nthreads': 2,'metrics': {'cpu': 1.,'memory': 20},'occupancy': 0.5}
+    assert scheduler_feed._diff(old,new) == {'status': 'paused','metrics': {'memory': 20},'occupancy': 0.5}
+    assert scheduler_feed._diff(new,new) == {}
+
+
+def test_worker_state_drops_volatile_fields():
+    worker = FakeWorker('tcp://a:1')
+    worker.processing = {'x','y'}
+    worker.occupancy = 1.23456
+    state = scheduler_feed._worker_state(worker)
+    assert 'last_seen' not in state
+    assert 'time' not in state['metrics']
+    # the load moves on every task, it is published on its own
+    assert 'occupancy' not in state
+    assert scheduler_feed._load(worker) == (1.235,2)
+
+
+def test_deltas_are_applied(cluster):
+    scheduler,sensor = cluster
+    feed = _feed(scheduler)
+    assert sensor.worker_info == _workers(feed)
+
+    scheduler.workers['tcp://a:1'].metrics['cpu'] = 50.
+    # a heartbeat alone is not published
+    scheduler.workers['tcp://b:1'].metrics['time'] = 1.
+    published = []
+    scheduler.handlers.append(lambda event: published.append(event[1]))
+    feed.publish()
+    assert published[0]['updated'] == {'tcp://a:1': {'metrics': {'cpu': 50.}}}
+    assert published[0]['seq'] == 1
+
+    del scheduler.workers['tcp://b:1']
+    scheduler.workers['tcp://c:1'] = FakeWorker('tcp://c:1',cpu=7.)
+    feed.publish()
+    assert published[1]['removed'] == ['tcp://b:1']
+    # nothing changed, nothing published
+    feed.publish()
+    assert len(published) == 2
+
+    sensor.update()
+    assert sensor.worker_info == _workers(feed)
+    assert sensor.workers.addresses == ['tcp://a:1','tcp://c:1']
+    assert sensor.workers.column('cpu').tolist() == [50.,7.]
+
+
+def test_resync_after_a_gap(cluster):
+    scheduler,sensor = cluster
+    feed = _feed(scheduler)
+    scheduler.workers['tcp://a:1'].metrics['cpu'] = 10.
+    feed.publish()
+    # a delta is lost on the way
+    scheduler.delivering = False
+    scheduler.workers['tcp://a:1'].metrics['cpu'] = 20.
+    scheduler.workers['tcp://a:1'].memory_limit = 2*1024**3
+    feed.publish()
+    scheduler.delivering = True
+    scheduler.workers['tcp://a:1'].metrics['cpu'] = 30.
+    feed.publish()
+
+    sensor.update()
+    # the gap is noticed and the sensor starts over from a full snapshot
+    assert sensor._feed_seq == feed.seq == 3
+    assert sensor.worker_info == _workers(feed)
+    assert sensor.workers.column('memory_limit').tolist() == [2*1024**3,1024**3]
+
+    scheduler.workers['tcp://b:1'].metrics['cpu'] = 40.
+    feed.publish()
+    sensor.update()
+    assert sensor._feed_seq == 4
+    assert sensor.workers.column('cpu').tolist() == [30.,40.]
+
+
+def test_load_is_published_once_it_moved(cluster):
+    scheduler,sensor = cluster
+    feed = _feed(scheduler)
+    published = []
+    scheduler.handlers.append(lambda event: published.append(event[1]))
+    worker = scheduler.workers['tcp://a:1']
+
+    # under the floor of the occupancy, only the summary is published
+    worker.occupancy = 0.05
+    feed.publish()
+    assert (published[-1]['updated'],published[-1]['load']) == ({},{})
+    assert published[-1]['load_summary']['totals']['load'] == 0.025
+    worker.occupancy = 10.
+    worker.processing = {'x'}
+    feed.publish()
+    assert published[-1]['load'] == {'tcp://a:1': (10.,1)}
+    # less than LOAD_CHANGE of the published load
+    worker.occupancy = 10.5
+    feed.publish()
+    assert published[-1]['load'] == {}
+    worker.occupancy = 11.2
+    feed.publish()
+    assert published[-1]['load'] == {'tcp://a:1': (11.2,1)}
+
+    sensor.update()
+    assert sensor.workers.column('occupancy').tolist() == [11.2,0]
+    assert sensor.workers.column('processing').tolist() == [1,0]
+    # the statistics come from the summary of the scheduler, one worker holds all the load
+    assert sensor.currentValue['Imbalance']['load_cv'] == 1
+    assert sensor.currentValue['Imbalance']['processing_cv'] == 1
+
+
+def test_deltas_of_another_feed(cluster):
+    scheduler,sensor = cluster
+    scheduler_feed.unsubscribe(sensor.client.id,dask_scheduler=scheduler)
+    # the feed was restarted by somebody else, its deltas do not follow the snapshot of the sensor
+    scheduler_feed.subscribe('client-2',1,dask_scheduler=scheduler)
+    scheduler.workers['tcp://a:1'].metrics['cpu'] = 60.
+    _feed(scheduler).publish()
+    sensor.update()
+    assert sensor._feed_id == _feed(scheduler).id
+    assert sensor.workers.column('cpu').tolist() == [60.,0.]
+    scheduler_feed.unsubscribe('client-2',dask_scheduler=scheduler)
+
+
+def test_subscriptions_expire(cluster,monkeypatch):
+    scheduler,sensor = cluster
+    now = [1000.]
+    monkeypatch.setattr(scheduler_feed,'time',lambda: now[0])
+    scheduler_feed.subscribe('client-2',1,ttl=10,dask_scheduler=scheduler)
+    feed = _feed(scheduler)
+
+    now[0] += 8
+    assert scheduler_feed.renew('client-2',10,dask_scheduler=scheduler)
+    scheduler_feed.unsubscribe(sensor.client.id,dask_scheduler=scheduler)
+    now[0] += 9
+    feed.publish()
+    assert feed.callback.is_running()
+    # nobody renewed the subscription in time, the feed stops on its own
+    now[0] += 2
+    feed.publish()
+    assert not feed.callback.is_running()
+    assert _feed(scheduler) is None
+    assert not scheduler_feed.renew('client-2',10,dask_scheduler=scheduler)
+
+
+def test_load_is_only_polled_while_tracked():
+    scheduler = FakeScheduler(['tcp://a:1','tcp://b:1'])
+    scheduler.workers['tcp://a:1'].occupancy = 4.
+    sensor = DaskSensor(dask_address='fake',asynchronous=True,name='c',sensorType=None,interval=1)
+    sensor.client = FakeClient(scheduler)
+    sensor.update()
+    assert sensor.client.calls == ['scheduler_info','worker_load']
+    assert sensor.workers.column('load').tolist() == [2.,0.]
+    assert sensor.currentValue['Imbalance']['load_cv'] == 1
+
+    # nobody looks at the workers, the load is not asked and the imbalance is unknown
+    sensor.track_workers = False
+    sensor.client.calls = []
+    sensor.update()
+    assert sensor.client.calls == ['scheduler_info']
+    assert sensor.currentValue['Imbalance'] == {}
+
+
+def test_load_is_asked_again_after_a_failure(monkeypatch):
+    now = [100.]
+    monkeypatch.setattr(dask_sensor,'time',lambda: now[0])
+    sensor = DaskSensor(dask_address='fake',asynchronous=True,name='c',sensorType=None,interval=1)
+    sensor.client = FakeClient(FakeScheduler(['tcp://a:1']))
+
+    def polled(seconds):
+        now[0] += seconds
+        sensor.client.calls = []
+        sensor.update()
+        return 'worker_load' in sensor.client.calls
+
+    sensor.client.errors['worker_load'] = OSError('timed out')
+    assert polled(0)
+    assert sensor.currentValue['Imbalance'] == {}
+    # the scheduler is left alone for a while, longer after every failure in a row
+    assert not polled(4)
+    assert polled(1)
+    assert not polled(9)
+    assert polled(1)
+    del sensor.client.errors['worker_load']
+    assert not polled(19)
+    assert polled(1)
+    assert sensor.currentValue['Imbalance']['n_stragglers'] == 0
+    # a success starts the backoff over
+    sensor.client.errors['worker_load'] = OSError('timed out')
+    assert polled(1)
+    assert polled(dask_sensor.LOAD_RETRY)
+    # a scheduler that cannot run worker_load at all is no longer asked
+    sensor.client.errors['worker_load'] = AttributeError('occupancy')
+    assert polled(2*dask_sensor.LOAD_RETRY)
+    assert not polled(dask_sensor.LOAD_RETRY_MAX)
@@ -0,0 +1,79 @@
+'''
+    Columnar snapshots of the workers
+'''
+
+import numpy as np
+
+from ptop.core.snapshot import MB, WorkerIndex, WorkerSnapshot
+
+
+def _info(memory=0,spilled=0,nthreads=2,**metrics):
+    metrics.update(memory=memory,cpu=metrics.get('cpu',0),spilled_bytes={'memory':0,'disk':spilled})
+    return {'nthreads':nthreads,'memory_limit':4*1024*MB,'metrics':metrics}
+
+
+def test_columns():
+    snapshot = WorkerSnapshot.from_worker_info({
+        'a':_info(memory=100*MB,cpu=50,managed_bytes=30*MB,host_net_io={'read_bps':10,'write_bps':20}),
+        # older workers send the network throughput as read_bytes and write_bytes
+        'b':_info(memory=10*MB,read_bytes=1,write_bytes=2,executing=3),
+    },WorkerIndex())
+    assert len(snapshot) == 2
+    assert snapshot.column('read').tolist() == [10,1]
+    assert snapshot.column('write').tolist() == [20,2]
+    assert snapshot.column('executing').tolist() == [0,3]
+    assert snapshot.column('unmanaged').tolist() == [70*MB,10*MB]
+    record = snapshot[0]
+    assert record['address'] == 'a'
+    # bytes are shown in MB
+    assert record['memory'] == 100
+    assert record['nthreads'] == 2
+    assert record.get('missing') is None
+    assert snapshot[-1].address == 'b'
+    assert snapshot.sum('cpu') == 50
+    assert snapshot.mean('cpu') == 25
+
+
+def test_layout_and_index():
+    index = WorkerIndex()
+    first = WorkerSnapshot.from_worker_info({'a':_info(),'b':_info()},index)
+    # the same workers in the same order keep the layout
+    same = WorkerSnapshot.from_worker_info({'a':_info(),'b':_info()},index,first)
+    assert same.layout == first.layout
+    assert same.index is first.index
+    # a worker leaving changes the layout, and its index goes to the next worker to join
+    left = WorkerSnapshot.from_worker_info({'b':_info()},index,same)
+    assert left.layout == first.layout+1
+    assert left.index.tolist() == [1]
+    joined = WorkerSnapshot.from_worker_info({'b':_info(),'c':_info()},index,left)
+    assert joined.index.tolist() == [1,0]
+
+
+def test_measure_rates():
+    index = WorkerIndex()
+    previous = WorkerSnapshot.from_worker_info({'a':_info(spilled=100),'b':_info(spilled=100)},index)
+    snapshot = WorkerSnapshot.from_worker_info({'a':_info(spilled=300),'b':_info(spilled=0)},index,previous)
+    snapshot.measure_rates(previous,2)
+    assert snapshot.column('spill_rate').tolist() == [100,0]
+    assert snapshot.column('unspill_rate').tolist() == [0,50]
+
+
+def test_measure_rates_of_new_workers():
+    index = WorkerIndex()
+    previous = WorkerSnapshot.from_worker_info({'a':_info(spilled=100)},index)
+    # the rows moved and a worker joined, which has no rate yet
+    snapshot = WorkerSnapshot.from_worker_info({'c':_info(spilled=500),'a':_info(spilled=200)},index,previous)
+    snapshot.measure_rates(previous,1)
+    assert snapshot.column('spill_rate').tolist() == [0,100]
+    # no time elapsed, the rates are left alone
+    again = WorkerSnapshot.from_worker_info({'c':_info(spilled=900),'a':_info(spilled=900)},index,snapshot)
+    again.measure_rates(snapshot,0)
+    assert again.column('spill_rate').tolist() == [0,0]
+
+
+def test_argsort_keeps_ties_in_order():
+    snapshot = WorkerSnapshot.from_worker_info(
+        dict((address,_info(cpu=cpu)) for address,cpu in zip('abcd',(5,1,5,3))),WorkerIndex())
+    assert snapshot.argsort('cpu').tolist() == [1,3,0,2]
+    assert snapshot.argsort('cpu',reverse=True).tolist() == [0,2,3,1]
+    assert np.array_equal(WorkerSnapshot.empty().column('cpu'),np.zeros(0))
@@ -0,0 +1,43 @@
+'''
+    Rolling counters over the task stream
+'''
+
+import pytest
+
+from ptop.statistics.task_activity import TaskActivity
+
+
+def _task(prefix,compute=0,transfer=0,nbytes=0):
+    return (prefix,0,compute,transfer,nbytes)
+
+
+def test_summary():
+    activity = TaskActivity(window=10)
+    activity.add(0,[_task('inc',1,0.5,100),_task('inc',3,0.5,300),_task('sum',2)])
+    # the rates are over one bucket until a whole window went by
+    assert activity.summary() == [('inc',2,2,0.5,400),('sum',1,2,0,0)]
+
+
+def test_buckets_leave_the_window():
+    activity = TaskActivity(window=10)
+    activity.add(0,[_task('inc')])
+    activity.add(5,[_task('sum'),_task('sum')])
+    activity.add(10.5,[])
+    assert [row[0] for row in activity.summary()] == ['sum','inc']
+    # the first bucket is subtracted once it is a whole window old
+    activity.add(11,[])
+    assert activity.summary() == [('sum',pytest.approx(0.2),0,0,0)]
+    assert activity.summary(now=16) == []
+
+
+def test_missed_and_clear():
+    activity = TaskActivity()
+    activity.add(0,[_task('inc')],missed=3)
+    activity.add(1,[],missed=2)
+    assert activity.missed == 5
+    activity.clear()
+    assert activity.missed == 0
+    assert activity.summary() == []
+    # the span starts again from the next add
+    activity.add(100,[_task('inc')])
+    assert activity.summary() == [('inc',1,0,0,0)]
@@ -0,0 +1,95 @@
+'''
+    Ring buffers and the history of a sensor
+'''
+
+import numpy as np
+
+from ptop.core import WorkerIndex, WorkerSnapshot
+from ptop.statistics import RingBuffer, TimeSeriesStore
+
+
+def _workers(addresses,index,previous=None,cpu=0.):
+    info = dict((address,{'nthreads': 1,'memory_limit': 100,'metrics': {'cpu': cpu,'memory': 10}})
+                for address in addresses)
+    return WorkerSnapshot.from_worker_info(info,index,previous)
+
+
+def test_window_before_wraparound():
+    ring = RingBuffer(4,2)
+    assert ring.latest() is None
+    assert ring.window().shape == (0,2)
+    ring.append([1,10])
+    ring.append([2,20])
+    assert ring.count == 2
+    assert ring.window().tolist() == [[1,10],[2,20]]
+    assert ring.window(1).tolist() == [[2,20]]
+    assert ring.latest().tolist() == [2,20]
+
+
+def test_window_after_wraparound():
+    ring = RingBuffer(3)
+    for value in range(7):
+        ring.append(value)
+    assert ring.count == 3
+    # the latest rows are contiguous, oldest first, and are a view on the buffer
+    window = ring.window()
+    assert window[:,0].tolist() == [4,5,6]
+    assert window.base is not None
+    assert ring.window(10)[:,0].tolist() == [4,5,6]
+    assert ring.window(2)[:,0].tolist() == [5,6]
+    assert ring.latest()[0] == 6
+
+
+def test_grow_keeps_the_rows():
+    ring = RingBuffer(3,1)
+    for value in range(5):
+        ring.append([value])
+    ring.grow(3)
+    assert ring.width == 3
+    window = ring.window()
+    assert window[:,0].tolist() == [2,3,4]
+    assert np.isnan(window[:,1:]).all()
+    ring.append([5,50,500])
+    assert ring.window()[:,0].tolist() == [3,4,5]
+    assert ring.latest().tolist() == [5,50,500]
+
+
+def test_store_wraparound():
+    store = TimeSeriesStore(capacity=4,workers=2)
+    index = WorkerIndex()
+    workers = None
+    for sample in range(6):
+        workers = _workers(['a','b'],index,workers,cpu=sample)
+        store.record(float(sample),{'CPU': {'cpu_usage': sample*10.},'Workers': workers})
+    assert len(store) == 4
+    assert store.samples == 6
+    assert store.timestamps().tolist() == [2.,3.,4.,5.]
+    assert store.series('cpu_usage').tolist() == [20.,30.,40.,50.]
+    assert store.worker_series('cpu','a',2).tolist() == [4.,5.]
+    # a metric missing from the values is nan
+    assert np.isnan(store.series('n_workers')).all()
+
+
+def test_store_worker_columns():
+    store = TimeSeriesStore(capacity=3,workers=1)
+    index = WorkerIndex()
+    workers = _workers(['a'],index)
+    store.record(0.,{'Workers': workers})
+    # a new worker grows the columns, its samples before it joined are nan
+    workers = _workers(['a','b','c'],index,workers,cpu=5.)
+    store.record(1.,{'Workers': workers})
+    assert store.workers['cpu'].width >= 3
+    series = store.worker_series('cpu','c')
+    assert np.isnan(series[0]) and series[1] == 5.
+
+    # the column of a worker which left is only reused once its history went out of the buffer
+    workers = _workers(['a','b'],index,workers)
+    store.record(2.,{'Workers': workers})
+    workers = _workers(['a','b','d'],index,workers)
+    store.record(3.,{'Workers': workers})
+    assert store._worker_columns['d'] != 2
+    store.record(4.,{'Workers': workers})
+    workers = _workers(['a','b','d','e'],index,workers)
+    store.record(5.,{'Workers': workers})
+    assert store._worker_columns['e'] == 2
+    assert np.isnan(store.worker_series('cpu','e')[:-1]).all()